@@ -6,6 +6,17 @@ from decimal import Decimal
 from mm.book import BipolarContainer
 
 
+class RateLimitConfig:
+    def __init__(self, dict):
+        # requests per second
+        self.rate = float(dict.get('rate', 10))
+        self.burst = float(dict.get('burst', 20))
+        self.min_rate = float(dict.get('min_rate', 1))
+        self.backoff = float(dict.get('backoff', 0.5))
+        self.recovery_time = float(dict.get('recovery_time', 10))
+        self.recovery_step = float(dict.get('recovery_step', 0.1))
+
+
 class VenueConfig:
     def __init__(self, dict):
         self.url = dict['url']
@@ -16,12 +27,18 @@ class VenueConfig:
         self.min_order_size = Decimal(dict['min_order_size'])
         self.start_pos = Decimal(dict['start_pos'])
         self.start_balance = Decimal(dict['start_balance'])
+        self.fixed_point = dict.get('fixed_point', False)
+        self.rate_limit = RateLimitConfig(dict.get('rate_limit', {}))
 
 
 class LoggingConfig:
     def __init__(self, dict):
         self.dir = dict['dir']
         self.level = dict['level']
+        self.record = dict.get('record', False)
+        self.journal = dict.get('journal', None)
+        self.checkpoint = dict.get('checkpoint', None)
+        self.checkpoint_interval = float(dict.get('checkpoint_interval', 5))
 
 
 class ClientConfig:
@@ -30,6 +47,18 @@ class ClientConfig:
         self.port = dict['port']
 
 
+class BookConfig:
+    SUBSCRIBE_DEPTH = 20
+
+    def __init__(self, dict):
+        self.impl = dict.get('impl', 'linked')
+        # levels per side, both subscribed to and kept; without it the book keeps every level it's sent,
+        # as it always did, and the subscription asks for SUBSCRIBE_DEPTH
+        depth = dict.get('depth')
+        self.depth = None if depth is None else int(depth)
+        self.subscribe_depth = BookConfig.SUBSCRIBE_DEPTH if self.depth is None else self.depth
+
+
 class AssetConfig:
     def __init__(self, dict):
         self.currency = dict['currency']
@@ -54,6 +83,7 @@ class AppConfig:
     logging: LoggingConfig = None
     client: ClientConfig = None
     asset: AssetConfig = None
+    book: BookConfig = None
     algo: MarketmakerConfig = None
     accounts: dict = None
 
@@ -62,6 +92,7 @@ class AppConfig:
         self.logging = LoggingConfig(dict['logging'])
         self.client = ClientConfig(dict['client'])
         self.asset = AssetConfig(dict['asset'])
+        self.book = BookConfig(dict.get('book', {}))
         algo_config_str: str = dict['algo']['config_class']
         split = algo_config_str.split(".")
 
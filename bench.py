@@ -0,0 +1,341 @@
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+from mm.app_config import AppConfig
+from mm.book import create_book, Level, BipolarContainer
+from mm.cex_serialization import serialize_request, deserialize_order_event, sim_ack
+from mm.client_serialization import serialize_book, serialize_pnl, _serialize_book, _serialize_pnl
+from mm.engine import Engine
+from mm.marketmaker import Marketmaker
+from mm.new_approach import enter_hedge
+from mm.event_hub import ImportantEvent
+from mm.orders import NewReq, CancelReq, Order, Ack, Exec
+from posmath.side import Side
+
+BENCH_CONFIG = {
+    "venue": {"url": "ws://localhost:8765", "key": "key", "secret": "secret", "taker_comission_percent": "0.16",
+              "tick_size": "0.0001", "min_order_size": "0.01", "start_pos": "0", "start_balance": "0"},
+    "logging": {"dir": ".", "level": "INFO"},
+    "client": {"enabled": False, "port": 8999},
+    "asset": {"currency": "USD", "crypto": "BTC"},
+    "algo": {"config_class": "mm.new_approach.HedgeConfig", "max_pos": "0.1",
+             "liq_behind": {"BID": "0.5", "ASK": "0.5"}, "order_size": {"BID": "0.02", "ASK": "0.02"},
+             "ema_work_perc": "0.1", "hedge_perc": "0.01", "refresh_timeout": "0",
+             "price_tolerance": "0.0005", "min_levels": "3"},
+    "accounts": {}
+}
+
+BOOK_DEPTHS = [10, 100, 500]
+MID = 1000
+
+
+def bench_config(impl='linked', fixed_point=False):
+    config = json.loads(json.dumps(BENCH_CONFIG))
+    config['book'] = {'impl': impl}
+    config['venue']['fixed_point'] = fixed_point
+    return AppConfig(config)
+
+
+def level_price(side, i):
+    return Decimal(MID - Side.sign(side) * (1 + i)) / 10
+
+
+def filled_book(impl, depth):
+    book = create_book(impl)
+    for side in Side.sides:
+        for i in range(0, depth):
+            book.increment_level(side, level_price(side, i), Decimal('0.5'))
+    return book
+
+
+def md_burst(count, depth, seed=1):
+    rnd = random.Random(seed)
+    frames = []
+    for snap_id in range(1, count + 1):
+        def side_update(side):
+            return [[float(level_price(side, rnd.randrange(0, depth))), rnd.choice([0, 0.01, 0.25, 1.5])]
+                    for j in range(0, rnd.randrange(1, 4))]
+        frames.append({'e': 'md_update',
+                       'data': {'id': snap_id, 'pair': 'BTC:USD', 'bids': side_update(Side.BID),
+                                'asks': side_update(Side.ASK)}})
+    return frames
+
+
+def ready_engine(impl='linked', fixed_point=False, depth=20):
+    engine = Engine(Marketmaker, bench_config(impl, fixed_point))
+    for frame in md_burst(1, depth):
+        frame['data']['bids'] = [[float(level_price(Side.BID, i)), 0.5] for i in range(0, depth)]
+        frame['data']['asks'] = [[float(level_price(Side.ASK, i)), 0.5] for i in range(0, depth)]
+        engine.on_md(frame)
+    engine.rm.set_normal()
+    engine.algo.hedge_step()
+    ack_requests(engine)
+    return engine
+
+
+def ack_requests(engine):
+    q = engine.order_manager.request_queue
+    while len(q) > 0:
+        parsed = json.loads(sim_ack(q.pop(0)))
+        engine.order_event(deserialize_order_event(parsed['e'], parsed))
+
+
+def book_benchmarks():
+    for impl in ['linked', 'sorted']:
+        for depth in BOOK_DEPTHS:
+            def resize_level(impl=impl, depth=depth):
+                book = filled_book(impl, depth)
+                rnd = random.Random(depth)
+                levels = [(side, level_price(side, rnd.randrange(0, depth)), Decimal(rnd.randrange(1, 100)) / 100)
+                          for side in Side.sides for i in range(0, 500)]
+
+                def run():
+                    for side, price, size in levels:
+                        book.increment_level(side, price, size)
+                return run, len(levels)
+
+            def delete_level(impl=impl, depth=depth):
+                book = filled_book(impl, depth)
+                rnd = random.Random(depth)
+                levels = [(side, level_price(side, rnd.randrange(0, depth))) for side in Side.sides for i in range(0, 250)]
+
+                def run():
+                    for side, price in levels:
+                        book.increment_level(side, price, Decimal('0'))
+                        book.increment_level(side, price, Decimal('0.5'))
+                return run, 2 * len(levels)
+
+            def resize_and_query(impl=impl, depth=depth):
+                book = filled_book(impl, depth)
+                rnd = random.Random(depth)
+                levels = [(side, level_price(side, rnd.randrange(0, depth)), Decimal(rnd.randrange(1, 100)) / 100)
+                          for side in Side.sides for i in range(0, 500)]
+                liq = Decimal(depth) / 4
+
+                def run():
+                    # a strategy tick asks for the price at a depth after every change
+                    for side, price, size in levels:
+                        book.increment_level(side, price, size)
+                        book.depth_at(side, book.depth_index(side, liq))
+                return run, len(levels)
+
+            yield 'book.%s.increment_level.depth%d' % (impl, depth), resize_level
+            yield 'book.%s.resize_and_query.depth%d' % (impl, depth), resize_and_query
+            yield 'book.%s.delete_level.depth%d' % (impl, depth), delete_level
+
+
+def engine_benchmarks():
+    for impl in ['linked', 'sorted']:
+        for fixed_point in [False, True]:
+            def on_md(impl=impl, fixed_point=fixed_point):
+                engine = ready_engine(impl, fixed_point)
+                engine.rm.set_cancel_all()
+                frames = md_burst(1000, 20)
+
+                def run():
+                    # fresh ids every run, the sequencer drops the ones it has seen as stale
+                    for frame in frames:
+                        frame['data']['id'] = engine.sequencer.last + 1
+                        engine.on_md(frame)
+                    engine.order_manager.request_queue.clear()
+                return run, len(frames)
+
+            yield 'engine.%s%s.on_md' % (impl, '.fixed' if fixed_point else ''), on_md
+
+
+def strategy_benchmarks():
+    for impl in ['linked', 'sorted']:
+        def hedge(impl=impl):
+            engine = ready_engine(impl)
+
+            def run():
+                for side in Side.sides:
+                    enter_hedge(engine.pnl, engine.book, side, engine.algo.config, engine.algo.venue_config)
+            return run, 2
+
+        def hedge_step(impl=impl, memo_hit=False):
+            engine = ready_engine(impl)
+
+            def run():
+                if not memo_hit:
+                    # as if md came in without moving a level, the hedges are computed again
+                    engine.book.version += 1
+                engine.algo.hedge_step()
+                ack_requests(engine)
+            return run, 1
+
+        yield 'strategy.%s.enter_hedge' % impl, hedge
+        yield 'strategy.%s.hedge_step' % impl, hedge_step
+        yield 'strategy.%s.hedge_step.memo_hit' % impl, lambda impl=impl: hedge_step(impl, True)
+
+
+def serialization_benchmarks():
+    def book(serialize=_serialize_book):
+        engine = ready_engine()
+        return lambda: serialize(engine.book), 1
+
+    def pnl(serialize=_serialize_pnl):
+        engine = ready_engine()
+        for frame in md_burst(2000, 20):
+            engine.on_md(frame)
+        engine.order_manager.request_queue.clear()
+        return lambda: serialize(engine.pnl), 1
+
+    def request():
+        req = NewReq(Side.BID, Decimal('999.1234'), Decimal('0.02'))
+        return lambda: serialize_request(req), 1
+
+    def order_event():
+        parsed = json.loads(sim_ack(NewReq(Side.BID, Decimal('999.1234'), Decimal('0.02'))))
+        return lambda: deserialize_order_event(parsed['e'], parsed), 1
+
+    yield 'serialize.book', book
+    yield 'serialize.book.memo_hit', lambda: book(serialize_book)
+    yield 'serialize.pnl', pnl
+    yield 'serialize.pnl.memo_hit', lambda: pnl(serialize_pnl)
+    yield 'serialize.request', request
+    yield 'deserialize.order_event', order_event
+
+
+HOT_OBJECTS = {
+    'Level': lambda: Level(Side.BID, Decimal('999.1234'), Decimal('0.5')),
+    'Order': lambda: Order(Side.BID, Decimal('999.1234'), Decimal('0.02')),
+    'NewReq': lambda: NewReq(Side.BID, Decimal('999.1234'), Decimal('0.02')),
+    'CancelReq': lambda: CancelReq(Side.BID, '1'),
+    'Ack': lambda: Ack('oid', '1', Decimal('0.02'), Decimal('0.02')),
+    'Exec': lambda: Exec(Decimal('0'), '1'),
+    'ImportantEvent': lambda: ImportantEvent(ImportantEvent.GAP, 1),
+    'BipolarContainer': lambda: BipolarContainer(0, 0),
+}
+
+
+def object_benchmarks():
+    for name, create in HOT_OBJECTS.items():
+        def allocate(create=create):
+            def run():
+                for i in range(0, 100):
+                    create()
+            return run, 100
+        yield 'objects.%s' % name, allocate
+
+    def session():
+        engine = ready_engine()
+        frames = md_burst(200, 20, seed=2)
+
+        def run():
+            for frame in frames:
+                engine.on_md(frame)
+                ack_requests(engine)
+        return run, len(frames)
+    yield 'session.replay', session
+
+
+def instance_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def memory_report():
+    # bytes per instance, and what a replayed session allocates at peak and keeps afterwards
+    report = {'size.' + name: instance_size(create()) for name, create in HOT_OBJECTS.items()}
+    frames = md_burst(2000, 20, seed=2)
+    tracemalloc.start()
+    engine = ready_engine('linked', depth=500)
+    for frame in frames:
+        engine.on_md(frame)
+        ack_requests(engine)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report['session.retained_bytes'] = current
+    report['session.peak_bytes'] = peak
+    return report
+
+
+def all_benchmarks():
+    for group in [book_benchmarks, engine_benchmarks, strategy_benchmarks, serialization_benchmarks,
+                  object_benchmarks]:
+        for name, setup in group():
+            yield name, setup
+
+
+def measure(setup, min_time, repeat):
+    run, ops = setup()
+    run()
+    number = 1
+    while True:
+        start = time.perf_counter_ns()
+        for i in range(0, number):
+            run()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        number *= 2
+
+    samples = [elapsed / (number * ops)]
+    for i in range(1, repeat):
+        start = time.perf_counter_ns()
+        for j in range(0, number):
+            run()
+        samples.append((time.perf_counter_ns() - start) / (number * ops))
+    return {'ns_per_op': min(samples), 'median_ns_per_op': statistics.median(samples), 'ops': number * ops}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['ns_per_op'] / baseline[name]['ns_per_op']
+        status = 'REGRESSION' if ratio > 1 + threshold else 'ok'
+        print('%-45s %12.0f %12.0f %7.2fx %s' % (name, baseline[name]['ns_per_op'], result['ns_per_op'], ratio, status))
+        if status != 'ok':
+            regressions.append(name)
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Hot path benchmarks')
+    parser.add_argument('--filter', default='', help='run only benchmarks whose name contains this')
+    parser.add_argument('--output', default='bench_output.json', help='where to write results')
+    parser.add_argument('--compare', help='baseline results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before flagging, 0.2 = 20%%')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per sample')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--memory', action='store_true', help='also report per-object and session memory')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, setup in all_benchmarks():
+        if args.filter in name:
+            results[name] = measure(setup, args.min_time, args.repeat)
+            print('%-45s %12.0f ns/op' % (name, results[name]['ns_per_op']))
+
+    output = {'python': sys.version, 'time': int(time.time()), 'results': results}
+    if args.memory:
+        output['memory'] = memory_report()
+        for name, size in output['memory'].items():
+            print('%-45s %12d bytes' % (name, size))
+
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=1, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if len(regressions) > 0:
+            print('regressions: ' + ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
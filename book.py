@@ -1,10 +1,15 @@
+from bisect import bisect_left, bisect_right
 from functools import reduce
+from itertools import accumulate
 
 from mm.event_hub import ImportantEvent
+from mm.units import DECIMAL
 from posmath.side import Side
 
 
 class BipolarContainer:
+    __slots__ = ('container',)
+
     def __init__(self, bid=None, ask=None):
         self.container = {Side.BID: bid, Side.ASK: ask}
 
@@ -25,6 +30,8 @@ class BipolarContainer:
 
 
 class Level:
+    __slots__ = ('side', 'price', 'size', 'next_level')
+
     def __init__(self, side, price, size):
         Side.check_fail(side)
         self.side = side
@@ -59,7 +66,6 @@ class Level:
             while tmp is not None:
                 yield tmp
                 tmp = tmp.next_level
-            raise StopIteration
 
         return level_iter()
 
@@ -92,14 +98,125 @@ class Level:
             return 1+self.next_level.levels()
 
 
+class DepthTree:
+    # Fenwick tree over level sizes by position in the ladder: a size change and a cumulative depth query
+    # cost O(log n). Levels coming or going shift the positions, the tree is built again for those.
+    __slots__ = ('tree',)
+
+    def __init__(self, sizes):
+        tree = [0] + sizes
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, pos, delta):
+        tree = self.tree
+        i = pos + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, pos):
+        # liquidity of levels 0..pos
+        tree = self.tree
+        liq = 0
+        i = pos + 1
+        while i > 0:
+            liq += tree[i]
+            i -= i & -i
+        return liq
+
+    def search(self, liq):
+        # first position whose cumulative depth reaches liq, len(self) if none does
+        tree = self.tree
+        pos = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step > 0:
+            if pos + step < len(tree) and tree[pos + step] < liq:
+                pos += step
+                liq -= tree[pos]
+            step >>= 1
+        return pos
+
+
 class Book:
-    def __init__(self):
+    def __init__(self, units=DECIMAL, max_depth=None):
+        self.units = units
+        self.max_depth = max_depth
+        self.evicted = 0
+        # bumped on every change, lets consumers skip work when the book hasn't moved
+        self.version = 0
+        # (side, price) of levels changed since a consumer last took them, kept only once someone sets it to a set
+        self.changed = None
         self.book = BipolarContainer()
         self.quote_subscribers = []
+        self.volumes = BipolarContainer(0, 0)
+        self.level_counts = BipolarContainer(0, 0)
+        self.depths = BipolarContainer([], [])
+        self.depths_stale = BipolarContainer(False, False)
 
     def quote(self, side):
         return self.book.side(side)
 
+    def volume(self, side):
+        return self.volumes.side(side)
+
+    def levels(self, side):
+        return self.level_counts.side(side)
+
+    def cumulative_depth(self, side):
+        # rebuilt in O(depth) on the first query after a change, as finding a level here already walks the side
+        if self.depths_stale.side(side):
+            self.depths.set_side(side, list(accumulate(level.size for level in self.quote(side) or [])))
+            self.depths_stale.set_side(side, False)
+        return self.depths.side(side)
+
+    def depth_at(self, side, index):
+        return self.cumulative_depth(side)[index]
+
+    def depth_index(self, side, liq):
+        depth = self.cumulative_depth(side)
+        if len(depth) == 0:
+            return None
+        return min(bisect_left(depth, liq), len(depth) - 1)
+
+    def depth_level(self, side, liq):
+        index = self.depth_index(side, liq)
+        return None if index is None else self.nth_level(side, index)
+
+    def nth_level(self, side, n):
+        for i, level in enumerate(self.quote(side) or []):
+            if i == n:
+                return level
+        raise IndexError
+
+    def level(self, side, price):
+        for level in self.quote(side) or []:
+            if level.price == price:
+                return level
+        return None
+
+    def worse_level(self, side, price):
+        sign = Side.sign(side)
+        for level in self.quote(side) or []:
+            if sign * level.price < sign * price:
+                return level
+        return None
+
+    def level_changed(self, level, size_delta, count_delta, pos=None):
+        side = level.side
+        self.version += 1
+        if self.changed is not None:
+            self.changed.add((side, level.price))
+        self.volumes.set_side(side, self.volumes.side(side) + size_delta)
+        self.level_counts.set_side(side, self.level_counts.side(side) + count_delta)
+        self.depths_stale.set_side(side, True)
+
     def increment_level(self, side, price, size):
         def find_level(q):
             if q is None:
@@ -116,9 +233,23 @@ class Book:
             self.delete_level(level)
         elif level is None:
             self.add_level(side, price, size)
+            self.evict(side)
         else:
+            self.level_changed(level, size - level.size, 0)
             level.size = size
 
+    def worst_level(self, side):
+        level = self.quote(side)
+        while level is not None and level.next_level is not None:
+            level = level.next_level
+        return level
+
+    def evict(self, side):
+        # levels pushed out of the subscribed depth get no more updates, keeping them would only mislead
+        while self.max_depth is not None and self.levels(side) > self.max_depth:
+            self.delete_level(self.worst_level(side))
+            self.evicted += 1
+
     def quote_changed(self, side):
         if self.is_valid():
             [x.quote_changed(self.quote(side)) for x in self.quote_subscribers]
@@ -139,12 +270,14 @@ class Book:
         quote = self.quote(side)
         if quote == level:
             self.book.set_side(side, level.next_level)
+            self.level_changed(level, -level.size, -1)
             self.quote_changed(side)
         else:
             parent_level = find_parent(level, quote)
             if parent_level is None:
                 raise RuntimeError
             parent_level.next_level = level.next_level
+            self.level_changed(level, -level.size, -1)
             del level
 
     def add_level(self, side, price, size):
@@ -155,13 +288,16 @@ class Book:
         quote = self.book.side(side)
         if quote is None:
             self.book.set_side(side, level)
+            self.level_changed(level, size, 1)
             self.quote_changed(side)
         elif level.before(quote):
             self.book.set_side(side, level)
             level.append(quote)
+            self.level_changed(level, size, 1)
             self.quote_changed(side)
         else:
             quote.append(level)
+            self.level_changed(level, size, 1)
 
     def __str__(self):
         acc = []
@@ -176,8 +312,154 @@ class Book:
         return self.quote(Side.BID) is not None and self.quote(Side.ASK) is not None
 
     def clear(self):
+        self.version += 1
+        if self.changed is not None:
+            for side in Side.sides:
+                self.changed.update((side, level.price) for level in self.quote(side) or [])
         self.book = BipolarContainer()
+        self.volumes = BipolarContainer(0, 0)
+        self.level_counts = BipolarContainer(0, 0)
+        self.depths = BipolarContainer([], [])
+        self.depths_stale = BipolarContainer(False, False)
 
     def important_event(self, ev: ImportantEvent):
         if ev.event_name == ImportantEvent.GAP:
             self.clear()
+
+
+class SortedBook(Book):
+    def __init__(self, units=DECIMAL, max_depth=None):
+        super().__init__(units, max_depth)
+        self.index = BipolarContainer({}, {})
+        self.keys = BipolarContainer([], [])
+        self.ladder = BipolarContainer([], [])
+        # None when levels came or went since the last depth query
+        self.depth_trees = BipolarContainer(None, None)
+
+    @staticmethod
+    def sort_key(side, price):
+        return -price if side == Side.BID else price
+
+    def level(self, side, price):
+        return self.index.side(side).get(price)
+
+    def nth_level(self, side, n):
+        return self.ladder.side(side)[n]
+
+    def worst_level(self, side):
+        ladder = self.ladder.side(side)
+        return ladder[-1] if len(ladder) > 0 else None
+
+    def worse_level(self, side, price):
+        ladder = self.ladder.side(side)
+        pos = bisect_right(self.keys.side(side), SortedBook.sort_key(side, price))
+        return ladder[pos] if pos < len(ladder) else None
+
+    def depth_tree(self, side):
+        tree = self.depth_trees.side(side)
+        if tree is None:
+            tree = DepthTree([level.size for level in self.ladder.side(side)])
+            self.depth_trees.set_side(side, tree)
+        return tree
+
+    def cumulative_depth(self, side):
+        return list(accumulate(level.size for level in self.ladder.side(side)))
+
+    def depth_index(self, side, liq):
+        tree = self.depth_tree(side)
+        if len(tree) == 0:
+            return None
+        return min(tree.search(liq), len(tree) - 1)
+
+    def depth_at(self, side, index):
+        return self.depth_tree(side).prefix(index)
+
+    def level_changed(self, level, size_delta, count_delta, pos=None):
+        side = level.side
+        self.version += 1
+        if self.changed is not None:
+            self.changed.add((side, level.price))
+        self.volumes.set_side(side, self.volumes.side(side) + size_delta)
+        self.level_counts.set_side(side, self.level_counts.side(side) + count_delta)
+        tree = self.depth_trees.side(side)
+        if tree is None:
+            return
+        if count_delta == 0:
+            tree.add(self.position(level) if pos is None else pos, size_delta)
+        else:
+            self.depth_trees.set_side(side, None)
+
+    def increment_level(self, side, price, size):
+        level = self.index.side(side).get(price)
+        if size < 0.00000001:
+            self.delete_level(level)
+        elif level is None:
+            self.add_level(side, price, size)
+            self.evict(side)
+        else:
+            self.level_changed(level, size - level.size, 0)
+            level.size = size
+
+    def position(self, level):
+        keys = self.keys.side(level.side)
+        pos = bisect_left(keys, SortedBook.sort_key(level.side, level.price))
+        if pos == len(keys) or self.ladder.side(level.side)[pos] is not level:
+            raise RuntimeError
+        return pos
+
+    def delete_level(self, level):
+        if level is None:
+            return
+
+        side = level.side
+        pos = self.position(level)
+        ladder = self.ladder.side(side)
+        del self.keys.side(side)[pos]
+        del ladder[pos]
+        del self.index.side(side)[level.price]
+        self.level_changed(level, -level.size, -1, pos)
+
+        if pos == 0:
+            self.book.set_side(side, level.next_level)
+            self.quote_changed(side)
+        else:
+            ladder[pos - 1].next_level = level.next_level
+        level.next_level = None
+
+    def add_level(self, side, price, size):
+        level = Level(side, price, size)
+        key = SortedBook.sort_key(side, price)
+        keys = self.keys.side(side)
+        ladder = self.ladder.side(side)
+        pos = bisect_left(keys, key)
+        if pos < len(keys) and keys[pos] == key:
+            raise RuntimeError
+
+        keys.insert(pos, key)
+        ladder.insert(pos, level)
+        self.index.side(side)[price] = level
+        self.level_changed(level, size, 1, pos)
+
+        if pos + 1 < len(ladder):
+            level.next_level = ladder[pos + 1]
+        if pos == 0:
+            self.book.set_side(side, level)
+            self.quote_changed(side)
+        else:
+            ladder[pos - 1].next_level = level
+
+    def clear(self):
+        super().clear()
+        self.index = BipolarContainer({}, {})
+        self.keys = BipolarContainer([], [])
+        self.ladder = BipolarContainer([], [])
+        self.depth_trees = BipolarContainer(None, None)
+
+
+BOOK_IMPLEMENTATIONS = {'linked': Book, 'sorted': SortedBook}
+
+
+def create_book(impl='linked', units=DECIMAL, max_depth=None):
+    if impl not in BOOK_IMPLEMENTATIONS:
+        raise RuntimeError('unknown book implementation ' + str(impl))
+    return BOOK_IMPLEMENTATIONS[impl](units, max_depth)
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import deque
+
+from mm.delta import DeltaStream, merge_delta, serialize_delta
+
+
+class Subscriber:
+    # a client that falls behind gets only the latest snapshot of each kind, updates are kept up to a limit
+    def __init__(self, websocket, max_pending=100):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.snapshots = {}
+        self.updates = deque()
+        self.dropped = 0
+        self.sent = 0
+        self.ready = asyncio.Event()
+        # delta mode: book and orders come as sequenced deltas instead of full snapshots
+        self.skip = set()
+        self.delta_interval = None
+        self.pending_deltas = []
+        self.last_flush = 0
+
+    def offer(self, snapshots, updates):
+        self.snapshots.update({kind: message for kind, message in snapshots.items() if kind not in self.skip})
+        for message in updates:
+            if len(self.updates) >= self.max_pending:
+                self.updates.popleft()
+                self.dropped += 1
+            self.updates.append(message)
+        self.ready.set()
+
+    def subscribe_deltas(self, interval, snapshot):
+        self.skip = {'book', 'orders'}
+        for kind in self.skip:
+            self.snapshots.pop(kind, None)
+        self.delta_interval = interval
+        self.pending_deltas = []
+        self.offer({'book_snapshot': snapshot}, [])
+
+    def offer_delta(self, seq, delta, serialized, now):
+        if delta is not None:
+            self.pending_deltas.append((seq, delta, serialized))
+        if len(self.pending_deltas) == 0 or now - self.last_flush < self.delta_interval:
+            return
+        self.last_flush = now
+        if len(self.pending_deltas) == 1:
+            message = self.pending_deltas[0][2]
+        else:
+            merged = {"book": {}, "orders": {}}
+            for pending_seq, pending, pending_serialized in self.pending_deltas:
+                merge_delta(merged, pending)
+            book = {side: [[price, size] for price, size in levels.items()] for side, levels in merged["book"].items()}
+            message = serialize_delta(self.pending_deltas[0][0], seq, book, merged["orders"])
+        self.pending_deltas = []
+        # a dropped delta shows up as a sequence gap on the client, which then subscribes again
+        self.offer({}, [message])
+
+    def next_message(self):
+        if len(self.snapshots) > 0:
+            key = next(iter(self.snapshots))
+            return self.snapshots.pop(key)
+        return self.updates.popleft()
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while len(self.snapshots) > 0 or len(self.updates) > 0:
+                await self.websocket.send(self.next_message())
+                self.sent += 1
+
+
+class Broadcaster:
+    def __init__(self, produce, interval=1.0, max_pending=100, deltas: DeltaStream = None, delta_interval=0.1):
+        # produce() -> (dict of snapshot messages by kind, list of update messages)
+        self.produce = produce
+        self.interval = interval
+        self.max_pending = max_pending
+        self.deltas = deltas
+        self.delta_interval = delta_interval
+        self.subscribers = set()
+        self.broadcasts = 0
+
+    def subscribe(self, websocket):
+        subscriber = Subscriber(websocket, self.max_pending)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if self.deltas is not None and subscriber.delta_interval is not None \
+                and all(other.delta_interval is None for other in self.subscribers):
+            self.deltas.stop()
+
+    def wanted(self, kind):
+        # delta subscribers skip book and orders snapshots, when all of them do there's no need to serialize those
+        return any(kind not in subscriber.skip for subscriber in self.subscribers)
+
+    def broadcast(self):
+        if len(self.subscribers) == 0:
+            return
+        # serialized once, the same strings go to every client
+        snapshots, updates = self.produce()
+        for subscriber in self.subscribers:
+            subscriber.offer(snapshots, updates)
+        self.broadcasts += 1
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.broadcast()
+
+    def subscribe_deltas(self, subscriber, interval, now=None):
+        # bring everyone else up to date first so the snapshot matches the current sequence number
+        self.step_deltas(time.monotonic() if now is None else now, force=True)
+        subscriber.subscribe_deltas(max(self.delta_interval, interval), self.deltas.snapshot())
+
+    def step_deltas(self, now, force=False):
+        subscribers = [subscriber for subscriber in self.subscribers if subscriber.delta_interval is not None]
+        if len(subscribers) == 0 and not force:
+            return
+        delta = self.deltas.step()
+        serialized = None
+        if delta is not None:
+            serialized = serialize_delta(self.deltas.seq, self.deltas.seq, delta["book"], delta["orders"])
+        for subscriber in subscribers:
+            subscriber.offer_delta(self.deltas.seq, delta, serialized, now)
+
+    async def run_deltas(self):
+        while True:
+            await asyncio.sleep(self.delta_interval)
+            self.step_deltas(time.monotonic())
+
+    def summary(self):
+        return {'clients': len(self.subscribers), 'broadcasts': self.broadcasts,
+                'dropped': sum(subscriber.dropped for subscriber in self.subscribers)}
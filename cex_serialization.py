@@ -6,7 +6,8 @@ import json
 from decimal import Decimal
 
 from posmath.side import Side
-from mm.orders import NewReq, ReplaceReq, CancelReq, ErrorRequest, Exec, Ack, Replaced, Cancelled
+from mm.orders import NewReq, ReplaceReq, CancelReq, CancelAllReq, ErrorRequest, Exec, Ack, Replaced, Cancelled, \
+    CancelledAll
 
 
 def create_signature(key, secret):  # (string key, string secret)
@@ -41,6 +42,19 @@ def subscribe_to_book(crypto="BTC", currency="USD", depth=10):
     })
 
 
+def unsubscribe_from_book(crypto="BTC", currency="USD"):
+    return json.dumps({
+        "e": "order-book-unsubscribe",
+        "data": {
+            "pair": [
+                crypto,
+                currency
+            ]
+        },
+        "oid": "1435927928274_4_order-book-unsubscribe"
+    })
+
+
 def serialize_side(side):
     return 'buy' if side == Side.BID else 'sell'
 
@@ -87,6 +101,17 @@ def serialize_request(req, crypto="BTC", currency="USD"):
             },
             "oid": req.oid
         })
+    elif type(req) == CancelAllReq:
+        return json.dumps({
+            "e": "cancel-orders",
+            "data": {
+                "pair": [
+                    crypto,
+                    currency
+                ]
+            },
+            "oid": req.oid
+        })
     else:
         raise RuntimeError
 
@@ -124,6 +149,8 @@ def deserialize_order_event(event, parsed):
                         Decimal(str(parsed['data']['price'])))
     elif event == "cancel-order":
         return Cancelled(parsed['oid'], str(parsed['data']['order_id']))
+    elif event == "cancel-orders":
+        return CancelledAll(parsed['oid'], [str(order_id) for order_id in parsed['data']['cancelled_order_ids']])
     elif event == "order" and "cancel" not in parsed['data']:
         return Exec(Decimal(str(parsed['data']['remains'])) / 100000000,
                     str(parsed['data']['id']))
@@ -145,6 +172,11 @@ def open_orders(crypto="BTC", currency="USD"):
     })
 
 
+def deserialize_open_orders(parsed):
+    return [(str(order['id']), deserialize_side(order['type']), Decimal(str(order['price'])),
+             Decimal(str(order['pending']))) for order in parsed['data']]
+
+
 def balance():
     return json.dumps({
         "e": "get-balance",
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import math
+import os
+import time
+import traceback
+from decimal import Decimal
+
+from posmath.side import Side
+
+
+class Checkpoint:
+    # Warm-start state, so a restarted engine doesn't quote off an empty EMA for the first window:
+    # EMA aggregates and samples, NBBO and strategy timers. Written every `interval` seconds, only when the EMA or
+    # NBBO moved. Samples are merged into one per `bucket` seconds and the file is written off the event loop,
+    # a busy book puts tens of thousands of samples in the window.
+    FORMAT = 2
+
+    def __init__(self, filename, interval=5.0, nbbo_max_age=5.0, bucket=1.0):
+        self.filename = filename
+        self.interval = interval
+        self.nbbo_max_age = nbbo_max_age
+        self.bucket = bucket
+        self.key = None
+        self.saved = 0
+        self.errors = 0
+
+    def state(self, engine, now):
+        # only copies, the rest is done by write(), which may run on another thread
+        pnl = engine.pnl
+        ema = pnl.ema
+        ema.evict(now)
+        state = {'format': Checkpoint.FORMAT, 'time': now,
+                 'ema': {'weighted_sum': ema.weighted_sum, 'weight': ema.weight, 'last_time': ema.last_time,
+                         'decay_time': ema.decay_time, 'samples': list(ema.values)},
+                 'nbbo': [str(pnl.nbbo.bid()), str(pnl.nbbo.ask())]}
+        if hasattr(engine.algo, 'last_updated_time'):
+            state['last_updated_time'] = engine.algo.last_updated_time
+        return state
+
+    def write(self, state):
+        ema = state['ema']
+        ema['samples'] = merge_samples(ema.pop('samples'), self.bucket, ema.pop('decay_time'))
+        tmp_name = self.filename + '.tmp'
+        with open(tmp_name, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp_name, self.filename)
+
+    def changed(self, engine):
+        key = (engine.pnl.version, engine.pnl.ema.version)
+        if key == self.key:
+            return False
+        self.key = key
+        return True
+
+    def save(self, engine, now=None):
+        now = time.time() if now is None else now
+        if not self.changed(engine):
+            return False
+        self.write(self.state(engine, now))
+        self.saved += 1
+        return True
+
+    def load(self, engine, now=None):
+        # returns the age of the checkpoint in seconds, None if there was nothing to load
+        now = time.time() if now is None else now
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename) as f:
+            state = json.load(f)
+        if state.get('format') != Checkpoint.FORMAT:
+            # left by an older version, the next save replaces it
+            return None
+        age = now - state['time']
+        if age < 0:
+            # written by a clock ahead of ours, nothing in it can be trusted to be recent
+            return None
+
+        pnl = engine.pnl
+        ema = pnl.ema
+        saved = state['ema']
+        if len(saved['samples']) > 0:
+            ema.values.extend((sample_time, Decimal(val), weight) for sample_time, val, weight in saved['samples'])
+            ema.weighted_sum = saved['weighted_sum']
+            ema.weight = saved['weight']
+            ema.last_time = saved['last_time']
+            ema.version += 1
+            # samples older than the window are dropped here, a checkpoint older than the window restores nothing
+            ema.evict(now)
+        if age <= self.nbbo_max_age:
+            pnl.nbbo.set_side(Side.BID, Decimal(state['nbbo'][0]))
+            pnl.nbbo.set_side(Side.ASK, Decimal(state['nbbo'][1]))
+        if 'last_updated_time' in state and hasattr(engine.algo, 'last_updated_time'):
+            engine.algo.last_updated_time = state['last_updated_time']
+        pnl.version += 1
+        return age
+
+    async def run(self, engine):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.changed(engine):
+                    await loop.run_in_executor(None, self.write, self.state(engine, time.time()))
+                    self.saved += 1
+            except Exception:
+                # a full disk or a bad path costs the checkpoint, not the engine
+                self.errors += 1
+                self.key = None
+                traceback.print_exc()
+
+
+def merge_samples(samples, bucket, decay_time):
+    # samples in one bucket become one at the time of the latest, weighted with their decay up to it,
+    # so the EMA sums stay as they were; such a sample leaves the window when its latest part does
+    merged = []
+    start = None
+    for sample_time, val, weight in samples:
+        if start is None or sample_time - start >= bucket:
+            if start is not None:
+                merged.append([last_time, str(round(Decimal(total / weights), 8)), weights])
+            start = sample_time
+            total = 0.0
+            weights = 0.0
+        else:
+            decay = math.exp((last_time - sample_time) / decay_time)
+            total *= decay
+            weights *= decay
+        total += float(val) * weight
+        weights += weight
+        last_time = sample_time
+    if start is not None:
+        merged.append([last_time, str(round(Decimal(total / weights), 8)), weights])
+    return merged
@@ -45,6 +45,37 @@ const wsBookToBookEntry = side => wsEntry => toLevel(side, Big(wsEntry[0]), Big(
 const wsOrderToBookEntry = wsEntry => toLevel(wsEntry[2] === 'B' ? 'bid' : 'ask', Big(wsEntry[0]), Big(wsEntry[1]))
 const sendRMNormal = () => send({'e': 'rm', 'new_status': 'NORMAL'})
 const sendRMCancelAll = () => send({'e': 'rm', 'new_status': 'CANCELL_ALL'})
+// book and orders come as sequenced deltas, a gap means one was dropped and a fresh snapshot is needed
+const deltas = {subscribed: false, seq: null, book: {B: {}, S: {}}, orders: {}}
+const subscribeDeltas = () => {
+  deltas.subscribed = true
+  deltas.seq = null
+  send({'e': 'subscribe', 'mode': 'delta', 'interval_ms': 250})
+}
+const renderDeltas = () => {
+  bookData.bookLevels = [].concat(
+    _.toPairs(deltas.book['B']).map(wsBookToBookEntry('bid')),
+    _.toPairs(deltas.book['S']).map(wsBookToBookEntry('ask')),
+  )
+  bookData.myOrders = _.values(deltas.orders).map(wsOrderToBookEntry)
+  render()
+}
+const applyDelta = msg => {
+  _.forEach(msg.details.book, (changes, side) => changes.forEach(([price, size]) => {
+    if (size === '0') {
+      delete deltas.book[side][price]
+    } else {
+      deltas.book[side][price] = size
+    }
+  }))
+  _.forEach(msg.details.orders, (order, key) => {
+    if (order === null) {
+      delete deltas.orders[key]
+    } else {
+      deltas.orders[key] = order
+    }
+  })
+}
 const sendAuth = (timestamp) => {
   authCount++;
   send({'e': 'auth', 'login': state.login, 'password': Sha('sha256').update(timestamp + state.password).digest('hex')})
@@ -87,6 +118,25 @@ socket.addEventListener('message', function processEvent (event) {
       }
     }
   }
+  if (msg.e !== 'auth' && !deltas.subscribed) {
+    // the first message past auth, the server takes requests from here on
+    subscribeDeltas()
+  }
+  if (msg.e === 'book_snapshot') {
+    deltas.seq = msg.seq
+    deltas.book = {B: _.fromPairs(msg.details.book['B']), S: _.fromPairs(msg.details.book['S'])}
+    deltas.orders = Object.assign({}, msg.details.orders)
+    renderDeltas()
+  }
+  if (msg.e === 'book_delta' && deltas.seq !== null) {
+    if (msg.from !== deltas.seq + 1) {
+      subscribeDeltas()
+    } else {
+      deltas.seq = msg.seq
+      applyDelta(msg)
+      renderDeltas()
+    }
+  }
   if (msg.e === 'book') {
     bookData.bookLevels = [].concat(
       msg.details['B'].map(wsBookToBookEntry('bid')),
@@ -1,32 +1,57 @@
 import json
 
+from mm.broadcast import Broadcaster
 from mm.client import ClientEventHandler
+from mm.event_hub import EventHub
+from mm.latency import TickToTrade, Conflation
+from mm.log_writer import LogWriter
+from mm.ratelimit import RateLimiter
+from mm.sequencer import Sequencer
 from mm.book import Book, BipolarContainer
+from mm.memo import Memo
 from posmath.side import Side
 from mm.orders import OrderManager, OrderStatus
 from mm.pnl import PNL
 
 
 def serialize_book(book: Book):
+    return book_memo((book, book.version), book)
+
+
+def _serialize_book(book: Book):
     c = BipolarContainer([], [])
 
     def serialize_side(side):
         quote = book.quote(side)
         while quote is not None:
-            c.side(side).append([str(quote.price), str(quote.size)])
+            c.side(side).append([str(book.units.to_price(quote.price)), str(book.units.to_size(quote.size))])
             quote = quote.next_level
     serialize_side(Side.BID)
     serialize_side(Side.ASK)
     return json.dumps({"e": "book", "details": c.container})
 
 
+def serialize_book_stats(book: Book):
+    levels = {'BID': book.levels(Side.BID), 'ASK': book.levels(Side.ASK)}
+    return json.dumps({"e": "book_stats", "details": {'levels': levels, 'max_depth': book.max_depth,
+                                                      'evicted': book.evicted}})
+
+
 def serialize_orders(om: OrderManager):
+    return orders_memo((om, om.version), om)
+
+
+def _serialize_orders(om: OrderManager):
     order_dump = [[str(x.price), str(x.amount), str(x.side)] for x in om.by_order_id.values()
                   if x.status != OrderStatus.COMPLETED]
     return json.dumps({"e": "orders", "details": order_dump})
 
 
 def serialize_pnl(pnl: PNL):
+    return pnl_memo((pnl, pnl.state_version()), pnl)
+
+
+def _serialize_pnl(pnl: PNL):
     return json.dumps({"e": "pnl", "details": {'position': str(pnl.position()),
                        'balance': str(pnl.balance()),
                        'zero exit price': str(pnl.position_zero_price()),
@@ -39,6 +64,11 @@ def serialize_pnl(pnl: PNL):
                                                }})
 
 
+book_memo = Memo(_serialize_book)
+orders_memo = Memo(_serialize_orders)
+pnl_memo = Memo(_serialize_pnl)
+
+
 def serialize_execs(execs):
     serialized = json.dumps({"e": "exec", "details": execs})
     execs.clear()
@@ -50,3 +80,38 @@ def serialize_important_events(ev_handler: ClientEventHandler):
     dumps = json.dumps({"e": "important_events", "details": data})
     ev_handler.event_stack.clear()
     return dumps
+
+
+def serialize_latency(latency: TickToTrade):
+    return json.dumps({"e": "latency", "details": latency.summary()})
+
+
+def serialize_order_latency(om: OrderManager):
+    details = om.round_trips.summary()
+    details['time_to_flat'] = om.time_to_flat.summary()
+    return json.dumps({"e": "order_latency", "details": details})
+
+
+def serialize_rate_limit(limiter: RateLimiter):
+    return json.dumps({"e": "rate_limit", "details": limiter.summary()})
+
+
+def serialize_conflation(conflation: Conflation):
+    return json.dumps({"e": "conflation", "details": conflation.summary()})
+
+
+def serialize_sequencer(sequencer: Sequencer):
+    return json.dumps({"e": "md_sequence", "details": sequencer.summary()})
+
+
+def serialize_dashboard(broadcaster: Broadcaster):
+    return json.dumps({"e": "dashboard", "details": broadcaster.summary()})
+
+
+def serialize_event_hub(event_hub: EventHub):
+    return json.dumps({"e": "event_hub", "details": event_hub.summary()})
+
+
+def serialize_logging(important: LogWriter, orders: LogWriter):
+    details = {'important': important.summary(), 'orders': None if orders is None else orders.summary()}
+    return json.dumps({"e": "logging", "details": details})
@@ -0,0 +1,103 @@
+import json
+
+from mm.book import Book
+from mm.orders import OrderManager, OrderStatus
+from posmath.side import Side
+
+
+class DeltaStream:
+    # book levels and live orders as of sequence number `seq`, with the changes since the previous step
+    def __init__(self, book: Book, om: OrderManager):
+        self.book = book
+        self.om = om
+        self.seq = 0
+        self.levels = {Side.BID: {}, Side.ASK: {}}
+        self.orders = {}
+        self.key = None
+        self.skipped = 0
+        # the book keeps track of the levels it changed from the first step on, that one looks at all of them
+        self.full = True
+
+    def current_levels(self, side):
+        units = self.book.units
+        return {str(units.to_price(level.price)): str(units.to_size(level.size))
+                for level in self.book.quote(side) or []}
+
+    def current_orders(self):
+        return {str(order.order_id if order.order_id != -1 else order.oid): [str(order.price), str(order.amount),
+                                                                            str(order.side)]
+                for order in list(self.om.by_order_id.values()) + list(self.om.by_oid.values())
+                if order.status != OrderStatus.COMPLETED}
+
+    def snapshot(self):
+        return json.dumps({"e": "book_snapshot", "seq": self.seq,
+                           "details": {"book": {side: [[price, size] for price, size in levels.items()]
+                                                for side, levels in self.levels.items()},
+                                       "orders": self.orders}})
+
+    def stop(self):
+        # nobody takes deltas anymore, the book stops collecting changes until the next step, which diffs everything
+        self.book.changed = None
+        self.full = True
+
+    def changed_levels(self):
+        # {side: {price: size}} of levels that changed since the last step, size None for a level gone
+        book = self.book
+        units = book.units
+        changed = book.changed
+        book.changed = set()
+        if self.full:
+            self.full = False
+            levels = {side: {price: None for price in self.levels[side]} for side in Side.sides}
+            for side in Side.sides:
+                levels[side].update(self.current_levels(side))
+            return levels
+        levels = {Side.BID: {}, Side.ASK: {}}
+        for side, price in changed:
+            level = book.level(side, price)
+            levels[side][str(units.to_price(price))] = None if level is None else str(units.to_size(level.size))
+        return levels
+
+    def step(self):
+        # returns the delta since the last step, None when nothing changed
+        key = (self.book.version, self.om.version)
+        if key == self.key:
+            self.skipped += 1
+            return None
+        self.key = key
+
+        book = {}
+        for side, levels in self.changed_levels().items():
+            last = self.levels[side]
+            changes = []
+            for price, size in levels.items():
+                if size is None:
+                    if last.pop(price, None) is not None:
+                        changes.append([price, '0'])
+                elif last.get(price) != size:
+                    last[price] = size
+                    changes.append([price, size])
+            if len(changes) > 0:
+                book[side] = changes
+
+        orders = self.current_orders()
+        order_changes = {key: order for key, order in orders.items() if self.orders.get(key) != order}
+        order_changes.update({key: None for key in self.orders if key not in orders})
+        self.orders = orders
+
+        if len(book) == 0 and len(order_changes) == 0:
+            return None
+        self.seq += 1
+        return {"book": book, "orders": order_changes}
+
+
+def merge_delta(pending, delta):
+    # later changes of the same level or order win
+    for side, changes in delta["book"].items():
+        pending["book"].setdefault(side, {}).update({price: size for price, size in changes})
+    pending["orders"].update(delta["orders"])
+
+
+def serialize_delta(from_seq, seq, book, orders):
+    return json.dumps({"e": "book_delta", "from": from_seq, "seq": seq,
+                       "details": {"book": book, "orders": orders}})
@@ -8,13 +8,17 @@ import time
 from mm.app_config import AppConfig
 
 from mm.client import ClientEventHandler
-from mm.event_hub import EventHub
-from mm.book import Book
+from mm.event_hub import EventHub, ImportantEvent
+from mm.book import create_book
 from posmath.position import Position
 from posmath.side import Side
 from mm.orders import Broker, OrderManager, Ack, Replaced, Cancelled, Exec, OrderStatus, ErrorRequest, UnknownOid, \
     UnknownOrderId, ExecHasNoEffect, NegativeAmountAfterExec, UnknownExec, RiskManager
+from mm.latency import TickToTrade, Conflation
 from mm.pnl import PNL
+from mm.sequencer import Sequencer
+from mm.ratelimit import RateLimiter
+from mm.units import create_units
 from mm.printout import print_book_and_orders
 
 
@@ -23,46 +27,110 @@ class Engine:
         self.config = config
         self.event_log = ClientEventHandler()
         self.order_manager = OrderManager()
-        self.book = Book()
-        self.pnl = PNL(config.venue.taker_comission_percent)
+        self.units = create_units(config.venue.fixed_point, config.venue.tick_size)
+        self.book = create_book(config.book.impl, self.units, config.book.depth)
+        self.pnl = PNL(config.venue.taker_comission_percent, self.units)
         self.pnl.pos = Position(pos=config.venue.start_pos, balance=config.venue.start_balance)
         self.book.quote_subscribers.append(self.pnl)
         self.execution = Broker(self.order_manager)
         self.algo = algo_class(self)
         self.execution_sink = []
-        self.snapid = -1
+        self.sequencer = Sequencer()
+        self.resubscribe = False
+        self.resync_balance = False
         self.event_hub = EventHub()
-        self.event_hub.subscribe(self.book)
-        self.event_hub.subscribe(self.algo)
-        self.event_hub.subscribe(self.event_log)
-        self.event_hub.subscribe(self.order_manager)
+        # the book has to be cleared before the algo reacts to the same gap
+        self.event_hub.subscribe(self.book, [ImportantEvent.GAP])
+        self.event_hub.subscribe(self.algo, [ImportantEvent.GAP])
+        self.event_hub.subscribe(self.event_log, deferred=True)
+        self.event_hub.subscribe(self.order_manager, [ImportantEvent.RECONNECT])
         self.rm = RiskManager(self.execution, self.event_hub)
+        self.latency = TickToTrade()
+        self.rate_limiter = RateLimiter(config.venue.rate_limit)
+        self.conflation = Conflation()
 
 
     def on_md(self, md):
-        # update book
+        self.update_book(md)
+        self.md_applied(1)
+
+    def update_book(self, md):
+        ready, gap = self.sequencer.push(int(md['data']['id']), md)
+        for update in ready:
+            self.apply_md(update)
+        if len(ready) > 0 and self.sequencer.gap_started != 0 and self.book.is_valid():
+            self.sequencer.valid()
+        if gap > 0:
+            print("GAP! " + str(gap))
+            self.event_hub.gap(gap)
+            self.resubscribe = True
+
+    def apply_md(self, md):
         def update_side(side, side_name):
             for price, size in md['data'][side_name]:
-                self.book.increment_level(side, Decimal(str(price)), Decimal(str(size)))
+                self.book.increment_level(side, self.units.parse_price(price), self.units.parse_size(size))
 
         update_side(Side.BID, 'bids')
         update_side(Side.ASK, 'asks')
 
-        nextsnap = int(md['data']['id'])
-        if self.snapid != -1 and nextsnap - self.snapid > 1:
-            print("GAP! " + str(nextsnap - self.snapid))
-            self.event_hub.gap(nextsnap - self.snapid)
+    def on_snapshot(self, snapshot):
+        # the whole book is rebuilt before anyone looks at it again, then buffered updates go on top
+        self.book.clear()
+        self.apply_md(snapshot)
+        for update in self.sequencer.snapshot(int(snapshot['data']['id'])):
+            self.apply_md(update)
+        if self.book.is_valid():
+            self.sequencer.valid()
+
+    def snapshot_failed(self, reply):
+        print("snapshot failed " + str(reply.get('data')))
+        self.resubscribe = True
 
-        self.snapid = nextsnap
+    def check_snapshot(self, now):
+        # the venue never answered the subscribe, or the answer got lost
+        if self.sequencer.overdue(now):
+            print("snapshot timed out")
+            self.resubscribe = True
+
+    def md_applied(self, updates):
+        # the strategy runs once for a burst of updates, on the latest book
+        self.conflation.burst(updates)
+        self.latency.mark(TickToTrade.BOOK)
 
         if self.book.is_valid():
 
             if hasattr(self.algo, 'on_md'):
                 self.algo.on_md()
+                self.latency.mark(TickToTrade.STRATEGY)
 
     def on_exec(self, details):
         if hasattr(self.algo, 'on_exec'):
             self.algo.on_exec(details)
+            self.latency.mark(TickToTrade.STRATEGY)
+
+    def restore(self, journal):
+        # orders and position from before a restart, the journal goes on recording from here
+        replayed = journal.restore(self.order_manager, self.pnl)
+        for order in self.order_manager.by_order_id.values():
+            self.execution.reconciler.adopt(order)
+        self.order_manager.journal = journal
+        self.pnl.journal = journal
+        return replayed
+
+    def sync_open_orders(self, open_orders):
+        adopted, fills, gone = self.order_manager.sync_open_orders(open_orders)
+        for order in adopted:
+            self.execution.reconciler.adopt(order)
+        for tx in fills:
+            self.order_event(tx)
+        if len(adopted) > 0 or len(fills) > 0 or len(gone) > 0:
+            self.event_hub.reconcile({'adopted': [order.order_id for order in adopted],
+                                      'filled': [tx.order_id for tx in fills],
+                                      'gone': [order.order_id for order in gone]})
+        if len(gone) > 0:
+            # filled or cancelled while we weren't listening, the position can't be trusted until it's checked
+            self.rm.set_cancel_all()
+            self.resync_balance = True
 
     def sync_balance(self, parsed):
         print(parsed)
@@ -78,7 +146,10 @@ class Engine:
             self.order_manager.market_event(ev)
             if type(ev) == ErrorRequest:
                 self.event_hub.order_error(str(ev))
-                if ev.error_class != ErrorRequest.ORDER_NOT_FOUND:
+                if ev.error_class == ErrorRequest.RATE_LIMIT:
+                    # slow down instead of answering with a burst of cancels, the strategy requotes later
+                    self.rate_limiter.throttled()
+                elif ev.error_class != ErrorRequest.ORDER_NOT_FOUND:
                     self.rm.set_cancel_all()
             elif type(ev) == Exec and ev.delta > 0:
                 if self.pnl.exit_method() == "REMOVE":
@@ -1,7 +1,10 @@
+import asyncio
 import json
 import time
+from collections import deque
 
-import logging
+from mm.latency import RollingLatency
+from mm.log_writer import LogWriter
 
 
 class ImportantEvent:
@@ -9,6 +12,9 @@ class ImportantEvent:
     RM = "RM"
     ORDER_ERROR = "OrderError"
     GAP = "Gap"
+    RECONCILE = "Reconcile"
+
+    __slots__ = ('time', 'event_name', 'details')
 
     def __init__(self, event_name, details):
         self.time = time.time()
@@ -16,11 +22,12 @@ class ImportantEvent:
         self.details = details
 
     def __str__(self):
+        # stamped once at creation, a deferred subscriber may format it much later
         return json.dumps({"e": "warning",
-                           "time": str(time.strftime("%Y-%m-%d_%H:%M:%S", time.localtime())),
+                           "time": str(time.strftime("%Y-%m-%d_%H:%M:%S", time.localtime(self.time))),
                            "event": self.event_name,
                            "details": str(self.details),
-                           'timestamp': int(1000*time.time())})
+                           'timestamp': int(1000*self.time)})
 
 
 class PrintLogger:
@@ -31,25 +38,86 @@ class PrintLogger:
 
 class ImportantLogger:
     def __init__(self, logdir):
-        logging.basicConfig(filename=self.logname(logdir), level=logging.WARNING)
+        self.writer = LogWriter(self.logname(logdir))
 
     def logname(self, dirname: str):
         return dirname + '/important_' + str(time.strftime("%Y-%m-%d_%H%M%S", time.localtime())) + '.log'
 
     def important_event(self, ev):
-        logging.warning(ev)
+        self.writer.log('%s', ev)
 
 
 class EventHub:
-    def __init__(self):
-        self.subscribers = [PrintLogger()]
+    MAX_PENDING = 10000
 
-    def subscribe(self, obj):
-        self.subscribers.append(obj)
+    def __init__(self):
+        self.subscribers = []
+        # event name -> (immediate, deferred) subscribers, rebuilt on subscribe
+        self.routes = {}
+        self.pending = deque()
+        self.wakeup = None
+        self.dropped = 0
+        self.dispatch_time = RollingLatency()
+        self.queue_time = RollingLatency()
+        self.deferred_time = RollingLatency()
+        self.subscribe(PrintLogger(), deferred=True)
+
+    def subscribe(self, obj, events=None, deferred=False):
+        # events=None gets everything, deferred subscribers are called from run() instead of the caller
+        self.subscribers.append((obj, None if events is None else set(events), deferred))
+        self.routes.clear()
+
+    def route(self, event_name):
+        if event_name not in self.routes:
+            matching = [(obj, deferred) for obj, events, deferred in self.subscribers
+                        if events is None or event_name in events]
+            self.routes[event_name] = ([obj for obj, deferred in matching if not deferred],
+                                       [obj for obj, deferred in matching if deferred])
+        return self.routes[event_name]
 
     def event_occured(self, ev):
-        for x in self.subscribers:
+        started = time.perf_counter_ns()
+        immediate, deferred = self.route(ev.event_name)
+        for x in immediate:
             x.important_event(ev)
+        if len(deferred) > 0:
+            if self.wakeup is None:
+                # nobody drains the queue, e.g. replay and tests
+                for x in deferred:
+                    x.important_event(ev)
+            elif len(self.pending) >= EventHub.MAX_PENDING:
+                self.dropped += 1
+            else:
+                self.pending.append((ev, started))
+                self.wakeup.set()
+        self.dispatch_time.record(time.perf_counter_ns() - started)
+
+    def drain(self):
+        while len(self.pending) > 0:
+            ev, queued = self.pending.popleft()
+            started = time.perf_counter_ns()
+            self.queue_time.record(started - queued)
+            for x in self.route(ev.event_name)[1]:
+                x.important_event(ev)
+            self.deferred_time.record(time.perf_counter_ns() - started)
+
+    async def run(self):
+        self.wakeup = asyncio.Event()
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                self.drain()
+        finally:
+            self.wakeup = None
+            self.drain()
+
+    def summary(self):
+        return {'dispatch': self.dispatch_time.summary(),
+                'queue': self.queue_time.summary(),
+                'deferred': self.deferred_time.summary(),
+                'pending': len(self.pending),
+                'dropped': self.dropped}
 
     def gap(self, gap_amount):
         self.event_occured(ImportantEvent(ImportantEvent.GAP, gap_amount))
@@ -63,6 +131,9 @@ class EventHub:
     def reconnect(self):
         self.event_occured(ImportantEvent(ImportantEvent.RECONNECT, None))
 
+    def reconcile(self, details):
+        self.event_occured(ImportantEvent(ImportantEvent.RECONCILE, details))
+
 #client
 #log
 
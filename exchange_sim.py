@@ -0,0 +1,377 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import sys
+import time
+from decimal import Decimal
+
+import websockets
+from websockets import ConnectionClosed
+
+from mm.cex_serialization import serialize_side, deserialize_side
+from mm.matching import MatchingEngine
+from posmath.side import Side
+
+CLIENT = 'client'
+MARKET = 'market'
+SATOSHI = 100000000
+
+
+class SimConfig:
+    def __init__(self, dict):
+        self.host = dict.get('host', 'localhost')
+        self.port = dict.get('port', 8765)
+        self.key = dict.get('key')
+        self.secret = dict.get('secret')
+        self.crypto = dict.get('crypto', 'BTC')
+        self.currency = dict.get('currency', 'USD')
+        self.balance = {self.crypto: Decimal(dict.get('crypto_balance', '1')),
+                        self.currency: Decimal(dict.get('currency_balance', '10000'))}
+        self.start_price = Decimal(dict.get('start_price', '1000'))
+        self.tick_size = Decimal(dict.get('tick_size', '0.0001'))
+        self.level_step = Decimal(dict.get('level_step', '0.05'))
+        self.levels = int(dict.get('levels', 30))
+        self.max_level_size = Decimal(dict.get('max_level_size', '2'))
+        self.volatility = Decimal(dict.get('volatility', '0.02'))
+        self.taker_probability = float(dict.get('taker_probability', 0.1))
+        self.md_interval = float(dict.get('md_interval_ms', 100)) / 1000
+        self.ping_interval = float(dict.get('ping_interval', 15))
+        self.latency = float(dict.get('latency_ms', 0)) / 1000
+        self.jitter = float(dict.get('jitter_ms', 0)) / 1000
+        self.rate_limit = float(dict.get('rate_limit', 10))
+        self.rate_burst = float(dict.get('rate_burst', 20))
+        self.md_drop_probability = float(dict.get('md_drop_probability', 0))
+        self.error_probability = float(dict.get('error_probability', 0))
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_time = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Session:
+    def __init__(self, websocket, config: SimConfig):
+        self.websocket = websocket
+        self.config = config
+        self.authenticated = False
+        self.subscribed = False
+        self.depth = 10
+        self.bucket = TokenBucket(config.rate_limit, config.rate_burst)
+        self.inbound = asyncio.Queue()
+        self.outbound = asyncio.Queue()
+        self.inbound_at = 0
+        self.outbound_at = 0
+
+    def delay(self, last):
+        # delivery times never go backwards so frames keep their order on the simulated link
+        return max(last, time.monotonic() + self.config.latency + random.uniform(0, self.config.jitter))
+
+    def send(self, msg):
+        self.outbound_at = self.delay(self.outbound_at)
+        self.outbound.put_nowait((self.outbound_at, json.dumps(msg)))
+
+    def receive(self, data):
+        self.inbound_at = self.delay(self.inbound_at)
+        self.inbound.put_nowait((self.inbound_at, data))
+
+    async def run_sender(self):
+        while True:
+            deliver_at, data = await self.outbound.get()
+            delay = deliver_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.websocket.send(data)
+
+
+def timestamp_ms():
+    return int(1000 * time.time())
+
+
+def error(event, oid, descr):
+    return {'e': event, 'oid': oid, 'ok': 'error', 'data': {'error': descr}}
+
+
+class ExchangeSim:
+    def __init__(self, config: SimConfig):
+        self.config = config
+        self.engine = MatchingEngine()
+        self.sessions = set()
+        self.owners = {}
+        self.balance = dict(config.balance)
+        self.mid = config.start_price
+        self.market_orders = []
+        self.md_id = 0
+
+    def pair(self):
+        return self.config.crypto + ':' + self.config.currency
+
+    def available(self):
+        reserved = {self.config.crypto: Decimal('0'), self.config.currency: Decimal('0')}
+        for order in self.engine.orders.values():
+            if order.owner == CLIENT:
+                if order.side == Side.BID:
+                    reserved[self.config.currency] += order.remains * order.price
+                else:
+                    reserved[self.config.crypto] += order.remains
+        return {k: v - reserved[k] for k, v in self.balance.items()}
+
+    def has_funds(self, side, price, amount):
+        available = self.available()
+        if side == Side.BID:
+            return available[self.config.currency] >= price * amount
+        return available[self.config.crypto] >= amount
+
+    def authenticate(self, msg):
+        if self.config.key is None:
+            return True
+        auth = msg['auth']
+        string = "{}{}".format(auth['timestamp'], self.config.key)
+        signature = hmac.new(self.config.secret.encode(), string.encode(), hashlib.sha256).hexdigest()
+        return auth['key'] == self.config.key and auth['signature'] == signature
+
+    def on_message(self, session: Session, msg):
+        event = msg.get('e')
+        oid = msg.get('oid')
+        if event == 'auth':
+            session.authenticated = self.authenticate(msg)
+            if session.authenticated:
+                # orders outlive the connection that placed them, like on the venue
+                for order_id, owner in self.owners.items():
+                    if owner not in self.sessions:
+                        self.owners[order_id] = session
+                session.send({'e': 'auth', 'ok': 'ok', 'data': {'ok': 'ok'}, 'timestamp': int(time.time())})
+            else:
+                session.send({'e': 'auth', 'ok': 'error', 'data': {'error': 'Invalid signature'}})
+        elif event == 'pong':
+            pass
+        elif not session.authenticated:
+            session.send(error(event, oid, 'Please Login'))
+        elif event == 'order-book-subscribe':
+            session.subscribed = True
+            session.depth = msg['data'].get('depth', 10)
+            session.send({'e': 'order-book-subscribe', 'oid': oid, 'ok': 'ok',
+                          'data': {'timestamp': int(time.time()), 'pair': self.pair(), 'id': self.md_id,
+                                   'bids': self.serialize_depth(Side.BID, session.depth),
+                                   'asks': self.serialize_depth(Side.ASK, session.depth)}})
+        elif event == 'order-book-unsubscribe':
+            session.subscribed = False
+            session.send({'e': 'order-book-unsubscribe', 'oid': oid, 'ok': 'ok', 'data': {'pair': self.pair()}})
+        elif event == 'get-balance':
+            session.send({'e': 'get-balance', 'oid': oid, 'ok': 'ok',
+                          'data': {'time': timestamp_ms(),
+                                   'balance': {k: str(v) for k, v in self.balance.items()},
+                                   'obalance': {k: str(self.balance[k] - v) for k, v in self.available().items()}}})
+        elif event == 'open-orders':
+            session.send({'e': 'open-orders', 'oid': oid, 'ok': 'ok',
+                          'data': [self.serialize_order(o) for o in self.engine.orders.values() if o.owner == CLIENT]})
+        elif event in ['place-order', 'cancel-replace-order', 'cancel-order', 'cancel-orders']:
+            if not session.bucket.take():
+                session.send(error(event, oid, 'Rate limit exceeded'))
+            elif random.random() < self.config.error_probability:
+                session.send(error(event, oid, 'Error: Internal error'))
+            elif event == 'place-order':
+                self.place_order(session, msg)
+            elif event == 'cancel-replace-order':
+                self.replace_order(session, msg)
+            elif event == 'cancel-orders':
+                self.cancel_orders(session, msg)
+            else:
+                self.cancel_order(session, msg)
+            self.publish()
+        else:
+            session.send(error(event, oid, 'Unknown event'))
+
+    def serialize_depth(self, side, depth):
+        return [[float(price), float(size)] for price, size in self.engine.depth(side, depth)]
+
+    def serialize_order(self, order):
+        return {'id': order.order_id, 'time': timestamp_ms(), 'type': serialize_side(order.side),
+                'price': str(order.price), 'amount': str(order.amount), 'pending': str(order.remains)}
+
+    def new_client_order(self, session, event, oid, data):
+        side = deserialize_side(data['type'])
+        price = Decimal(str(data['price']))
+        amount = Decimal(str(data['amount']))
+        if not self.has_funds(side, price, amount):
+            session.send(error(event, oid, 'Error: Place order error: Insufficient funds.'))
+            return None, []
+        order, fills = self.engine.place(side, price, amount, CLIENT)
+        self.owners[order.order_id] = session
+        session.send({'e': event, 'oid': oid, 'ok': 'ok',
+                      'data': {'id': order.order_id, 'time': timestamp_ms(), 'complete': False,
+                               'pending': str(amount), 'amount': str(amount), 'type': data['type'],
+                               'price': str(price)}})
+        return order, fills
+
+    def place_order(self, session, msg):
+        order, fills = self.new_client_order(session, 'place-order', msg['oid'], msg['data'])
+        self.on_fills(fills)
+
+    def replace_order(self, session, msg):
+        data = msg['data']
+        old = self.engine.orders.get(str(data['order_id']))
+        if old is None or old.owner != CLIENT:
+            session.send(error('cancel-replace-order', msg['oid'], 'Error: Order not found'))
+            return
+        self.engine.cancel(old.order_id)
+        order, fills = self.new_client_order(session, 'cancel-replace-order', msg['oid'], data)
+        if order is None:
+            self.engine.rest(old)
+            return
+        self.send_order_event(old, cancel=True)
+        self.on_fills(fills)
+
+    def cancel_order(self, session, msg):
+        order_id = str(msg['data']['order_id'])
+        order = self.engine.orders.get(order_id)
+        if order is None or order.owner != CLIENT:
+            session.send(error('cancel-order', msg['oid'], 'Error: Order not found'))
+            return
+        self.engine.cancel(order_id)
+        session.send({'e': 'cancel-order', 'oid': msg['oid'], 'ok': 'ok',
+                      'data': {'order_id': order_id, 'time': timestamp_ms()}})
+        self.send_order_event(order, cancel=True)
+
+    def cancel_orders(self, session, msg):
+        orders = [order for order in self.engine.orders.values()
+                  if order.owner == CLIENT and self.owners.get(order.order_id) is session]
+        for order in orders:
+            self.engine.cancel(order.order_id)
+        session.send({'e': 'cancel-orders', 'oid': msg['oid'], 'ok': 'ok',
+                      'data': {'cancelled_order_ids': [order.order_id for order in orders], 'time': timestamp_ms()}})
+        for order in orders:
+            self.send_order_event(order, cancel=True)
+
+    def send_order_event(self, order, cancel=False):
+        session = self.owners.get(order.order_id)
+        if session is None:
+            return
+        data = {'id': order.order_id, 'remains': str(int(order.remains * SATOSHI)), 'pair': self.pair()}
+        if cancel:
+            data['cancel'] = True
+        session.send({'e': 'order', 'data': data})
+        if cancel or order.remains == 0:
+            del self.owners[order.order_id]
+
+    def on_fills(self, fills):
+        for fill in fills:
+            for order in [fill.maker, fill.taker]:
+                if order.owner != CLIENT:
+                    continue
+                sign = Side.sign(order.side)
+                self.balance[self.config.crypto] += sign * fill.amount
+                self.balance[self.config.currency] -= sign * fill.amount * fill.price
+                session = self.owners.get(order.order_id)
+                if session is not None:
+                    session.send({'e': 'tx', 'data': {'order': order.order_id, 'type': serialize_side(order.side),
+                                                      'price': str(fill.price), 'amount': str(fill.amount),
+                                                      'symbol': self.config.crypto, 'time': timestamp_ms()}})
+                self.send_order_event(order)
+
+    def publish(self):
+        changes = self.engine.pop_changes()
+        if len(changes.bid()) == 0 and len(changes.ask()) == 0:
+            return
+        self.md_id += 1
+        msg = {'e': 'md_update',
+               'data': {'id': self.md_id, 'pair': self.pair(), 'time': timestamp_ms(),
+                        'bids': [[float(p), float(s)] for p, s in changes.bid()],
+                        'asks': [[float(p), float(s)] for p, s in changes.ask()]}}
+        for session in self.sessions:
+            if session.subscribed and random.random() >= self.config.md_drop_probability:
+                session.send(msg)
+
+    def market_step(self):
+        cfg = self.config
+        self.mid += Decimal(random.gauss(0, 1)) * cfg.volatility
+        self.mid = self.mid.quantize(cfg.tick_size)
+
+        self.market_orders = [o for o in self.market_orders if o.order_id in self.engine.orders]
+        for order in list(self.market_orders):
+            if abs(order.price - self.mid) > cfg.level_step * cfg.levels or random.random() < 0.05:
+                self.engine.cancel(order.order_id)
+                self.market_orders.remove(order)
+
+        while len(self.market_orders) < 2 * cfg.levels:
+            side = random.choice(Side.sides)
+            distance = cfg.level_step * random.randint(1, cfg.levels)
+            price = (self.mid - Side.sign(side) * distance).quantize(cfg.tick_size)
+            size = (cfg.max_level_size * Decimal(random.random())).quantize(Decimal('0.00000001'))
+            if size == 0:
+                continue
+            order, fills = self.engine.place(side, price, size, MARKET)
+            self.on_fills(fills)
+            if order.order_id in self.engine.orders:
+                self.market_orders.append(order)
+
+        if random.random() < cfg.taker_probability:
+            size = (cfg.max_level_size * Decimal(random.random())).quantize(Decimal('0.00000001'))
+            order, fills = self.engine.place(random.choice(Side.sides), None, size, MARKET)
+            self.on_fills(fills)
+
+        self.publish()
+
+    async def market(self):
+        while True:
+            self.market_step()
+            await asyncio.sleep(self.config.md_interval)
+
+    async def process(self, session: Session):
+        while True:
+            process_at, data = await session.inbound.get()
+            delay = process_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.on_message(session, json.loads(data))
+
+    async def ping(self, session: Session):
+        while True:
+            await asyncio.sleep(self.config.ping_interval)
+            session.send({'e': 'ping', 'time': timestamp_ms()})
+
+    async def handler(self, websocket, path):
+        session = Session(websocket, self.config)
+        self.sessions.add(session)
+        tasks = [asyncio.ensure_future(session.run_sender()),
+                 asyncio.ensure_future(self.process(session)),
+                 asyncio.ensure_future(self.ping(session))]
+        session.send({'e': 'connected'})
+        try:
+            while True:
+                session.receive(await websocket.recv())
+        except ConnectionClosed:
+            pass
+        finally:
+            self.sessions.discard(session)
+            for task in tasks:
+                task.cancel()
+
+
+def load_sim_config(config_file):
+    with open(config_file, 'r') as f:
+        return SimConfig(json.load(f))
+
+
+if __name__ == '__main__':
+    config = load_sim_config(sys.argv[1]) if len(sys.argv) > 1 else SimConfig({})
+    sim = ExchangeSim(config)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(asyncio.gather(
+        websockets.serve(sim.handler, config.host, config.port),
+        sim.market(),
+    ))
+    loop.run_forever()
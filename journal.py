@@ -0,0 +1,256 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from decimal import Decimal
+
+from mm.orders import OrderManager, Order, OrderStatus, NewReq, ReplaceReq, CancelReq, CancelAllReq, Ack, Replaced, \
+    Cancelled, CancelledAll, Exec, ErrorRequest, UnknownOid, UnknownOrderId, UnknownExec, NegativeAmountAfterExec
+from mm.pnl import PNL
+from posmath.position import Position
+
+
+class Journal:
+    # Append-only record of order requests, venue answers and PNL changes in a memory-mapped file.
+    # Each record is a <length, crc32> header followed by compact JSON. The header is written last, so a
+    # record torn by a crash reads as zero length and replay stops there. Pages belong to the kernel as soon
+    # as they are written, a crash of the process loses nothing; flush() only matters for the machine going down.
+    # Once restored, compact_if_due() starts the journal over from a snapshot whenever it passed max_size, so a
+    # restart never replays much more than that, however long the session ran. It's called between ticks, not from
+    # append(), which runs on the way to sending a request.
+    HEADER = struct.Struct('<II')
+    GROW = 1 << 20
+    MAX_SIZE = 4 << 20
+
+    def __init__(self, filename, max_size=MAX_SIZE):
+        self.filename = filename
+        self.max_size = max_size
+        self.restored = None
+        self.compactions = 0
+        self.open()
+
+    def open(self):
+        self.file = open(self.filename, 'r+b' if os.path.exists(self.filename) else 'w+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(Journal.GROW)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        for data in self.frames():
+            pass
+
+    def frames(self):
+        # also leaves offset right after the last good record, that's where appending goes on
+        self.offset = 0
+        self.records = 0
+        while self.offset + Journal.HEADER.size <= len(self.map):
+            length, crc = Journal.HEADER.unpack_from(self.map, self.offset)
+            start = self.offset + Journal.HEADER.size
+            data = self.map[start:start + length]
+            if length == 0 or len(data) != length or zlib.crc32(data) != crc:
+                return
+            self.offset = start + length
+            self.records += 1
+            yield data
+
+    def read(self):
+        for data in self.frames():
+            yield json.loads(data)
+
+    def append(self, record):
+        data = json.dumps(record, separators=(',', ':')).encode()
+        end = self.offset + Journal.HEADER.size + len(data)
+        # room for a zero header after the record, it marks the end
+        if end + Journal.HEADER.size > len(self.map):
+            self.grow(end + Journal.HEADER.size)
+        self.map[self.offset + Journal.HEADER.size:end] = data
+        Journal.HEADER.pack_into(self.map, self.offset, len(data), zlib.crc32(data))
+        self.offset = end
+        self.records += 1
+
+    def grow(self, needed):
+        size = len(self.map)
+        while size < needed:
+            size *= 2
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def request(self, req):
+        self.append(encode_request(req))
+
+    def event(self, ev):
+        self.append(encode_event(ev))
+
+    def pnl(self, pnl: PNL):
+        self.append({'r': 'pnl', 'pos': str(pnl.pos.position()), 'balance': str(pnl.pos.balance),
+                     'closed_pnl': str(pnl.closed_pnl)})
+
+    def restore(self, om: OrderManager, pnl: PNL):
+        # rebuilds orders and position, then starts the file over from a snapshot of them
+        for record in self.read():
+            kind = record['r']
+            if kind == 'snapshot':
+                restore_snapshot(record, om, pnl)
+            elif kind == 'pnl':
+                restore_pnl(record, pnl)
+            elif kind in REQUESTS:
+                om.restore_request(decode_request(record))
+            else:
+                ev = decode_event(record)
+                if type(ev) == ErrorRequest and ev.oid not in om.by_oid:
+                    continue
+                try:
+                    om.market_event(ev)
+                except (UnknownOid, UnknownOrderId, UnknownExec, NegativeAmountAfterExec):
+                    # the engine raised the same when the event first came in
+                    pass
+        replayed = self.records
+        om.restarted()
+        self.compact(om, pnl)
+        self.restored = (om, pnl)
+        return replayed
+
+    def compact_if_due(self):
+        if self.offset > self.max_size and self.restored is not None:
+            self.compact(*self.restored)
+            return True
+        return False
+
+    def compact(self, om: OrderManager, pnl: PNL):
+        tmp_name = self.filename + '.tmp'
+        if os.path.exists(tmp_name):
+            # left over from a crash while compacting, the journal itself is still whole
+            os.remove(tmp_name)
+        tmp = Journal(tmp_name)
+        tmp.append(snapshot(om, pnl))
+        # the snapshot is on disk before it replaces the journal, and the rename is before anything goes after it
+        tmp.sync()
+        tmp.close()
+        self.close()
+        os.replace(tmp_name, self.filename)
+        sync_dir(self.filename)
+        self.open()
+        self.compactions += 1
+
+    def flush(self):
+        self.map.flush()
+
+    def sync(self):
+        self.map.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+REQUESTS = ['new', 'replace', 'cancel', 'cancel_all']
+
+
+def sync_dir(filename):
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def encode_request(req):
+    type_req = type(req)
+    if type_req == CancelAllReq:
+        return {'r': 'cancel_all', 'oid': req.oid}
+    record = {'r': 'cancel', 'oid': req.oid, 'side': req.side, 'order_id': req.order_id}
+    if type_req == NewReq:
+        record['r'] = 'new'
+    elif type_req == ReplaceReq:
+        record['r'] = 'replace'
+    if type_req != CancelReq:
+        record['price'] = str(req.price)
+        record['size'] = str(req.size)
+    return record
+
+
+def decode_request(record):
+    kind = record['r']
+    if kind == 'cancel_all':
+        req = CancelAllReq()
+    elif kind == 'new':
+        req = NewReq(record['side'], Decimal(record['price']), Decimal(record['size']))
+    elif kind == 'replace':
+        req = ReplaceReq(record['side'], record['order_id'], Decimal(record['price']), Decimal(record['size']))
+    else:
+        req = CancelReq(record['side'], record['order_id'])
+    req.oid = record['oid']
+    return req
+
+
+def encode_event(ev):
+    type_ev = type(ev)
+    if type_ev == ErrorRequest:
+        return {'r': 'error', 'oid': ev.oid, 'descr': ev.descr, 'error_class': ev.error_class}
+    elif type_ev == Exec:
+        return {'r': 'exec', 'oid': ev.oid, 'order_id': ev.order_id, 'remains': str(ev.remains)}
+    elif type_ev == CancelledAll:
+        return {'r': 'cancelled_all', 'oid': ev.oid, 'order_ids': ev.order_ids}
+    elif type_ev == Cancelled:
+        return {'r': 'cancelled', 'oid': ev.oid, 'order_id': ev.order_id}
+    record = {'r': 'ack', 'oid': ev.oid, 'order_id': ev.order_id, 'pending': str(ev.pending),
+              'amount': str(ev.amount)}
+    if type_ev == Replaced:
+        record['r'] = 'replaced'
+        record['price'] = str(ev.price)
+    return record
+
+
+def decode_event(record):
+    kind = record['r']
+    if kind == 'error':
+        return ErrorRequest(record['oid'], record['descr'], record['error_class'])
+    elif kind == 'exec':
+        return Exec(Decimal(record['remains']), record['order_id'], record['oid'])
+    elif kind == 'cancelled_all':
+        return CancelledAll(record['oid'], record['order_ids'])
+    elif kind == 'cancelled':
+        return Cancelled(record['oid'], record['order_id'])
+    elif kind == 'replaced':
+        return Replaced(record['oid'], record['order_id'], Decimal(record['pending']), Decimal(record['amount']),
+                        Decimal(record['price']))
+    return Ack(record['oid'], record['order_id'], Decimal(record['pending']), Decimal(record['amount']))
+
+
+def snapshot(om: OrderManager, pnl: PNL):
+    orders = [{'order_id': order.order_id, 'side': order.side, 'price': str(order.price),
+               'amount': str(order.amount), 'pending': str(order.pending)}
+              for order in om.by_order_id.values() if order.status != OrderStatus.COMPLETED]
+    # requests still waiting for an answer, which may come right after the snapshot
+    in_flight = [{'oid': oid, 'order_id': order.order_id, 'side': order.side, 'price': str(order.price),
+                  'amount': str(order.amount)}
+                 for oid, order in om.by_oid.items() if order.status != OrderStatus.COMPLETED]
+    return {'r': 'snapshot', 'orders': orders, 'in_flight': in_flight, 'pos': str(pnl.pos.position()),
+            'balance': str(pnl.pos.balance), 'closed_pnl': str(pnl.closed_pnl)}
+
+
+def restore_snapshot(record, om: OrderManager, pnl: PNL):
+    om.by_order_id.clear()
+    om.by_oid.clear()
+    for fields in record['orders']:
+        order = Order(fields['side'], Decimal(fields['price']), Decimal(fields['amount']))
+        order.order_id = fields['order_id']
+        order.pending = Decimal(fields['pending'])
+        order.status = OrderStatus.ACK
+        om.by_order_id[order.order_id] = order
+    for fields in record.get('in_flight', []):
+        if fields['order_id'] in om.by_order_id:
+            order = om.by_order_id[fields['order_id']]
+            order.status = OrderStatus.REQ_SENT
+        else:
+            order = Order(fields['side'], Decimal(fields['price']), Decimal(fields['amount']))
+        om.by_oid[fields['oid']] = order
+    restore_pnl(record, pnl)
+
+
+def restore_pnl(record, pnl: PNL):
+    pnl.pos = Position(pos=Decimal(record['pos']), balance=Decimal(record['balance']))
+    pnl.closed_pnl = Decimal(record['closed_pnl'])
+    pnl.version += 1
@@ -0,0 +1,185 @@
+import time
+from collections import deque
+
+
+class LatencyHistogram:
+    # log-linear buckets: exact below 16ns, then 8 sub-buckets per power of two (~12% resolution)
+    SUB_BITS = 3
+    BUCKETS = 16 + 8 * 60
+
+    def __init__(self):
+        self.counts = [0] * LatencyHistogram.BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        if value < 16:
+            return value
+        shift = value.bit_length() - 1 - LatencyHistogram.SUB_BITS
+        return 16 + (shift - 1) * 8 + (value >> shift) - 8
+
+    @staticmethod
+    def bucket_top(index):
+        if index < 16:
+            return index
+        shift = (index - 16) // 8 + 1
+        return (((index - 16) % 8 + 8 + 1) << shift) - 1
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        self.counts[LatencyHistogram.bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, perc):
+        if self.count == 0:
+            return 0
+        rank = perc / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count > 0 and seen >= rank:
+                return min(LatencyHistogram.bucket_top(index), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * LatencyHistogram.BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def summary(self):
+        # microseconds
+        return {'count': self.count,
+                'p50': self.percentile(50) / 1000,
+                'p99': self.percentile(99) / 1000,
+                'max': self.max / 1000,
+                'mean': self.total / self.count / 1000 if self.count > 0 else 0}
+
+
+class TickToTrade:
+    RECV = 0
+    TICK = 1
+    PARSED = 2
+    BOOK = 3
+    STRATEGY = 4
+
+    # wait is how long the first frame of a burst sat read but unprocessed
+    STAGES = [('wait', RECV, TICK),
+              ('parse', TICK, PARSED),
+              ('book', PARSED, BOOK),
+              ('strategy', BOOK, STRATEGY)]
+    OUTBOUND_STAGES = ['queue', 'serialize', 'send', 'tick_to_trade']
+
+    def __init__(self):
+        self.stamps = [0] * 5
+        self.histograms = {name: LatencyHistogram()
+                           for name in [name for name, start, end in TickToTrade.STAGES] + TickToTrade.OUTBOUND_STAGES}
+
+    def start(self, received=None):
+        # received is when the reader got the frame, everything after that counts
+        stamps = self.stamps
+        for i in range(2, 5):
+            stamps[i] = 0
+        stamps[TickToTrade.TICK] = time.perf_counter_ns()
+        stamps[TickToTrade.RECV] = stamps[TickToTrade.TICK] if received is None else received
+
+    def mark(self, stage):
+        self.stamps[stage] = time.perf_counter_ns()
+
+    def origin(self):
+        return self.stamps[TickToTrade.RECV]
+
+    def finish(self):
+        stamps = self.stamps
+        if stamps[TickToTrade.RECV] == 0:
+            return
+        for name, start, end in TickToTrade.STAGES:
+            if stamps[start] != 0 and stamps[end] != 0:
+                self.histograms[name].record(stamps[end] - stamps[start])
+        stamps[TickToTrade.RECV] = 0
+
+    def outbound(self, origin, submitted, dequeued, serialized, sent):
+        histograms = self.histograms
+        histograms['queue'].record(dequeued - submitted)
+        histograms['serialize'].record(serialized - dequeued)
+        histograms['send'].record(sent - serialized)
+        if origin != 0:
+            histograms['tick_to_trade'].record(sent - origin)
+
+    def summary(self):
+        return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+
+class RollingLatency:
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def summary(self):
+        # microseconds, percentiles over the last `window` samples
+        if len(self.samples) == 0:
+            return {'count': self.count, 'p50': 0, 'p99': 0, 'max': 0}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {'count': self.count,
+                'p50': ordered[int(last * 0.5)] / 1000,
+                'p99': ordered[int(last * 0.99)] / 1000,
+                'max': ordered[last] / 1000}
+
+
+class RoundTrips:
+    def __init__(self, window=1000):
+        self.window = window
+        self.in_flight = {}
+        self.by_request = {}
+        self.by_error = {}
+
+    def sent(self, oid, kind):
+        self.in_flight[oid] = (kind, time.perf_counter_ns())
+
+    def acknowledged(self, oid, error_class=None):
+        sent = self.in_flight.pop(oid, None)
+        if sent is None:
+            return None
+        kind, sent_time = sent
+        rtt = time.perf_counter_ns() - sent_time
+        stats = self.by_request if error_class is None else self.by_error
+        key = kind if error_class is None else error_class
+        if key not in stats:
+            stats[key] = RollingLatency(self.window)
+        stats[key].record(rtt)
+        return rtt
+
+    def forget(self):
+        self.in_flight.clear()
+
+    def summary(self):
+        return {'requests': {k: v.summary() for k, v in self.by_request.items()},
+                'errors': {k: v.summary() for k, v in self.by_error.items()},
+                'in_flight': len(self.in_flight)}
+
+
+class Conflation:
+    def __init__(self):
+        self.updates = 0
+        self.bursts = 0
+        self.max_burst = 0
+
+    def burst(self, updates):
+        self.updates += updates
+        self.bursts += 1
+        self.max_burst = max(self.max_burst, updates)
+
+    def summary(self):
+        return {'updates': self.updates, 'bursts': self.bursts, 'conflated': self.updates - self.bursts,
+                'max_burst': self.max_burst}
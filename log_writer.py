@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import deque
+
+
+class LogWriter:
+    # Formatting and file writes happen on a background thread, callers only append to a bounded buffer.
+    # Lines are written in batches, when batch_size of them are waiting or flush_interval seconds have passed.
+    def __init__(self, filename, max_pending=10000, batch_size=256, flush_interval=0.5):
+        self.filename = filename
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # deque append and popleft are atomic, so the buffer needs no lock
+        self.pending = deque()
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.write_time = 0.0
+        self.closed = False
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def log(self, fmt, *args):
+        if self.closed or len(self.pending) >= self.max_pending:
+            # a slow disk loses log lines rather than stalling the caller
+            self.dropped += 1
+            return
+        self.pending.append((fmt, args))
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    def run(self):
+        with open(self.filename, 'a') as f:
+            while not self.closed:
+                self.wakeup.wait(self.flush_interval)
+                self.wakeup.clear()
+                self.write(f)
+            self.write(f)
+
+    def write(self, f):
+        while len(self.pending) > 0:
+            started = time.perf_counter()
+            lines = []
+            while len(self.pending) > 0 and len(lines) < self.batch_size:
+                fmt, args = self.pending.popleft()
+                lines.append((fmt % args if len(args) > 0 else str(fmt)).replace('\n', ' '))
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            self.written += len(lines)
+            self.batches += 1
+            self.write_time += time.perf_counter() - started
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.wakeup.set()
+            self.thread.join()
+
+    def summary(self):
+        return {'pending': len(self.pending), 'written': self.written, 'batches': self.batches,
+                'dropped': self.dropped, 'write_time': round(self.write_time, 6)}
@@ -5,7 +5,9 @@ import time
 from mm.app_config import AppConfig, MarketmakerConfig, VenueConfig
 
 from mm.order_algos import price_on_a_depth, enter_ema, ema_constraint
+from mm.book import BipolarContainer
 from mm.event_hub import ImportantEvent
+from mm.memo import Memo
 from mm.order_algos import stop_loss_exit_strategy
 from mm.orders import RiskManager, OrderStatus
 from mm.new_approach import enter_hedge, bound_price_to_lower_quote, HedgeConfig
@@ -25,15 +27,17 @@ class Marketmaker:
         self.engine = engine
         self.config: HedgeConfig = self.engine.config.algo
         self.venue_config: VenueConfig = self.engine.config.venue
+        self.hedges = BipolarContainer(Memo(enter_hedge), Memo(enter_hedge))
+        # inputs the last tick ran against, None when it has to run again regardless
+        self.tick_key = None
+        self.skipped_ticks = 0
         # engine.book.quote_subscribers.append(self)
 
     def book_is_valid(self):
-        bid_quote = self.engine.book.quote(Side.BID)
-        ask_quote = self.engine.book.quote(Side.ASK)
-        return bid_quote is not None \
-               and ask_quote is not None \
-               and min(bid_quote.volume(), ask_quote.volume()) >= self.config.liq_behind.bid() \
-               and min(bid_quote.levels(), ask_quote.levels()) > self.config.min_levels
+        book = self.engine.book
+        return book.is_valid() \
+               and book.units.to_size(min(book.volume(Side.BID), book.volume(Side.ASK))) >= self.config.liq_behind.bid() \
+               and min(book.levels(Side.BID), book.levels(Side.ASK)) > self.config.min_levels
 
     def no_orders_for_tag(self, tag):
         bo = self.engine.execution.order(tag, Side.BID)
@@ -41,45 +45,50 @@ class Marketmaker:
         return (bo is None or bo.status == OrderStatus.COMPLETED) \
                and (so is None or so.status == OrderStatus.COMPLETED)
 
-    def price_changed(self, tag, side, new_price, size):
-        order = self.engine.execution.order(tag, side)
-        if order is None or order.status == OrderStatus.COMPLETED:
-            return True
+    def budget(self):
+        # requests made during this tick haven't reached the outbound queue yet
+        return max(0, int(self.engine.rate_limiter.budget()) - len(self.engine.order_manager.request_queue))
 
-        if order.amount != size:
-            return True
-
-        return abs(order.price - new_price) > self.config.price_tolerance
+    def ladder(self, pos):
+        if pos.abs_position() == 0:
+            return []
+        step = -Side.sign(pos.side()) * self.config.level_spacing
+        return [(pos.price() + i * step, pos.abs_position()) for i in range(0, self.config.quote_levels)]
 
     def place_pos(self, pos):
-        tag = Marketmaker.ENTER_TAG
-        changed = self.price_changed(Marketmaker.ENTER_TAG, pos.side(), pos.price(), pos.abs_position())
-        if pos.abs_position() != 0 and changed:
-            self.engine.execution.request(
-                tag=tag,
-                side=pos.side(),
-                price=pos.price(),
-                size=pos.abs_position()
-            )
-        elif pos.abs_position() == 0:
-            self.engine.execution.cancel(tag, pos.side())
+        return self.engine.execution.reconcile(pos.side(), self.ladder(pos), self.config.price_tolerance,
+                                               self.config.min_requote_interval, self.budget())
 
     def hedge_step(self):
         pnl = self.engine.pnl
+        held = 0
         for side in Side.sides:
-            pos, method = enter_hedge(pnl, self.engine.book, side, self.config, self.venue_config)
-            self.place_pos(pos)
+            key = (self.engine.book.version, pnl.state_version())
+            pos, method = self.hedges.side(side)(key, pnl, self.engine.book, side, self.config, self.venue_config)
+            held += self.place_pos(pos)
 
             if side != pnl.position_side() and pnl.pos.position() != 0:
                 self.engine.pnl.update_open_pnl(pos.price())
             pnl.set_order_method(side, method)
+        return held
+
+    def tick_inputs(self):
+        engine = self.engine
+        return engine.rm.status, engine.book.version, engine.pnl.state_version(), engine.order_manager.version
 
     def on_tick(self):
+        if self.tick_key is not None and self.tick_key == self.tick_inputs():
+            # nothing moved since the last tick, it would come up with the same quotes
+            self.skipped_ticks += 1
+            return
         risk_status = self.engine.rm.status
+        held = 0
         if risk_status == RiskManager.CANCEL_ALL or not self.book_is_valid():
             self.engine.execution.cancel_all()
         else:
-            self.hedge_step()
+            held = self.hedge_step()
+        # quotes held back by the rate limit or min_requote_interval get retried on the next tick
+        self.tick_key = self.tick_inputs() if held == 0 else None
 
 
     def on_md(self):
@@ -93,5 +102,6 @@ class Marketmaker:
     def important_event(self, ev: ImportantEvent):
         if ev.event_name == ImportantEvent.GAP:
             for side in Side.sides:
+                self.engine.execution.reconcile(side, [], self.config.price_tolerance)
                 self.engine.execution.cancel(Marketmaker.ENTER_TAG, side)
                 self.engine.execution.cancel(Marketmaker.EXIT_TAG, side)
@@ -0,0 +1,110 @@
+from bisect import bisect_left
+from collections import deque
+
+from mm.book import BipolarContainer, SortedBook
+from posmath.side import Side
+
+
+class SimOrder:
+    def __init__(self, order_id, side, price, amount, owner):
+        self.order_id = order_id
+        self.side = side
+        self.price = price
+        self.amount = amount
+        self.remains = amount
+        self.owner = owner
+
+
+class Fill:
+    def __init__(self, maker: SimOrder, taker: SimOrder, price, amount):
+        self.maker = maker
+        self.taker = taker
+        self.price = price
+        self.amount = amount
+
+
+class MatchingEngine:
+    def __init__(self, first_order_id=1000):
+        self.queues = BipolarContainer({}, {})
+        self.keys = BipolarContainer([], [])
+        self.orders = {}
+        self.next_order_id = first_order_id
+        self.changed = BipolarContainer(set(), set())
+
+    def best_price(self, side):
+        keys = self.keys.side(side)
+        return None if len(keys) == 0 else SortedBook.sort_key(side, keys[0])
+
+    def level_size(self, side, price):
+        queue = self.queues.side(side).get(price)
+        return 0 if queue is None else sum([o.remains for o in queue])
+
+    def depth(self, side, levels):
+        return [[SortedBook.sort_key(side, key), self.level_size(side, SortedBook.sort_key(side, key))]
+                for key in self.keys.side(side)[:levels]]
+
+    def place(self, side, price, amount, owner):
+        self.next_order_id += 1
+        order = SimOrder(str(self.next_order_id), side, price, amount, owner)
+        fills = self.match(order)
+        if order.remains > 0 and order.price is not None:
+            self.rest(order)
+        return order, fills
+
+    def match(self, taker: SimOrder):
+        fills = []
+        maker_side = Side.opposite(taker.side)
+        sign = Side.sign(taker.side)
+        queues = self.queues.side(maker_side)
+        while taker.remains > 0:
+            best = self.best_price(maker_side)
+            if best is None or (taker.price is not None and sign * taker.price < sign * best):
+                break
+            queue = queues[best]
+            maker = queue[0]
+            amount = min(maker.remains, taker.remains)
+            maker.remains -= amount
+            taker.remains -= amount
+            fills.append(Fill(maker, taker, best, amount))
+            self.changed.side(maker_side).add(best)
+            if maker.remains == 0:
+                queue.popleft()
+                del self.orders[maker.order_id]
+                if len(queue) == 0:
+                    self.remove_level(maker_side, best)
+        return fills
+
+    def rest(self, order: SimOrder):
+        queues = self.queues.side(order.side)
+        if order.price not in queues:
+            keys = self.keys.side(order.side)
+            key = SortedBook.sort_key(order.side, order.price)
+            keys.insert(bisect_left(keys, key), key)
+            queues[order.price] = deque()
+        queues[order.price].append(order)
+        self.orders[order.order_id] = order
+        self.changed.side(order.side).add(order.price)
+
+    def remove_level(self, side, price):
+        keys = self.keys.side(side)
+        del keys[bisect_left(keys, SortedBook.sort_key(side, price))]
+        del self.queues.side(side)[price]
+
+    def cancel(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        queue = self.queues.side(order.side)[order.price]
+        queue.remove(order)
+        if len(queue) == 0:
+            self.remove_level(order.side, order.price)
+        self.changed.side(order.side).add(order.price)
+        return order
+
+    def pop_changes(self):
+        changes = BipolarContainer([], [])
+        for side in Side.sides:
+            for price in sorted(self.changed.side(side), key=lambda p: SortedBook.sort_key(side, p)):
+                changes.side(side).append([price, self.level_size(side, price)])
+            self.changed.side(side).clear()
+        return changes
@@ -19,42 +19,41 @@ class HedgeConfig:
         self.refresh_timeout = Decimal(d['refresh_timeout'])
         self.price_tolerance = Decimal(d['price_tolerance'])
         self.min_levels = Decimal(d['min_levels'])
+        self.quote_levels = int(d.get('quote_levels', 1))
+        self.level_spacing = Decimal(d.get('level_spacing', '0'))
+        self.min_requote_interval = float(d.get('min_requote_interval', 0))
 
 
-def price_on_a_depth(top_quote, size, liq_behind, vc: VenueConfig):
-    quote_array = []
-    quote_liq = Decimal('0')
-    side = top_quote.side
-    liq_adj = liq_behind - size
-    prev_price = Decimal('0')
+def price_on_a_depth(book: Book, side, size, liq_behind, vc: VenueConfig):
+    units = book.units
+    liq_adj = units.from_size(liq_behind - size)
+    index = book.depth_index(side, liq_adj)
+    level = book.nth_level(side, index)
 
-    for quote in top_quote:
-        quote_liq += quote.size
-        quote_array.append((quote.price, quote.size, quote_liq, abs(prev_price - quote.price)))
-        prev_price = quote.price
-        if quote_liq >= liq_adj:
-            break
-
-    last_quote = quote_array[-1]
-    if last_quote[2] > liq_adj:
-        return last_quote[0] + Side.sign(side) * vc.tick_size
+    if book.depth_at(side, index) > liq_adj:
+        return units.to_price(level.price) + Side.sign(side) * vc.tick_size
     else:
-        return last_quote[0]
+        return units.to_price(level.price)
+
 
+def level_at_or_worse(book: Book, side, price):
+    level = book.level(side, price)
+    return level if level is not None else book.worse_level(side, price)
 
-def enter_ema(quote: Level, ema: Decimal, ema_work_perc, vc: VenueConfig):
 
-    sign = Decimal(Side.sign(quote.side))
+def enter_ema(book: Book, side, ema: Decimal, ema_work_perc, vc: VenueConfig):
+    units = book.units
+    sign = Decimal(Side.sign(side))
 
     def calc_ema_price():
         return round(Decimal(ema - sign * (ema / 100 * ema_work_perc)), 4)
 
     def stick_to_quote(price):
-        try:
-            under_price = next((x.price for x in quote if sign * x.price - sign * price <= 0))
-            return under_price + sign * vc.tick_size if under_price != price else under_price
-        except StopIteration:
+        under_level = level_at_or_worse(book, side, units.from_price(price))
+        if under_level is None:
             return price
+        under_price = units.to_price(under_level.price)
+        return under_price + sign * vc.tick_size if under_price != price else under_price
 
     return stick_to_quote(calc_ema_price())
 
@@ -91,29 +90,20 @@ def hedge_positon_size(prior_pos, target_price, hedge_size):
     return Position(price=x, pos=hedge_size, side=prior_pos.side())
 
 
-def bound_pos_to_lower_quote(quote: Level, pos: Position, tick_size):
-    lower_quote_price = bound_price_to_lower_quote(quote, pos.price(), tick_size)
+def bound_pos_to_lower_quote(book: Book, side, pos: Position, tick_size):
+    lower_quote_price = bound_price_to_lower_quote(book, side, pos.price(), tick_size)
     return Position(side=pos.side(), price=lower_quote_price, pos=pos.abs_position())
 
 
-def bound_price_to_lower_quote(quote: Level, price: Decimal, tick_size):
-    def price_equlas_quote():
-        for x in quote:
-            if x.price == price:
-                return True
-        return False
-    if price_equlas_quote():
-        return price
-    try:
-        if quote.side == Side.BID:
-            stick_price = max([x.price for x in quote if x.price < price]) + tick_size
-        else:
-            stick_price = min([x.price for x in quote if x.price > price]) - tick_size
-        return stick_price
-    except ValueError:
+def bound_price_to_lower_quote(book: Book, side, price: Decimal, tick_size):
+    unit_price = book.units.from_price(price)
+    if book.level(side, unit_price) is not None:
         return price
 
-    # return max_quote - tick_size if pos
+    worse_level = book.worse_level(side, unit_price)
+    if worse_level is None:
+        return price
+    return book.units.to_price(worse_level.price) + Side.sign(side) * tick_size
 
 
 def adjusted_size(order_size, order_side, pos):
@@ -125,24 +115,25 @@ def adjusted_size(order_size, order_side, pos):
 
 
 def enter_hedge(pnl: PNL, book: Book, side, cfg: HedgeConfig, vc: VenueConfig):
+    units = book.units
     quote = book.quote(side)
     side = quote.side
     pos = pnl.pos
     order_size = cfg.order_size.side(side)
-    theo = (book.quote(Side.BID).price + book.quote(Side.ASK).price) / 2
+    theo = (units.to_price(book.quote(Side.BID).price) + units.to_price(book.quote(Side.ASK).price)) / 2
     if pos.abs_position() < vc.min_order_size:
         # depth or ema
         order_size = adjusted_size(order_size, side, pos.abs_position())
-        method, price = depth_ema_price(cfg, order_size, pnl, quote, side, vc)
+        method, price = depth_ema_price(cfg, order_size, pnl, book, side, vc)
         return Position(pos=order_size, side=side, price=price), method
     elif Side.opposite(pos.side()) == side and pos.abs_position() >= vc.min_order_size:
         # exit order
         # depth or zero
-        method, price = depth_ema_price(cfg, order_size, pnl, quote, side, vc)
+        method, price = depth_ema_price(cfg, order_size, pnl, book, side, vc)
 
         add_pos = pos.oppoiste_with_price(price)
         min_margin = pos.opposite_with_margin(vc.tick_size)
-        min_margin = bound_pos_to_lower_quote(quote, min_margin, vc.tick_size)
+        min_margin = bound_pos_to_lower_quote(book, side, min_margin, vc.tick_size)
 
         if (pos + add_pos).balance > 0:
             return add_pos, "QUOTE"
@@ -152,7 +143,7 @@ def enter_hedge(pnl: PNL, book: Book, side, cfg: HedgeConfig, vc: VenueConfig):
         #depth
         #hedge
         #order_size = adjusted_size(order_size, side, pos.abs_position())
-        method, price_depth = depth_ema_price(cfg, order_size, pnl, quote, side, vc)
+        method, price_depth = depth_ema_price(cfg, order_size, pnl, book, side, vc)
 
         order_size = min(order_size, cfg.max_pos - pos.abs_position())
         depth_pos = Position(pos=order_size, side=side, price=price_depth)
@@ -161,7 +152,7 @@ def enter_hedge(pnl: PNL, book: Book, side, cfg: HedgeConfig, vc: VenueConfig):
 
         target_price = theo - Side.sign(pos.side()) * theo * cfg.hedge_perc
         hedge_pos = hedge_positon_size(pos, Decimal(target_price), order_size)
-        hedge_pos = bound_pos_to_lower_quote(quote, hedge_pos, vc.tick_size)
+        hedge_pos = bound_pos_to_lower_quote(book, side, hedge_pos, vc.tick_size)
         #return hedge_pos, "HEDGE HEDGE"
         if (side == Side.BID and hedge_pos.price() < depth_pos.price()) \
                 or (side == Side.ASK and hedge_pos.price() > depth_pos.price()):
@@ -182,9 +173,9 @@ def calc_target_price(theo: Decimal, pos: Position, hedge_perc: Decimal):
     return theo_target
 
 
-def depth_ema_price(cfg, order_size, pnl, quote, side, vc):
-    depth_price = price_on_a_depth(quote, order_size, cfg.liq_behind.side(side), vc)
-    ema_price = enter_ema(quote=quote, ema=pnl.ema.calc_ema(), ema_work_perc=cfg.ema_work_perc, vc=vc)
-    ema_price = bound_price_to_lower_quote(quote, ema_price, vc.tick_size)
+def depth_ema_price(cfg, order_size, pnl, book, side, vc):
+    depth_price = price_on_a_depth(book, side, order_size, cfg.liq_behind.side(side), vc)
+    ema_price = enter_ema(book=book, side=side, ema=pnl.ema.calc_ema(), ema_work_perc=cfg.ema_work_perc, vc=vc)
+    ema_price = bound_price_to_lower_quote(book, side, ema_price, vc.tick_size)
     price, method = ema_constraint(depth_price, ema_price, side)
     return method, price
@@ -3,6 +3,7 @@ from decimal import Decimal
 from mm.app_config import MarketmakerConfig, VenueConfig
 from mm.book import Book, Level
 from mm.pnl import PNL
+from mm.units import DECIMAL
 from posmath.position import Position
 from posmath.side import Side
 
@@ -15,7 +16,8 @@ def ema_constraint(depth_price, ema_price, side):
     return (ema_price, "EMA") if delta < 0 else (depth_price, "ENTER")
 
 
-def enter_ema(quote: Level, ema: Decimal, ac: MarketmakerConfig, vc: VenueConfig):
+def enter_ema(quote: Level, ema: Decimal, ac: MarketmakerConfig, vc: VenueConfig, units=DECIMAL):
+    # levels hold book units, units is the book's to read them as prices
 
     sign = Side.sign(quote.side)
 
@@ -24,7 +26,8 @@ def enter_ema(quote: Level, ema: Decimal, ac: MarketmakerConfig, vc: VenueConfig
 
     def stick_to_quote(price):
         try:
-            under_price = next((x.price for x in quote if sign * x.price - sign * price <= 0))
+            under_price = next((units.to_price(x.price) for x in quote
+                                if sign * units.to_price(x.price) - sign * price <= 0))
             return under_price + sign * vc.tick_size if under_price != price else under_price
         except StopIteration:
             return price
@@ -41,35 +44,20 @@ def price_not_better_than(calc_price, ema_price, side):
         return calc_price
 
 
-def price_on_a_depth(top_quote, size, ac: MarketmakerConfig, vc: VenueConfig):
-    quote_array = []
-    quote_liq = Decimal('0')
-    side = top_quote.side
-    liq_adj = ac.liq_behind.side(side) - size
-    prev_price = Decimal('0')
+def price_on_a_depth(book: Book, side, size, ac: MarketmakerConfig, vc: VenueConfig):
+    units = book.units
+    liq_adj = units.from_size(ac.liq_behind.side(side) - size)
+    index = book.depth_index(side, liq_adj)
+    price = units.to_price(book.nth_level(side, index).price)
 
-    for quote in top_quote:
-        quote_liq += quote.size
-        quote_array.append((quote.price, quote.size, quote_liq, abs(prev_price - quote.price)))
-        prev_price = quote.price
-        if quote_liq >= liq_adj:
-            break
-
-    last_quote = quote_array[-1]
-    if last_quote[2] > liq_adj:
-        return last_quote[0] + Side.sign(side) * vc.tick_size
+    if book.depth_at(side, index) > liq_adj:
+        return price + Side.sign(side) * vc.tick_size
     else:
-        return last_quote[0]
-
+        return price
 
-def calc_price_for_depth(quote: Level, liq_behind):
-    quote_liq = quote.size
 
-    while quote_liq < liq_behind:
-        quote = quote.next_level
-        quote_liq += quote.size
-
-    return quote.price + Side.side(quote.side) * Decimal('0.0001')
+def calc_price_for_depth(book: Book, side, liq_behind):
+    return calc_price(book, side, liq_behind) + Side.side(side) * Decimal('0.0001')
 
 
 # pos is B
@@ -79,18 +67,27 @@ def calc_price_for_depth(quote: Level, liq_behind):
 
 
 def stop_loss_exit_strategy(book: Book, pnl: PNL, ac: MarketmakerConfig, vc: VenueConfig, loss=False):
+    units = book.units
+
     def volume_behind_order(min_pos: Position):
-        sign = Side.sign(min_pos.side())
-        return sum([level.volume() for level in book.quote(min_pos.side())
-                    if sign * level.price > sign * min_pos.price()])
+        side = min_pos.side()
+        sign = Side.sign(side)
+        total = book.volume(side)
+        depth = book.cumulative_depth(side)
+        volume = 0
+        for i, level in enumerate(book.quote(side)):
+            if sign * units.to_price(level.price) <= sign * min_pos.price():
+                break
+            volume += total - (depth[i - 1] if i > 0 else 0)
+        return units.to_size(volume)
 
     pos = pnl.pos
     exit_side = Side.opposite(pos.side())
-    price = price_on_a_depth(book.quote(exit_side), pos.abs_position(), ac, vc)
+    price = price_on_a_depth(book, exit_side, pos.abs_position(), ac, vc)
 
     add_pos = pos.oppoiste_with_price(price)
     min_margin = pos.opposite_with_margin(ac.min_profit)
-    remove_pos = pos.oppoiste_with_price(book.quote(pos.side()).price)
+    remove_pos = pos.oppoiste_with_price(units.to_price(book.quote(pos.side()).price))
     # if (pos + remove_pos + remove_pos.fee_pos(pnl.fee)).balance > pnl.closed_pnl:
     #     return remove_pos, "REMOVE"
     if (pos + add_pos).balance > 0 or loss:
@@ -106,9 +103,10 @@ def remove_exit_price_strategy(book: Book, pos: Position, config: MarketmakerCon
     # if pos.balance > 0:
     #     remove_pos = pos.oppoiste_with_price(last_price)
     # print("fee " + str(pos * Decimal('0.3')))
-    remove_pos = pos.oppoiste_with_price(book.quote(pos.side()).price)
+    units = book.units
+    remove_pos = pos.oppoiste_with_price(units.to_price(book.quote(pos.side()).price))
     remove_pos_wfee = Position(pos=remove_pos.position(), balance=remove_pos.balance + (remove_pos.balance / 100) * fee)
-    add_pos = pos.oppoiste_with_price(book.quote(Side.opposite(pos.side())).price)
+    add_pos = pos.oppoiste_with_price(units.to_price(book.quote(Side.opposite(pos.side())).price))
     fee_ = remove_pos * Decimal(fee / 100)
     fin_pos = pos + remove_pos
     if (pos + remove_pos_wfee).balance > 0:
@@ -125,28 +123,23 @@ def specific_margin_price(entry_price, entry_side, margin, entry_commisiion=0, e
            - Side.sign(entry_side) * exit_commision
 
 
-def calc_price_between_levels(quote, liq_behind, min_step, place_to_spread=False):
-    quote_liq = quote.size
-    dt = abs(0 - quote.price) if place_to_spread else 0
-    while quote_liq < liq_behind:
-        dt = abs(quote.price - quote.next_level.price)
-        quote = quote.next_level
-        quote_liq += quote.size
+def calc_price_between_levels(book: Book, side, liq_behind, min_step, place_to_spread=False):
+    units = book.units
+    index = book.depth_index(side, units.from_size(liq_behind))
+    price = units.to_price(book.nth_level(side, index).price)
+    if index > 0:
+        dt = abs(price - units.to_price(book.nth_level(side, index - 1).price))
+    else:
+        dt = abs(0 - price) if place_to_spread else 0
 
     if dt > min_step:
-        return quote.price + Side.sign(quote.side) * min_step
+        return price + Side.sign(side) * min_step
     else:
-        return quote.price
-
-
-def calc_price(quote, liq_behind):
-    quote_liq = quote.size
+        return price
 
-    while quote_liq < liq_behind:
-        quote = quote.next_level
-        quote_liq += quote.size
 
-    return quote.price
+def calc_price(book: Book, side, liq_behind):
+    return book.units.to_price(book.depth_level(side, book.units.from_size(liq_behind)).price)
 
 
 def test_calc_price2():
@@ -1,22 +1,48 @@
+import itertools
 import json
-import uuid
+import time
 from decimal import Decimal
 from enum import Enum
 
 from mm.event_hub import EventHub, ImportantEvent
 from mm.book import BipolarContainer
+from mm.latency import RoundTrips, RollingLatency
 from posmath.position import Position
 from posmath.side import Side
 
 
+class OidAllocator:
+    # the prefix tells sessions apart, e.g. answers to requests made before a restart, a counter does the rest
+    def __init__(self, prefix=None):
+        self.prefix = '%x_' % time.time_ns() if prefix is None else prefix
+        self.counter = itertools.count(1)
+
+    def next(self):
+        return self.prefix + str(next(self.counter))
+
+
+oids = OidAllocator()
+
+
 class CancelReq:
+    __slots__ = ('side', 'order_id', 'oid')
+
     def __init__(self, side, order_id):
         self.side = side
         self.order_id = order_id
-        self.oid = str(uuid.uuid1())
+        self.oid = oids.next()
+
+
+class CancelAllReq:
+    __slots__ = ('oid',)
+
+    def __init__(self):
+        self.oid = oids.next()
 
 
 class NewReq(CancelReq):
+    __slots__ = ('price', 'size')
+
     def __init__(self, side, price: Decimal, size):
         super().__init__(side, -1)
         self.price = Decimal(price)
@@ -24,12 +50,16 @@ class NewReq(CancelReq):
 
 
 class ReplaceReq(NewReq):
+    __slots__ = ()
+
     def __init__(self, side, order_id, price: Decimal, size):
         super().__init__(side, price, size)
         self.order_id = order_id
 
 
 class Exec:
+    __slots__ = ('oid', 'order_id', 'remains', 'fee', 'side', 'delta', 'price')
+
     def __init__(self, remains, order_id, oid=None):
         self.oid = oid
         self.order_id = order_id
@@ -54,6 +84,8 @@ class Exec:
 # print(Exec(Decimal('0'), Decimal('12345'), Decimal('3645647586')))
 
 class Ack:
+    __slots__ = ('oid', 'order_id', 'pending', 'amount')
+
     def __init__(self, oid, order_id, pending, amount):
         self.oid = oid
         self.order_id = order_id
@@ -62,16 +94,28 @@ class Ack:
 
 
 class Replaced(Ack):
+    __slots__ = ('price',)
+
     def __init__(self, oid, order_id, pending, amount, price):
         super().__init__(oid, order_id, pending, amount)
         self.price = Decimal(str(price))
 
 
 class Cancelled(Ack):
+    __slots__ = ()
+
     def __init__(self, oid, order_id):
         super().__init__(oid, order_id, 0, 0)
 
 
+class CancelledAll:
+    __slots__ = ('oid', 'order_ids')
+
+    def __init__(self, oid, order_ids):
+        self.oid = oid
+        self.order_ids = order_ids
+
+
 class ErrorRequest:
     ORDER_NOT_FOUND = "ORDER_NOT_FOUND"
     RATE_LIMIT = "RATE_LIMIT"
@@ -89,14 +133,17 @@ class ErrorRequest:
 
 
 class Order:
+    __slots__ = ('price', 'side', 'order_id', 'oid', 'status', 'amount', 'pending')
+
     def __init__(self, side, price: Decimal, size):
         self.price = price
         self.side = side
 
         self.order_id = -1
-        self.oid = str(uuid.uuid1())
+        self.oid = oids.next()
         self.status = OrderStatus.NEW
         self.amount = size
+        self.pending = size
 
 
 class OrderStatus(Enum):
@@ -144,8 +191,81 @@ class OrderManager:
         self.by_order_id = {}
         self.by_oid = {}
         self.request_queue = []
+        self.round_trips = RoundTrips()
+        self.cancel_all = None
+        self.flatten_started = 0
+        self.time_to_flat = RollingLatency()
+        self.version = 0
+        self.journal = None
+
+    def request_sending(self, req):
+        # journaled before it goes out, an order can't be live on the venue without a record of it
+        if self.journal is not None:
+            self.journal.request(req)
+
+    def request_sent(self, req):
+        self.round_trips.sent(req.oid, type(req).__name__)
+
+    def restore_request(self, req):
+        # a request journaled before a restart, its answer may follow it in the journal
+        type_req = type(req)
+        if type_req == NewReq:
+            self.by_oid[req.oid] = Order(req.side, req.price, req.size)
+        elif type_req == ReplaceReq and req.order_id in self.by_order_id:
+            order = self.by_order_id[req.order_id]
+            order.status = OrderStatus.REQ_SENT
+            self.by_oid[req.oid] = order
+
+    def restarted(self):
+        # answers to requests sent before a restart never come, the venue's open orders tell what became of them
+        self.version += 1
+        for order in self.by_oid.values():
+            if order.status == OrderStatus.NEW:
+                order.status = OrderStatus.COMPLETED
+            elif order.status == OrderStatus.REQ_SENT:
+                order.status = OrderStatus.ACK
+        self.by_oid.clear()
+        self.cancel_all = None
+
+    def sync_open_orders(self, open_orders):
+        # open_orders are (order_id, side, price, remains) from the venue, returns orders only the venue knew
+        # about, execs for fills we missed on orders still open and orders the venue no longer has
+        self.version += 1
+        in_flight = {(order.side, order.price) for order in self.by_oid.values() if order.status == OrderStatus.NEW}
+        open_ids = set()
+        adopted = []
+        fills = []
+        for order_id, side, price, remains in open_orders:
+            open_ids.add(order_id)
+            if order_id in self.by_order_id:
+                order = self.by_order_id[order_id]
+                order.price = price
+                if remains < order.amount:
+                    # applied by the caller like any other exec, so the position sees it
+                    fills.append(Exec(remains, order_id))
+            elif (side, price) not in in_flight:
+                order = Order(side, price, remains)
+                order.order_id = order_id
+                order.pending = remains
+                order.status = OrderStatus.ACK
+                self.by_order_id[order_id] = order
+                adopted.append(order)
+
+        gone = [order for order_id, order in self.by_order_id.items()
+                if order_id not in open_ids and order.status == OrderStatus.ACK]
+        for order in gone:
+            order.status = OrderStatus.COMPLETED
+            del self.by_order_id[order.order_id]
+        return adopted, fills, gone
+
+    def request_dropped(self, req):
+        # superseded before it reached the exchange, no answer will come for this oid
+        self.version += 1
+        if req.oid in self.by_oid:
+            del self.by_oid[req.oid]
 
     def new_req(self, side, price, size):
+        self.version += 1
         req = NewReq(side, price, size)
         order = Order(side, price, size)
         self.by_oid[req.oid] = order
@@ -164,6 +284,7 @@ class OrderManager:
         del self.by_oid[ack.oid]
 
     def replace_req(self, order_id, side, price, size):
+        self.version += 1
         replace_req = ReplaceReq(side, order_id, price, size)
         if order_id not in self.by_order_id:
             raise RuntimeError
@@ -197,9 +318,40 @@ class OrderManager:
         del self.by_oid[rep.oid]
 
     def cancel_req(self, order_id, side):
+        self.version += 1
         self.request_queue.append(CancelReq(side, order_id))
         return self.by_order_id[order_id]
 
+    def cancel_all_req(self):
+        self.version += 1
+        if self.cancel_all is None:
+            self.cancel_all = CancelAllReq()
+            self.request_queue.append(self.cancel_all)
+        self.flatten()
+        return self.cancel_all
+
+    def on_cancel_all(self, canc: CancelledAll):
+        self.cancel_all = None
+        for order_id in canc.order_ids:
+            if order_id in self.by_order_id:
+                self.by_order_id[order_id].status = OrderStatus.COMPLETED
+                del self.by_order_id[order_id]
+
+    def cancel_all_rejected(self):
+        # venue didn't take the bulk request, fall back to cancelling one by one
+        self.cancel_all = None
+        for order_id, order in self.by_order_id.items():
+            if order.status != OrderStatus.COMPLETED:
+                self.cancel_req(order_id, order.side)
+
+    def flatten(self):
+        if self.flatten_started == 0:
+            self.flatten_started = time.perf_counter_ns()
+
+    def is_flat(self):
+        return len(self.by_order_id) == 0 \
+               and all(order.status != OrderStatus.NEW for order in self.by_oid.values())
+
     def on_cancel(self, canc: Cancelled):
         if canc.order_id not in self.by_order_id.keys():
             raise UnknownOrderId
@@ -253,13 +405,23 @@ class OrderManager:
             del self.by_order_id[order.order_id]
 
     def important_event(self, ev: ImportantEvent):
+        self.version += 1
         if ev.event_name == ImportantEvent.RECONNECT:
+            self.round_trips.forget()
             for oid, order in self.by_oid.items():
                 if order.status == OrderStatus.REQ_SENT:
                     order.status = OrderStatus.ACK
 
     def market_event(self, ev):
+        self.version += 1
+        if self.journal is not None:
+            self.journal.event(ev)
         type_ev = type(ev)
+        if type_ev == ErrorRequest:
+            self.round_trips.acknowledged(ev.oid, ev.error_class)
+        elif ev.oid is not None:
+            self.round_trips.acknowledged(ev.oid)
+
         if type_ev == Ack:
             self.on_ack(ev)
         elif type_ev == Replaced:
@@ -268,6 +430,10 @@ class OrderManager:
             self.on_cancel(ev)
         elif type_ev == Exec:
             self.on_execution(ev)
+        elif type_ev == CancelledAll:
+            self.on_cancel_all(ev)
+        elif type_ev == ErrorRequest and self.cancel_all is not None and ev.oid == self.cancel_all.oid:
+            self.cancel_all_rejected()
         elif type_ev == ErrorRequest:
             # new
             # repl
@@ -279,11 +445,113 @@ class OrderManager:
             # else:
             #     self.remove_request(ev)
 
+        if self.flatten_started != 0 and self.is_flat():
+            self.time_to_flat.record(time.perf_counter_ns() - self.flatten_started)
+            self.flatten_started = 0
+
+
+class Reconciler:
+    # keeps a ladder of orders per side in line with the quotes wanted on this tick using as few requests as possible
+    def __init__(self, om: OrderManager):
+        self.om = om
+        self.orders = BipolarContainer([], [])
+        self.targets = {}
+        self.requested = {}
+
+    def live(self, side):
+        orders = [order for order in self.orders.side(side) if order.status != OrderStatus.COMPLETED]
+        self.orders.set_side(side, orders)
+        return orders
+
+    def target(self, order):
+        if order.status == OrderStatus.ACK or order not in self.targets:
+            return order.price, order.amount
+        return self.targets[order]
+
+    def request(self, order, price, size, now):
+        self.targets[order] = (price, size)
+        self.requested[order] = now
+
+    def forget(self, order):
+        self.targets.pop(order, None)
+        self.requested.pop(order, None)
+
+    def reconcile(self, side, quotes, tolerance, min_interval=0, budget=None, now=None):
+        # returns how many quotes were held back by min_interval or budget
+        now = time.time() if now is None else now
+        held = 0
+        best_first = lambda quote: -Side.sign(side) * quote[0]
+        wanted = sorted(quotes, key=best_first)
+
+        # orders already close enough to a wanted quote stay as they are
+        unmatched = []
+        for order in self.live(side):
+            price, size = self.target(order)
+            for i, (quote_price, quote_size) in enumerate(wanted):
+                if quote_size == size and abs(quote_price - price) <= tolerance:
+                    del wanted[i]
+                    break
+            else:
+                unmatched.append(order)
+
+        unmatched.sort(key=lambda order: best_first(self.target(order)))
+        stale = []
+        for order in unmatched:
+            if order.status != OrderStatus.ACK:
+                # in transition, it takes a slot and gets looked at again on the next tick
+                if len(wanted) > 0:
+                    wanted.pop(0)
+            elif len(wanted) > 0:
+                price, size = wanted.pop(0)
+                if now - self.requested.get(order, 0) < min_interval or budget == 0:
+                    held += 1
+                    continue
+                self.om.replace_req(order.order_id, side, price, size)
+                self.request(order, price, size, now)
+                budget = None if budget is None else budget - 1
+            else:
+                stale.append(order)
+
+        for order in stale:
+            self.om.cancel_req(order.order_id, side)
+            self.orders.side(side).remove(order)
+            self.forget(order)
+
+        for i, (price, size) in enumerate(wanted):
+            if budget == 0:
+                held += len(wanted) - i
+                break
+            order = self.om.new_req(side, price, size)
+            self.orders.side(side).append(order)
+            self.request(order, price, size, now)
+            budget = None if budget is None else budget - 1
+        return held
+
+    def adopt(self, order):
+        # an order placed before a restart, from now on it's reconciled like any other
+        self.orders.side(order.side).append(order)
+
+    def take_live(self):
+        # hands acked orders over to the caller, e.g. to cancel them in bulk; orders still waiting for their ack
+        # stay, a bulk cancel sent now may miss them and they are handed over once acked, or drop out if rejected
+        live = []
+        for side in Side.sides:
+            pending = []
+            for order in self.live(side):
+                if order.status == OrderStatus.ACK:
+                    live.append(order)
+                    self.forget(order)
+                else:
+                    pending.append(order)
+            self.orders.set_side(side, pending)
+        return live
+
 
 class Broker:
     def __init__(self, om: OrderManager):
         self.om = om
         self.orders = BipolarContainer({}, {})
+        self.reconciler = Reconciler(om)
 
     def request(self, tag, side, price, size):
         orders_side = self.orders.side(side)
@@ -312,14 +580,24 @@ class Broker:
                 del self.orders.side(side)[tag]
 
     def cancel_all(self):
-        def cancel_side(side, lst):
-            for tag, order in lst.items():
-                if order.status == OrderStatus.ACK:
-                    self.om.cancel_req(order.order_id, order.side)
-            lst.clear()
-
-        cancel_side(Side.BID, self.orders.side(Side.BID))
-        cancel_side(Side.ASK, self.orders.side(Side.ASK))
+        live = [order for side in Side.sides for order in self.orders.side(side).values()
+                if order.status == OrderStatus.ACK] + self.reconciler.take_live()
+        for side in Side.sides:
+            # orders in transition stay until their answer comes, the next cancel_all gets them if they made it
+            orders_side = self.orders.side(side)
+            for tag in [tag for tag, order in orders_side.items()
+                        if order.status in (OrderStatus.ACK, OrderStatus.COMPLETED)]:
+                del orders_side[tag]
+
+        if len(live) > 1:
+            # one message instead of a cancel per order
+            self.om.cancel_all_req()
+        elif len(live) == 1:
+            self.om.flatten()
+            self.om.cancel_req(live[0].order_id, live[0].side)
+
+    def reconcile(self, side, quotes, tolerance, min_interval=0, budget=None):
+        return self.reconciler.reconcile(side, quotes, tolerance, min_interval, budget)
 
     def order(self, tag, side):
         if tag in self.orders.side(side):
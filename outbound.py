@@ -0,0 +1,144 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+
+from mm.cex_serialization import serialize_request
+from mm.orders import OrderManager, RiskManager, ReplaceReq, CancelReq, CancelAllReq, ErrorRequest
+from mm.ratelimit import RateLimiter
+
+
+class Outgoing:
+    __slots__ = ('req', 'origin', 'submitted', 'seq')
+
+    def __init__(self, req, origin, seq):
+        self.req = req
+        self.origin = origin
+        self.submitted = time.perf_counter_ns()
+        self.seq = seq
+
+
+class OutboundQueue:
+    # Cancels go out first, replaces before new orders, FIFO within each kind, whenever the rate limit can't send
+    # everything queued right away or the risk manager cancels everything. With tokens to spare it's FIFO overall.
+    def __init__(self, om: OrderManager, rm: RiskManager = None, limiter: RateLimiter = None):
+        self.om = om
+        self.rm = rm
+        self.limiter = limiter
+        self.cancels = deque()
+        self.replaces = deque()
+        self.news = deque()
+        self.seq = itertools.count()
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.cancels) + len(self.replaces) + len(self.news)
+
+    def push(self, req, origin=0):
+        item = Outgoing(req, origin, next(self.seq))
+        type_req = type(req)
+        if type_req == ReplaceReq:
+            self.replaces.append(item)
+        elif type_req == CancelReq:
+            self.cancels.append(item)
+        elif type_req == CancelAllReq:
+            # queued replaces would only hit orders that are about to go
+            for queued in self.replaces:
+                self.om.request_dropped(queued.req)
+                self.coalesced += 1
+            self.replaces.clear()
+            self.cancels.append(item)
+        else:
+            self.news.append(item)
+
+    def retry(self, item):
+        # a cancel that didn't make it out goes first again, it keeps its place in line
+        self.cancels.appendleft(item)
+
+    def urgent(self):
+        if self.rm is not None and self.rm.status == RiskManager.CANCEL_ALL:
+            return True
+        # pop() comes after the token for it was taken, what is left has to cover the rest of the queue
+        return self.limiter is not None and self.limiter.available() < len(self) - 1
+
+    def pop(self):
+        if self.urgent():
+            for kind in [self.cancels, self.replaces, self.news]:
+                if len(kind) > 0:
+                    return kind.popleft()
+        oldest = min([kind for kind in [self.cancels, self.replaces, self.news] if len(kind) > 0],
+                     key=lambda kind: kind[0].seq)
+        return oldest.popleft()
+
+
+class OutboundPipeline:
+    RETRY_DELAY = 0.5
+
+    def __init__(self, engine, crypto="BTC", currency="USD", log=None):
+        self.engine = engine
+        self.crypto = crypto
+        self.currency = currency
+        self.log = log
+        self.queue = OutboundQueue(engine.order_manager, engine.rm, engine.rate_limiter)
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.failed = 0
+
+    def submit(self):
+        q = self.engine.order_manager.request_queue
+        if len(q) == 0:
+            return
+        origin = self.engine.latency.origin()
+        for req in q:
+            self.queue.push(req, origin)
+        q.clear()
+        self.engine.rate_limiter.backlog = len(self.queue)
+        self.ready.set()
+
+    async def run(self, send):
+        engine = self.engine
+        limiter = engine.rate_limiter
+        if len(self.queue) > 0:
+            # left over from a connection that went down
+            self.ready.set()
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while len(self.queue) > 0:
+                if not limiter.take():
+                    # a cancel-all pushed meanwhile still drops the queued replaces
+                    await asyncio.sleep(limiter.delay())
+                    continue
+                item = self.queue.pop()
+                limiter.backlog = len(self.queue)
+                dequeued = time.perf_counter_ns()
+                sreq = serialize_request(item.req, self.crypto, self.currency)
+                serialized = time.perf_counter_ns()
+                if self.log is not None:
+                    self.log.log('{"out":%s}', sreq)
+                engine.order_manager.request_sending(item.req)
+                try:
+                    await send(sreq)
+                except Exception as e:
+                    self.send_failed(item, e)
+                    # most likely the connection is gone, the queue is picked up again after reconnect
+                    await asyncio.sleep(OutboundPipeline.RETRY_DELAY)
+                    continue
+                engine.order_manager.request_sent(item.req)
+                engine.latency.outbound(item.origin, item.submitted, dequeued, serialized, time.perf_counter_ns())
+                self.sent += 1
+
+    def send_failed(self, item, e):
+        self.failed += 1
+        print("send failed " + type(e).__name__ + " " + str(e))
+        type_req = type(item.req)
+        if type_req == CancelReq or type_req == CancelAllReq:
+            self.queue.retry(item)
+        else:
+            # nothing was placed or changed, the strategy decides again on its next tick
+            self.engine.order_manager.market_event(
+                ErrorRequest(item.req.oid, 'send failed: ' + str(e), ErrorRequest.UNEXPECTED_ERROR))
+
+    def summary(self):
+        return {'queued': len(self.queue), 'sent': self.sent, 'failed': self.failed,
+                'coalesced': self.queue.coalesced}
@@ -1,4 +1,6 @@
+import math
 import time
+from collections import deque
 
 from posmath.position import Position
 from posmath.side import Side
@@ -6,30 +8,64 @@ from decimal import Decimal
 
 from mm.book import BipolarContainer, Level
 from mm.orders import Exec
+from mm.units import DECIMAL
 
 
 class EMAHolder:
+    # Time-decayed EMA over a sliding window, O(1) per add and amortized O(1) per query.
+    # Decay constant is half the window, which matches the count-based k = 2 / (N + 1) EMA
+    # recomputed over the window for evenly arriving samples. They are not the same number: on
+    # simulated and recorded mid series the measured gap is 0.01-0.06% relative (0.6 on a 1000
+    # price at worst), see test_ema.py. Most of it comes from the old per-step round(, 4), which
+    # stalls the count-based EMA on busy books. EMA_TOLERANCE bounds it with little headroom.
+    EMA_TOLERANCE = Decimal('0.0007')
+
     def __init__(self, window_time):
         self.window_time = window_time
-        self.values = []
+        self.decay_time = window_time / 2
+        self.values = deque()
+        self.weighted_sum = 0.0
+        self.weight = 0.0
+        self.last_time = None
+        self.version = 0
+
+    def add(self, val, now=None, weight=1.0):
+        # weight other than 1 stands for several samples merged into one, see Checkpoint
+        now = time.time() if now is None else now
+        if self.last_time is not None:
+            decay = math.exp((self.last_time - now) / self.decay_time)
+            self.weighted_sum *= decay
+            self.weight *= decay
+        self.weighted_sum += float(val) * weight
+        self.weight += weight
+        self.last_time = now
+        self.values.append((now, val, weight))
+        self.version += 1
+
+    def evict(self, now):
+        while len(self.values) > 0 and self.values[0][0] <= now - self.window_time:
+            val_time, val, val_weight = self.values.popleft()
+            weight = val_weight * math.exp((val_time - self.last_time) / self.decay_time)
+            self.weighted_sum -= float(val) * weight
+            self.weight -= weight
+            self.version += 1
 
-    def add(self, val):
-        self.values.append((time.time(), val))
+        if len(self.values) == 0:
+            self.weighted_sum = 0.0
+            self.weight = 0.0
 
-    def calc_ema(self):
-        self.values = [x for x in self.values if x[0] > time.time() - self.window_time]
+    def calc_ema(self, now=None):
+        self.evict(time.time() if now is None else now)
         if len(self.values) == 0:
             return Decimal(0)
-        ema = self.values[0][1]
-        k = Decimal(2 / (len(self.values) + 1))
-        for val_time, val in self.values[1:]:
-            ema = round(val * k + ema * (1 - k), 4)
-
-        return Decimal(ema)
+        if len(self.values) == 1:
+            return Decimal(self.values[0][1])
+        return round(Decimal(self.weighted_sum / self.weight), 4)
 
 
 class PNL:
-    def __init__(self, fee):
+    def __init__(self, fee, units=DECIMAL):
+        self.units = units
         self.method = BipolarContainer('NONE', 'NONE')
         self.pos = Position(0, 0)
         self.nbbo = BipolarContainer(0, 0)
@@ -39,8 +75,11 @@ class PNL:
         self.fee = Decimal(fee)
         self.ema = EMAHolder(5 * 60)
         self.zero_position_time = time.time()
+        self.version = 0
+        self.journal = None
 
     def execution(self, tx: Exec):
+        self.version += 1
         exec_pos = Position(pos=tx.delta, price=tx.price, side=tx.side)
         if tx.delta > 0:
             self.pos += exec_pos + exec_pos.fee_pos(tx.fee)
@@ -52,6 +91,9 @@ class PNL:
             # self.clean_closed_pnl += self.closed_pnl
             # self.closed_pnl = 0
 
+        if self.journal is not None:
+            self.journal.pnl(self)
+
     def position(self):
         return self.pos.position()
 
@@ -59,7 +101,8 @@ class PNL:
         return self.pos.abs_position()
 
     def quote_changed(self, quote):
-        self.nbbo.set_side(quote.side, quote.price)
+        self.version += 1
+        self.nbbo.set_side(quote.side, self.units.to_price(quote.price))
         if self.nbbo.bid() == 0 or self.nbbo.ask() == 0:
             return
         mid_price = (self.nbbo.bid() + self.nbbo.ask()) / 2
@@ -72,6 +115,8 @@ class PNL:
         return self.balance() + self.position() * self.exit_price
 
     def update_open_pnl(self, exit_price):
+        if exit_price != self.exit_price:
+            self.version += 1
         self.exit_price = exit_price
 
     def nbbo_pnl(self):
@@ -99,8 +144,15 @@ class PNL:
         return Side.side(self.position())
 
     def set_order_method(self, side, method):
+        if method != self.method.side(side):
+            self.version += 1
         self.method.set_side(side, method)
 
     def exit_method(self):
         return str(self.method)
 
+    def state_version(self, now=None):
+        # the EMA also moves when old samples leave the window
+        self.ema.evict(time.time() if now is None else now)
+        return self.version, self.ema.version
+
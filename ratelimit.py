@@ -0,0 +1,52 @@
+import time
+
+
+class RateLimiter:
+    # token bucket whose refill rate backs off on venue RATE_LIMIT errors and creeps back while it's quiet
+    def __init__(self, config):
+        self.config = config
+        self.rate = config.rate
+        self.tokens = config.burst
+        self.last_time = time.monotonic()
+        self.last_throttle = 0
+        self.backlog = 0
+        self.throttles = 0
+
+    def refill(self, now):
+        config = self.config
+        if self.rate < config.rate and now - self.last_throttle >= config.recovery_time:
+            self.rate = min(config.rate, self.rate + config.rate * config.recovery_step)
+            self.last_throttle = now
+        self.tokens = min(config.burst, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+
+    def available(self, now=None):
+        self.refill(time.monotonic() if now is None else now)
+        return self.tokens
+
+    def budget(self, now=None):
+        # requests that can still go out right now once the queued ones are sent
+        return self.available(now) - self.backlog
+
+    def take(self, now=None):
+        if self.available(now) < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def delay(self, now=None):
+        tokens = self.available(now)
+        return 0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def throttled(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.refill(now)
+        config = self.config
+        self.rate = max(config.min_rate, self.rate * config.backoff)
+        self.tokens = 0
+        self.last_throttle = now
+        self.throttles += 1
+
+    def summary(self):
+        return {'rate': round(self.rate, 3), 'configured_rate': self.config.rate, 'tokens': round(self.tokens, 3),
+                'backlog': self.backlog, 'throttles': self.throttles}
@@ -0,0 +1,46 @@
+import json
+import time
+
+
+class Recorder:
+    IN = 'i'
+    OUT = 'o'
+
+    def __init__(self, filename):
+        self.file = open(filename, 'a', buffering=1 << 16)
+
+    def record(self, direction, data):
+        self.file.write(direction + ' ' + str(time.monotonic_ns()) + ' ' + data.replace('\n', ' ') + '\n')
+
+    def inbound(self, data):
+        self.record(Recorder.IN, data)
+
+    def outbound(self, data):
+        if data.startswith('{"e": "auth"'):
+            data = redact_auth(data)
+        self.record(Recorder.OUT, data)
+
+    def close(self):
+        self.file.close()
+
+
+def redact_auth(data):
+    # recordings get shared and kept around, the API key and signature have no business in them
+    parsed = json.loads(data)
+    if parsed.get('e') == 'auth':
+        for field in ['key', 'signature']:
+            if field in parsed.get('auth', {}):
+                parsed['auth'][field] = 'REDACTED'
+        return json.dumps(parsed)
+    return data
+
+
+def recording_name(dirname: str):
+    return dirname + '/frames_' + str(time.strftime("%Y-%m-%d_%H%M%S", time.localtime())) + '.rec'
+
+
+def read_frames(filename):
+    with open(filename, 'r') as f:
+        for line in f:
+            direction, timestamp, data = line.rstrip('\n').split(' ', 2)
+            yield direction, int(timestamp), data
@@ -0,0 +1,100 @@
+import json
+import sys
+import time
+from collections import deque
+
+from mm.app_config import load_config
+from mm.cex_serialization import deserialize_order_event, serialize_request
+from mm.engine import Engine
+from mm.marketmaker import Marketmaker
+from mm.outbound import OutboundQueue
+from mm.recorder import Recorder, read_frames
+
+ORDER_EVENTS = ["place-order", "cancel-replace-order", "cancel-order", "cancel-orders", "tx", "order"]
+ORDER_REQUESTS = ["place-order", "cancel-replace-order", "cancel-order", "cancel-orders"]
+
+
+class Replay:
+    def __init__(self, engine: Engine, crypto="BTC", currency="USD"):
+        self.engine = engine
+        self.crypto = crypto
+        self.currency = currency
+        self.oids = {}
+        # ours, in the order the live outbound queue would have sent them
+        self.queue = OutboundQueue(engine.order_manager, engine.rm)
+        self.pending = deque()
+        self.md_updates = 0
+        self.order_events = 0
+        self.requests = 0
+        self.mismatched = 0
+
+    def drain_requests(self):
+        q = self.engine.order_manager.request_queue
+        for req in q:
+            self.queue.push(req)
+        q.clear()
+        while len(self.queue) > 0:
+            self.pending.append(json.loads(serialize_request(self.queue.pop().req, self.crypto, self.currency)))
+            self.requests += 1
+
+    def map_outbound(self, parsed):
+        # recorded oids were issued by the recorded session, the n-th recorded request pairs with our n-th
+        if parsed['e'] not in ORDER_REQUESTS or len(self.pending) == 0:
+            return
+        req = self.pending.popleft()
+        if req['e'] != parsed['e']:
+            # the replayed strategy went another way than the recorded one
+            self.mismatched += 1
+        self.oids[parsed['oid']] = req['oid']
+
+    def on_frame(self, direction, data):
+        parsed = json.loads(data)
+        event = parsed.get('e')
+        if direction == Recorder.OUT:
+            if 'oid' in parsed:
+                self.map_outbound(parsed)
+            return
+
+        if event == 'md_update':
+            self.md_updates += 1
+            self.engine.on_md(parsed)
+        elif event == 'order-book-subscribe':
+            self.md_updates += 1
+            self.engine.on_snapshot(parsed)
+            self.engine.md_applied(1)
+        elif event in ORDER_EVENTS:
+            self.order_events += 1
+            if 'oid' in parsed:
+                parsed['oid'] = self.oids.get(parsed['oid'], parsed['oid'])
+            order_event = deserialize_order_event(event, parsed)
+            if order_event is not None:
+                self.engine.order_event(order_event)
+        self.drain_requests()
+
+    def run(self, filename):
+        first_ts = None
+        last_ts = None
+        start = time.perf_counter()
+        for direction, timestamp, data in read_frames(filename):
+            if first_ts is None:
+                first_ts = timestamp
+            last_ts = timestamp
+            self.on_frame(direction, data)
+        elapsed = time.perf_counter() - start
+        recorded = 0 if first_ts is None else (last_ts - first_ts) / 1e9
+        return {'md_updates': self.md_updates,
+                'order_events': self.order_events,
+                'requests': self.requests,
+                'mismatched': self.mismatched,
+                'elapsed': elapsed,
+                'recorded': recorded,
+                'speedup': recorded / elapsed if elapsed > 0 else 0}
+
+
+if __name__ == '__main__':
+    config = load_config(sys.argv[1])
+    engine = Engine(Marketmaker, config)
+    if len(sys.argv) > 3 and sys.argv[3] == 'normal':
+        engine.rm.set_normal()
+    replay = Replay(engine, config.asset.crypto, config.asset.currency)
+    print(json.dumps(replay.run(sys.argv[2])))
@@ -2,7 +2,6 @@ import asyncio
 import datetime
 import json
 
-import logging
 import sys
 import atexit
 import websockets
@@ -13,12 +12,22 @@ from websockets import InvalidHandshake
 
 from mm.app_config import load_config
 from mm.event_hub import ImportantLogger
-from mm.cex_serialization import auth_request, subscribe_to_book, serialize_request, open_orders, balance, \
-    deserialize_order_event, password_encode, sim_ack
+from mm.cex_serialization import auth_request, subscribe_to_book, unsubscribe_from_book, open_orders, balance, \
+    deserialize_order_event, deserialize_open_orders, password_encode, sim_ack
 from mm.client_serialization import serialize_book, serialize_orders, serialize_pnl, serialize_execs, \
-    serialize_important_events
+    serialize_important_events, serialize_latency, serialize_order_latency, serialize_rate_limit, \
+    serialize_conflation, serialize_sequencer, \
+    serialize_book_stats, serialize_dashboard, serialize_event_hub, serialize_logging
+from mm.broadcast import Broadcaster
+from mm.checkpoint import Checkpoint
+from mm.delta import DeltaStream
 from mm.engine import Engine
+from mm.journal import Journal
+from mm.latency import TickToTrade
+from mm.log_writer import LogWriter
 from mm.marketmaker import Marketmaker
+from mm.outbound import OutboundPipeline
+from mm.recorder import Recorder, recording_name
 
 
 
@@ -31,7 +40,49 @@ config = load_config(config_file)
 
 engine = Engine(Marketmaker, config)
 
-engine.event_hub.subscribe(ImportantLogger(config.logging.dir))
+important_logger = ImportantLogger(config.logging.dir)
+engine.event_hub.subscribe(important_logger, deferred=True)
+atexit.register(important_logger.writer.close)
+
+# order frames and executions are logged at INFO
+orders_log = LogWriter(logname(config.logging.dir)) if config.logging.level in ('DEBUG', 'INFO') else None
+if orders_log is not None:
+    atexit.register(orders_log.close)
+
+recorder = Recorder(recording_name(config.logging.dir)) if config.logging.record else None
+if recorder is not None:
+    atexit.register(recorder.close)
+
+journal = Journal(config.logging.journal) if config.logging.journal is not None else None
+if journal is not None:
+    started = time.perf_counter()
+    replayed = engine.restore(journal)
+    print('restored {} journal records in {:.1f}ms, {} open orders, position {}'.format(
+        replayed, (time.perf_counter() - started) * 1000, len(engine.order_manager.by_order_id), engine.pnl.pos))
+    atexit.register(journal.close)
+
+checkpoint = Checkpoint(config.logging.checkpoint, config.logging.checkpoint_interval) \
+    if config.logging.checkpoint is not None else None
+if checkpoint is not None:
+    age = checkpoint.load(engine)
+    if age is not None:
+        print('warm start from a {:.1f}s old checkpoint, {} EMA samples'.format(age, len(engine.pnl.ema.values)))
+    atexit.register(checkpoint.save, engine)
+
+outbound = OutboundPipeline(engine, config.asset.crypto, config.asset.currency, orders_log)
+
+
+async def send(websocket, data):
+    if recorder is not None:
+        recorder.outbound(data)
+    await websocket.send(data)
+
+
+async def recv(websocket):
+    data = await websocket.recv()
+    if recorder is not None:
+        recorder.inbound(data)
+    return data
 
 
 async def reconnect():
@@ -45,54 +96,106 @@ async def reconnect():
 
 async def hello():
     async with websockets.connect(config.venue.url) as websocket:
-        greeting = await websocket.recv()
+        greeting = await recv(websocket)
         print(greeting)
         req = auth_request(config.venue.key, config.venue.secret)
-        await websocket.send(req)
+        await send(websocket, req)
         print("> {}".format(req))
 
-        greeting = await websocket.recv()
+        greeting = await recv(websocket)
         print(greeting)
 
-        await websocket.send(subscribe_to_book(config.asset.crypto, config.asset.currency, 20))
-        last_heartbeat_time = 0
+        await send(websocket, subscribe_to_book(config.asset.crypto, config.asset.currency, config.book.subscribe_depth))
+        engine.sequencer.requested(time.time())
+        # orders placed before a restart or filled while disconnected show up here
+        await send(websocket, open_orders(config.asset.crypto, config.asset.currency))
+        sender_task = asyncio.ensure_future(outbound.run(lambda sreq: send(websocket, sreq)))
+        frames = asyncio.Queue()
+        reader_task = asyncio.ensure_future(read(websocket, frames))
+        try:
+            last_heartbeat_time = 0
+            while True:
+                # everything that arrived while the previous burst was processed is handled in one go
+                batch = [await frames.get()]
+                while not frames.empty():
+                    batch.append(frames.get_nowait())
+                engine.latency.start(received=batch[0][0])
+                await tick(websocket, [data for received, data in batch])
+                # check socket
+                if time.time() - last_heartbeat_time >= 60:
+                    await send(websocket, balance())
+                    last_heartbeat_time = time.time()
+        finally:
+            reader_task.cancel()
+            sender_task.cancel()
+
+
+async def read(websocket, frames: asyncio.Queue):
+    # each frame goes with the time it was read, the time it waits in the queue is part of tick-to-trade
+    try:
         while True:
-            data = await websocket.recv()
-            await tick(websocket, data)
-            # check socket
-            if time.time() - last_heartbeat_time >= 60:
-                await websocket.send(balance())
-                last_heartbeat_time = time.time()
-
-async def tick(websocket, data):
-    parsed = json.loads(data)
-    event = parsed['e']
-    if event == 'md_update':
-        engine.on_md(parsed)
-    elif event == 'ping':
-        await websocket.send(json.dumps({'e': 'pong'}))
-    elif event in ["place-order", "cancel-replace-order", "cancel-order", "tx", "order"]:
-        logging.info("{\"in\":" + data + "}")
-        order_event = deserialize_order_event(event, parsed)
-        if order_event is not None:
-            engine.order_event(order_event)
-    elif event == 'open-orders':
-        print('!open orders ' + str(len(parsed['data'])))
-    elif event == 'get-balance':
-        engine.sync_balance(parsed)
-    else:
-        logging.info("{\"in\":" + data + "}")
-
-    q = engine.order_manager.request_queue
-
-    # while len(q) > 0:
-    #     req = engine.order_manager.request_queue.pop()
-    #     await tick(websocket, sim_ack(req))
-    while len(q) > 0:
-        req = engine.order_manager.request_queue.pop()
-        sreq = serialize_request(req,config.asset.crypto, config.asset.currency)
-        logging.info("{\"out\":" + sreq + "}")
-        await websocket.send(sreq)
+            data = await recv(websocket)
+            frames.put_nowait((time.perf_counter_ns(), data))
+    except Exception as e:
+        frames.put_nowait((time.perf_counter_ns(), e))
+
+
+async def tick(websocket, batch):
+    for data in batch:
+        if isinstance(data, Exception):
+            raise data
+    parsed_batch = [json.loads(data) for data in batch]
+    engine.latency.mark(TickToTrade.PARSED)
+
+    md_updates = 0
+    for data, parsed in zip(batch, parsed_batch):
+        event = parsed['e']
+        if event == 'md_update':
+            engine.update_book(parsed)
+            md_updates += 1
+        elif event == 'order-book-subscribe':
+            if parsed.get('ok') == 'ok':
+                engine.on_snapshot(parsed)
+                md_updates += 1
+            else:
+                engine.snapshot_failed(parsed)
+        elif event == 'ping':
+            await send(websocket, json.dumps({'e': 'pong'}))
+        elif event in ["place-order", "cancel-replace-order", "cancel-order", "cancel-orders", "tx", "order"]:
+            if orders_log is not None:
+                orders_log.log('{"in":%s}', data)
+            order_event = deserialize_order_event(event, parsed)
+            if order_event is not None:
+                engine.order_event(order_event)
+        elif event == 'open-orders':
+            print('!open orders ' + str(len(parsed['data'])))
+            if parsed.get('ok') == 'ok':
+                engine.sync_open_orders(deserialize_open_orders(parsed))
+        elif event == 'get-balance':
+            engine.sync_balance(parsed)
+        elif orders_log is not None:
+            orders_log.log('{"in":%s}', data)
+
+    if md_updates > 0:
+        engine.md_applied(md_updates)
+
+    engine.check_snapshot(time.time())
+    if engine.resubscribe:
+        # a fresh snapshot replaces the book that lost updates
+        engine.resubscribe = False
+        await send(websocket, unsubscribe_from_book(config.asset.crypto, config.asset.currency))
+        await send(websocket, subscribe_to_book(config.asset.crypto, config.asset.currency, config.book.subscribe_depth))
+        engine.sequencer.requested(time.time())
+
+    if engine.resync_balance:
+        engine.resync_balance = False
+        await send(websocket, balance())
+
+    outbound.submit()
+    engine.latency.finish()
+    if journal is not None:
+        # the tick's requests are journaled as they go out, starting over is left till after it
+        journal.compact_if_due()
 
 
 def consumer(msg):
@@ -121,14 +224,29 @@ def client_auth(timestamp, msg):
         return False
 
 
-async def sender():
-    await asyncio.sleep(1)
+def produce():
     execution_count = len(engine.execution_sink)
     execs = serialize_execs(engine.execution_sink)
-    if execution_count > 0:
-        logging.info(execs)
-    return [serialize_book(engine.book), serialize_orders(engine.order_manager),
-            serialize_pnl(engine.pnl), execs, serialize_important_events(engine.event_log)]
+    if execution_count > 0 and orders_log is not None:
+        orders_log.log('%s', execs)
+    snapshots = {'pnl': serialize_pnl(engine.pnl),
+                 'latency': serialize_latency(engine.latency),
+                 'order_latency': serialize_order_latency(engine.order_manager),
+                 'rate_limit': serialize_rate_limit(engine.rate_limiter),
+                 'conflation': serialize_conflation(engine.conflation),
+                 'md_sequence': serialize_sequencer(engine.sequencer),
+                 'book_stats': serialize_book_stats(engine.book),
+                 'dashboard': serialize_dashboard(broadcaster),
+                 'event_hub': serialize_event_hub(engine.event_hub),
+                 'logging': serialize_logging(important_logger.writer, orders_log)}
+    if broadcaster.wanted('book'):
+        snapshots['book'] = serialize_book(engine.book)
+    if broadcaster.wanted('orders'):
+        snapshots['orders'] = serialize_orders(engine.order_manager)
+    return snapshots, [execs, serialize_important_events(engine.event_log)]
+
+
+broadcaster = Broadcaster(produce, deltas=DeltaStream(engine.book, engine.order_manager))
 
 
 async def handler(websocket, path):
@@ -140,40 +258,38 @@ async def handler(websocket, path):
         auth = await websocket.recv()                           # listen for login and hash of password
         authenticated = client_auth(timestamp, auth)            # check credentials
 
-    while True:
-        listener_task = asyncio.ensure_future(websocket.recv())
-        producer_task = asyncio.ensure_future(sender())
-
-        done, pending = await asyncio.wait(
-            [listener_task, producer_task],
-            return_when=asyncio.FIRST_COMPLETED)
-
-        if listener_task in done:
-            message = listener_task.result()
-            consumer(message)
-        else:
-            listener_task.cancel()
-
-        if producer_task in done:
-            messages = producer_task.result()
-            for message in messages:
-                await websocket.send(message)
-        else:
-            producer_task.cancel()
+    subscriber = broadcaster.subscribe(websocket)
+    feed_task = asyncio.ensure_future(subscriber.run())
+    try:
+        while True:
+            message = await websocket.recv()
+            parsed = json.loads(message)
+            if parsed.get('e') == 'subscribe' and parsed.get('mode') == 'delta':
+                # opt-in, clients that never ask keep getting full book and orders every second
+                broadcaster.subscribe_deltas(subscriber, parsed.get('interval_ms', 1000) / 1000)
+            else:
+                consumer(message)
+    finally:
+        feed_task.cancel()
+        broadcaster.unsubscribe(subscriber)
 
 
 loop = asyncio.get_event_loop()
 
+tasks = [engine.event_hub.run(), reconnect()]
+if checkpoint is not None:
+    tasks.append(checkpoint.run(engine))
+
 if config.client.enabled:
     start_server = websockets.serve(handler, '0.0.0.0', config.client.port)
     loop.run_until_complete(asyncio.gather(
         start_server,
-        reconnect(),
+        broadcaster.run(),
+        broadcaster.run_deltas(),
+        *tasks
     ))
 else:
-    loop.run_until_complete(asyncio.gather(
-        reconnect(),
-    ))
+    loop.run_until_complete(asyncio.gather(*tasks))
 loop.run_forever()
 
 
@@ -0,0 +1,82 @@
+import time
+
+from mm.latency import RollingLatency
+
+
+class Sequencer:
+    # updates that skip ahead wait here for the missing ids, a real gap is declared once the window is exceeded
+    REORDER_WINDOW = 3
+    MAX_PENDING = 10000
+    # a snapshot that hasn't come back by then is asked for again
+    SNAPSHOT_TIMEOUT = 5.0
+
+    def __init__(self):
+        self.last = -1
+        self.pending = {}
+        self.resyncing = False
+        self.gaps = 0
+        self.reordered = 0
+        self.stale = 0
+        self.gap_started = 0
+        self.snapshot_requested = 0
+        self.snapshot_timeouts = 0
+        self.time_to_valid = RollingLatency()
+
+    def drain(self):
+        ready = []
+        while self.last + 1 in self.pending:
+            self.last += 1
+            ready.append(self.pending.pop(self.last))
+        return ready
+
+    def push(self, seq, md):
+        # returns updates ready to apply, in order, and the size of a detected gap
+        if self.last != -1 and seq <= self.last:
+            self.stale += 1
+            return [], 0
+        if self.resyncing:
+            if len(self.pending) < Sequencer.MAX_PENDING:
+                self.pending[seq] = md
+            return [], 0
+        if self.last == -1 or seq == self.last + 1:
+            self.last = seq
+            return [md] + self.drain(), 0
+
+        self.pending[seq] = md
+        if len(self.pending) <= Sequencer.REORDER_WINDOW:
+            self.reordered += 1
+            return [], 0
+        gap = min(self.pending) - self.last
+        self.resyncing = True
+        self.gaps += 1
+        self.gap_started = time.perf_counter_ns()
+        return [], gap
+
+    def requested(self, now):
+        self.snapshot_requested = now
+
+    def overdue(self, now):
+        if self.snapshot_requested != 0 and now - self.snapshot_requested > Sequencer.SNAPSHOT_TIMEOUT:
+            self.snapshot_requested = 0
+            self.snapshot_timeouts += 1
+            return True
+        return False
+
+    def snapshot(self, seq):
+        # buffered updates newer than the snapshot, to be applied on top of it
+        self.snapshot_requested = 0
+        self.last = seq
+        self.resyncing = False
+        for old in [s for s in self.pending if s <= seq]:
+            del self.pending[old]
+        return self.drain()
+
+    def valid(self):
+        if self.gap_started != 0:
+            self.time_to_valid.record(time.perf_counter_ns() - self.gap_started)
+            self.gap_started = 0
+
+    def summary(self):
+        return {'gaps': self.gaps, 'reordered': self.reordered, 'stale': self.stale, 'pending': len(self.pending),
+                'resyncing': self.resyncing, 'snapshot_timeouts': self.snapshot_timeouts,
+                'time_to_valid': self.time_to_valid.summary()}
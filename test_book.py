@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from decimal import Decimal
+from random import Random
+
+from mm.book import Book, SortedBook, create_book
+from posmath.side import Side
+
+
+def book_sides(book):
+    return {side: [(x.price, x.size) for x in book.quote(side)] if book.quote(side) is not None else []
+            for side in Side.sides}
+
+
+def random_updates(seed, count):
+    rnd = Random(seed)
+    for i in range(0, count):
+        side = rnd.choice(Side.sides)
+        sign = -Side.sign(side)
+        price = Decimal(1000 + sign * rnd.randrange(1, 60)) + Decimal(rnd.randrange(0, 4)) / 4
+        size = Decimal(rnd.randrange(0, 5)) / 100
+        yield side, price, size
+
+
+def test_sorted_book_matches_linked_book():
+    linked = Book()
+    indexed = SortedBook()
+    for side, price, size in random_updates(42, 5000):
+        linked.increment_level(side, price, size)
+        indexed.increment_level(side, price, size)
+        assert book_sides(linked) == book_sides(indexed)
+
+
+def test_book_aggregates():
+    for book in [Book(), SortedBook()]:
+        for side, price, size in random_updates(7, 3000):
+            book.increment_level(side, price, size)
+            if book.quote(side) is None:
+                assert book.volume(side) == 0 and book.levels(side) == 0
+                continue
+            assert book.volume(side) == book.quote(side).volume()
+            assert book.levels(side) == book.quote(side).levels()
+            liq = 0
+            depth = []
+            for level in book.quote(side):
+                liq += level.size
+                depth.append(liq)
+            assert book.cumulative_depth(side) == depth
+            assert [book.depth_at(side, i) for i in range(0, len(depth))] == depth
+            for liq in [Decimal(0), depth[0], depth[-1] / 2, depth[-1], depth[-1] + 1]:
+                assert book.depth_index(side, liq) == min(bisect_left(depth, liq), len(depth) - 1)
+
+
+def test_sorted_book_order():
+    book = SortedBook()
+    for price in [Decimal('101'), Decimal('99'), Decimal('100')]:
+        book.increment_level(Side.BID, price, Decimal('1'))
+        book.increment_level(Side.ASK, price + 10, Decimal('1'))
+
+    assert [x.price for x in book.quote(Side.BID)] == [Decimal('101'), Decimal('100'), Decimal('99')]
+    assert [x.price for x in book.quote(Side.ASK)] == [Decimal('109'), Decimal('110'), Decimal('111')]
+    assert book.level(Side.BID, Decimal('100')).size == Decimal('1')
+
+    book.increment_level(Side.BID, Decimal('101'), Decimal('0'))
+    book.increment_level(Side.ASK, Decimal('110'), Decimal('0'))
+    assert [x.price for x in book.quote(Side.BID)] == [Decimal('100'), Decimal('99')]
+    assert [x.price for x in book.quote(Side.ASK)] == [Decimal('109'), Decimal('111')]
+    assert book.level(Side.BID, Decimal('101')) is None
+
+
+def test_sorted_book_quote_changed():
+    class Subscriber:
+        def __init__(self):
+            self.quotes = []
+
+        def quote_changed(self, quote):
+            self.quotes.append((quote.side, quote.price))
+
+    book = SortedBook()
+    subscriber = Subscriber()
+    book.quote_subscribers.append(subscriber)
+    book.increment_level(Side.BID, Decimal('100'), Decimal('1'))
+    book.increment_level(Side.ASK, Decimal('101'), Decimal('1'))
+    book.increment_level(Side.ASK, Decimal('102'), Decimal('1'))
+    book.increment_level(Side.ASK, Decimal('101'), Decimal('0'))
+    assert subscriber.quotes == [(Side.ASK, Decimal('101')), (Side.ASK, Decimal('102'))]
+
+
+def test_depth_queries():
+    for book in [Book(), SortedBook()]:
+        for price, size in [('101', '0.5'), ('100', '1'), ('99', '2')]:
+            book.increment_level(Side.BID, Decimal(price), Decimal(size))
+
+        assert book.depth_level(Side.BID, Decimal('0.5')).price == Decimal('101')
+        assert book.depth_level(Side.BID, Decimal('0.6')).price == Decimal('100')
+        assert book.depth_level(Side.BID, Decimal('100')).price == Decimal('99')
+        assert book.depth_index(Side.ASK, Decimal('1')) is None
+        assert book.worse_level(Side.BID, Decimal('100')).price == Decimal('99')
+        assert book.worse_level(Side.BID, Decimal('100.5')).price == Decimal('100')
+        assert book.worse_level(Side.BID, Decimal('99')) is None
+
+
+def test_create_book():
+    assert type(create_book()) == Book
+    assert type(create_book('sorted')) == SortedBook
+
+
+def test_depth_cap():
+    linked = Book(max_depth=10)
+    indexed = SortedBook(max_depth=10)
+    for side, price, size in random_updates(3, 3000):
+        linked.increment_level(side, price, size)
+        indexed.increment_level(side, price, size)
+        assert book_sides(linked) == book_sides(indexed)
+        assert linked.levels(side) <= 10
+        assert linked.volume(side) == sum(size for price, size in book_sides(linked)[side])
+    assert linked.evicted > 0
+    assert linked.evicted == indexed.evicted
+
+    book = create_book('sorted', max_depth=2)
+    for price in [Decimal(100), Decimal(99), Decimal(101)]:
+        book.increment_level(Side.BID, price, Decimal(1))
+    assert [level.price for level in book.quote(Side.BID)] == [101, 100]
+    book.increment_level(Side.BID, Decimal(98), Decimal(1))
+    assert [level.price for level in book.quote(Side.BID)] == [101, 100]
+    assert book.evicted == 2
@@ -0,0 +1,58 @@
+import asyncio
+
+from mm.broadcast import Broadcaster
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+
+class Producer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'book': 'book %d' % self.calls, 'pnl': 'pnl %d' % self.calls}, ['exec %d' % self.calls]
+
+
+def test_serialized_once_for_all_clients():
+    produce = Producer()
+    broadcaster = Broadcaster(produce)
+    broadcaster.broadcast()
+    assert produce.calls == 0
+
+    clients = [FakeWebsocket() for i in range(0, 3)]
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(broadcaster.subscribe(ws).run()) for ws in clients]
+        broadcaster.broadcast()
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+
+    asyncio.run(scenario())
+    assert produce.calls == 1
+    assert clients[0].sent == ['book 1', 'pnl 1', 'exec 1']
+    assert all(ws.sent[0] is clients[0].sent[0] for ws in clients)
+
+
+def test_slow_client_gets_latest_snapshot():
+    broadcaster = Broadcaster(Producer(), max_pending=2)
+    ws = FakeWebsocket()
+    subscriber = broadcaster.subscribe(ws)
+    for i in range(0, 3):
+        broadcaster.broadcast()
+
+    async def scenario():
+        task = asyncio.ensure_future(subscriber.run())
+        await asyncio.sleep(0)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert ws.sent == ['book 3', 'pnl 3', 'exec 2', 'exec 3']
+    assert broadcaster.summary() == {'clients': 1, 'broadcasts': 3, 'dropped': 1}
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import time
+from decimal import Decimal
+
+from mm.checkpoint import Checkpoint
+from mm.engine import Engine
+from mm.marketmaker import Marketmaker
+from mm.test_replay import config
+from posmath.side import Side
+
+
+def warmed_up_engine(now):
+    engine = Engine(Marketmaker, config())
+    for i in range(0, 50):
+        engine.pnl.ema.add(Decimal(1000 + i % 7), now=now - 200 + 4 * i)
+    engine.pnl.nbbo.set_side(Side.BID, Decimal('999'))
+    engine.pnl.nbbo.set_side(Side.ASK, Decimal('1001'))
+    engine.algo.last_updated_time = now - 1
+    return engine
+
+
+def test_warm_start(tmpdir):
+    checkpoint = Checkpoint(str(tmpdir.join('state.json')))
+    engine = warmed_up_engine(1000)
+    assert checkpoint.save(engine, now=1000)
+    # nothing moved since
+    assert not checkpoint.save(engine, now=1001)
+
+    restarted = Engine(Marketmaker, config())
+    assert checkpoint.load(restarted, now=1002) == 2
+    assert restarted.pnl.ema.calc_ema(now=1002) == engine.pnl.ema.calc_ema(now=1002)
+    assert restarted.pnl.nbbo.bid() == Decimal('999')
+    assert restarted.algo.last_updated_time == 999
+
+
+def test_stale_checkpoint(tmpdir):
+    checkpoint = Checkpoint(str(tmpdir.join('state.json')), nbbo_max_age=5)
+    checkpoint.save(warmed_up_engine(1000), now=1000)
+
+    restarted = Engine(Marketmaker, config())
+    assert checkpoint.load(restarted, now=1150) == 150
+    # samples that left the window are gone, NBBO is too old to use
+    assert 0 < len(restarted.pnl.ema.values) < 50
+    assert restarted.pnl.nbbo.bid() == 0
+
+    restarted = Engine(Marketmaker, config())
+    checkpoint.load(restarted, now=2000)
+    assert restarted.pnl.ema.calc_ema(now=2000) == 0
+
+
+def test_no_checkpoint(tmpdir):
+    assert Checkpoint(str(tmpdir.join('state.json'))).load(Engine(Marketmaker, config())) is None
+
+
+def test_busy_window_merged(tmpdir):
+    filename = str(tmpdir.join('state.json'))
+    checkpoint = Checkpoint(filename, bucket=1.0)
+    engine = Engine(Marketmaker, config())
+    for i in range(0, 5000):
+        engine.pnl.ema.add(Decimal(1000) + Decimal(i % 13) / 10, now=1000 - 250 + i * 0.05)
+    checkpoint.save(engine, now=1000)
+    with open(filename) as f:
+        assert len(json.load(f)['ema']['samples']) == 250
+
+    restarted = Engine(Marketmaker, config())
+    checkpoint.load(restarted, now=1000)
+    assert restarted.pnl.ema.calc_ema(now=1000) == engine.pnl.ema.calc_ema(now=1000)
+    # a merged sample leaves the window up to a bucket later than its parts
+    later = abs(restarted.pnl.ema.calc_ema(now=1100) - engine.pnl.ema.calc_ema(now=1100))
+    assert later <= Decimal('0.001')
+
+
+def test_run_survives_write_errors(tmpdir):
+    checkpoint = Checkpoint(str(tmpdir.join('missing', 'state.json')), interval=0.01)
+    engine = warmed_up_engine(time.time())
+
+    async def scenario():
+        task = asyncio.ensure_future(checkpoint.run(engine))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert checkpoint.errors > 1 and checkpoint.saved == 0
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from decimal import Decimal
+from random import Random
+
+from mm.book import Book, SortedBook
+from mm.broadcast import Broadcaster
+from mm.delta import DeltaStream
+from mm.orders import OrderManager, Ack
+from posmath.side import Side
+from mm.test_broadcast import FakeWebsocket, Producer
+
+
+def apply(state, msg):
+    if msg['e'] == 'book_snapshot':
+        state['seq'] = msg['seq']
+        state['book'] = {side: dict((price, size) for price, size in levels)
+                         for side, levels in msg['details']['book'].items()}
+        state['orders'] = dict(msg['details']['orders'])
+    elif msg['e'] == 'book_delta':
+        assert msg['from'] == state['seq'] + 1
+        state['seq'] = msg['seq']
+        for side, changes in msg['details']['book'].items():
+            for price, size in changes:
+                if size == '0':
+                    state['book'][side].pop(price, None)
+                else:
+                    state['book'][side][price] = size
+        for key, order in msg['details']['orders'].items():
+            if order is None:
+                state['orders'].pop(key, None)
+            else:
+                state['orders'][key] = order
+
+
+def book_state(book):
+    return {side: {str(level.price): str(level.size) for level in book.quote(side) or []} for side in Side.sides}
+
+
+def test_snapshot_and_deltas_rebuild_state():
+    rnd = Random(5)
+    book = Book()
+    om = OrderManager()
+    broadcaster = Broadcaster(Producer(), deltas=DeltaStream(book, om), delta_interval=0.1)
+    fast, slow = FakeWebsocket(), FakeWebsocket()
+    subscribers = [broadcaster.subscribe(fast), broadcaster.subscribe(slow)]
+
+    def random_step():
+        for i in range(0, 5):
+            side = rnd.choice(Side.sides)
+            price = Decimal(1000 - Side.sign(side) * rnd.randrange(1, 15))
+            book.increment_level(side, price, Decimal(rnd.randrange(0, 4)))
+        if rnd.random() < 0.3:
+            om.new_req(Side.BID, Decimal(rnd.randrange(900, 990)), Decimal('0.01'))
+            req = om.request_queue.pop()
+            if rnd.random() < 0.5:
+                om.market_event(Ack(req.oid, str(rnd.randrange(0, 10 ** 6)), req.size, req.size))
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(subscriber.run()) for subscriber in subscribers]
+        for i in range(0, 5):
+            random_step()
+        broadcaster.subscribe_deltas(subscribers[0], 0, now=0)
+        random_step()
+        broadcaster.subscribe_deltas(subscribers[1], 0.5, now=0)
+        for step in range(1, 40):
+            random_step()
+            broadcaster.step_deltas(step / 10)
+            await asyncio.sleep(0)
+        broadcaster.step_deltas(100)
+        broadcaster.broadcast()
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+
+    asyncio.run(scenario())
+    for ws in [fast, slow]:
+        state = {}
+        for message in ws.sent:
+            if message.startswith('{'):
+                apply(state, json.loads(message))
+        assert state['seq'] == broadcaster.deltas.seq
+        assert state['book'] == book_state(book)
+        assert state['orders'] == broadcaster.deltas.current_orders()
+    assert len(slow.sent) < len(fast.sent)
+    assert 'book 1' not in fast.sent and 'pnl 1' in fast.sent
+
+
+def test_step_skips_unchanged_and_diffs_changed_levels():
+    book = SortedBook()
+    om = OrderManager()
+    for i in range(0, 50):
+        book.increment_level(Side.BID, Decimal(999 - i), Decimal(1))
+        book.increment_level(Side.ASK, Decimal(1001 + i), Decimal(1))
+    deltas = DeltaStream(book, om)
+    assert len(deltas.step()["book"][Side.BID]) == 50
+    assert deltas.step() is None and deltas.skipped == 1
+
+    book.increment_level(Side.BID, Decimal(990), Decimal(3))
+    book.increment_level(Side.ASK, Decimal(1001), Decimal(0))
+    book.increment_level(Side.ASK, Decimal(1060), Decimal(2))
+    book.increment_level(Side.ASK, Decimal(1060), Decimal(0))
+    assert deltas.step()["book"] == {Side.BID: [['990', '3']], Side.ASK: [['1001', '0']]}
+
+    book.clear()
+    book.increment_level(Side.BID, Decimal(999), Decimal(1))
+    delta = deltas.step()["book"]
+    assert len(delta[Side.BID]) == 49 and len(delta[Side.ASK]) == 49
+    assert deltas.levels == {Side.BID: {'999': '1'}, Side.ASK: {}}
+
+
+def test_book_tracks_changes_only_for_delta_subscribers():
+    book = SortedBook()
+    book.increment_level(Side.BID, Decimal(999), Decimal(1))
+    broadcaster = Broadcaster(Producer(), deltas=DeltaStream(book, OrderManager()))
+    assert book.changed is None
+    subscribers = [broadcaster.subscribe(FakeWebsocket()) for i in range(0, 2)]
+    for subscriber in subscribers:
+        broadcaster.subscribe_deltas(subscriber, 0, now=0)
+    book.increment_level(Side.BID, Decimal(998), Decimal(1))
+    assert book.changed == {(Side.BID, Decimal(998))}
+
+    broadcaster.unsubscribe(subscribers[0])
+    assert book.changed is not None
+    broadcaster.unsubscribe(subscribers[1])
+    assert book.changed is None
+    for i in range(0, 10):
+        book.increment_level(Side.ASK, Decimal(1001 + i), Decimal(1))
+    assert book.changed is None
+
+    # nothing tracked meanwhile, a new subscriber still gets the whole book
+    subscriber = broadcaster.subscribe(FakeWebsocket())
+    broadcaster.subscribe_deltas(subscriber, 0, now=1)
+    assert broadcaster.deltas.levels == book_state(book)
+    assert book.changed == set()
+
+
+def test_snapshots_only_for_full_subscribers():
+    broadcaster = Broadcaster(Producer(), deltas=DeltaStream(Book(), OrderManager()))
+    subscriber = broadcaster.subscribe(FakeWebsocket())
+    assert broadcaster.wanted('book')
+    broadcaster.subscribe_deltas(subscriber, 1, now=0)
+    assert not broadcaster.wanted('book') and broadcaster.wanted('pnl')
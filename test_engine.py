@@ -0,0 +1,50 @@
+import json
+from decimal import Decimal
+
+from mm.app_config import BookConfig
+from mm.engine import Engine
+from mm.test_replay import config, md_update
+from posmath.side import Side
+
+
+class CountingAlgo:
+    def __init__(self, engine):
+        self.runs = 0
+
+    def on_md(self):
+        self.runs += 1
+
+    def important_event(self, ev):
+        pass
+
+
+def test_burst_runs_strategy_once():
+    engine = Engine(CountingAlgo, config())
+    engine.update_book(json.loads(md_update(1, [[999 - i, 1] for i in range(0, 5)],
+                                            [[1001 + i, 1] for i in range(0, 5)])))
+    engine.update_book(json.loads(md_update(2, [[999, 2]], [])))
+    engine.update_book(json.loads(md_update(3, [], [[1001, 3]])))
+    engine.md_applied(3)
+
+    assert engine.algo.runs == 1
+    assert engine.book.quote(Side.BID).size == 2
+    assert engine.book.quote(Side.ASK).size == 3
+    assert engine.conflation.summary() == {'updates': 3, 'bursts': 1, 'conflated': 2, 'max_burst': 3}
+
+    engine.on_md(json.loads(md_update(4, [[998, 2]], [])))
+    assert engine.algo.runs == 2
+    assert engine.conflation.summary()['conflated'] == 2
+
+
+def test_book_depth_opt_in():
+    engine = Engine(CountingAlgo, config())
+    assert engine.book.max_depth is None
+    assert engine.config.book.subscribe_depth == BookConfig.SUBSCRIBE_DEPTH
+
+    capped = config()
+    capped.book = BookConfig({'depth': 5})
+    engine = Engine(CountingAlgo, capped)
+    for i in range(0, 10):
+        engine.book.increment_level(Side.BID, Decimal(999 - i), Decimal(1))
+    assert engine.book.levels(Side.BID) == 5
+    assert capped.book.subscribe_depth == 5
@@ -0,0 +1,54 @@
+import asyncio
+
+from mm.event_hub import EventHub, ImportantEvent
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def important_event(self, ev):
+        self.events.append(ev.event_name)
+
+
+def test_subscribers_get_their_topics():
+    hub = EventHub()
+    gaps = Recorder()
+    everything = Recorder()
+    hub.subscribe(gaps, [ImportantEvent.GAP])
+    hub.subscribe(everything)
+    hub.gap(3)
+    hub.rm_event('NORMAL')
+    hub.reconnect()
+
+    assert gaps.events == [ImportantEvent.GAP]
+    assert everything.events == [ImportantEvent.GAP, ImportantEvent.RM, ImportantEvent.RECONNECT]
+    assert hub.summary()['dispatch']['count'] == 3
+
+
+def test_deferred_off_the_caller():
+    hub = EventHub()
+    immediate = Recorder()
+    deferred = Recorder()
+    hub.subscribe(immediate, [ImportantEvent.GAP])
+    hub.subscribe(deferred, deferred=True)
+
+    async def scenario():
+        task = asyncio.ensure_future(hub.run())
+        await asyncio.sleep(0)
+        hub.gap(1)
+        hub.order_error('rejected')
+        assert immediate.events == [ImportantEvent.GAP]
+        assert deferred.events == []
+        assert hub.summary()['pending'] == 2
+        await asyncio.sleep(0)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert deferred.events == [ImportantEvent.GAP, ImportantEvent.ORDER_ERROR]
+    assert hub.summary()['queue']['count'] == 2
+    assert hub.summary()['pending'] == 0
+
+    # without run() deferred subscribers are called right away
+    hub.reconnect()
+    assert deferred.events[-1] == ImportantEvent.RECONNECT
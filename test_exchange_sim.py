@@ -0,0 +1,87 @@
+import json
+from decimal import Decimal
+
+from mm.cex_serialization import deserialize_order_event, serialize_request
+from mm.exchange_sim import ExchangeSim, SimConfig, MARKET
+from mm.orders import NewReq, CancelReq, Ack, Exec, Cancelled, ErrorRequest, OrderManager, Broker, CancelledAll
+from posmath.side import Side
+
+
+class FakeSession:
+    def __init__(self):
+        self.authenticated = False
+        self.subscribed = False
+        self.sent = []
+        self.bucket = self
+
+    def take(self):
+        return True
+
+    def send(self, msg):
+        self.sent.append(json.loads(json.dumps(msg)))
+
+
+def order_events(session):
+    events = [deserialize_order_event(msg['e'], msg) for msg in session.sent
+              if msg['e'] in ["place-order", "cancel-replace-order", "cancel-order", "cancel-orders", "order"]]
+    session.sent.clear()
+    return [ev for ev in events if ev is not None]
+
+
+def test_place_fill_and_cancel():
+    sim = ExchangeSim(SimConfig({}))
+    session = FakeSession()
+    sim.on_message(session, {'e': 'auth', 'auth': {}})
+    assert session.authenticated
+    sim.engine.place(Side.ASK, Decimal('1000.5'), Decimal('0.01'), MARKET)
+
+    req = NewReq(Side.BID, Decimal('1001'), Decimal('0.03'))
+    sim.on_message(session, json.loads(serialize_request(req)))
+    ack, fill = order_events(session)
+    assert type(ack) == Ack and ack.oid == req.oid and ack.amount == Decimal('0.03')
+    assert type(fill) == Exec and fill.order_id == ack.order_id and fill.remains == Decimal('0.02')
+    assert sim.balance['BTC'] == Decimal('1.01')
+
+    sim.on_message(session, json.loads(serialize_request(CancelReq(Side.BID, ack.order_id))))
+    cancelled, = order_events(session)
+    assert type(cancelled) == Cancelled and cancelled.order_id == ack.order_id
+
+    sim.on_message(session, json.loads(serialize_request(CancelReq(Side.BID, ack.order_id))))
+    not_found, = order_events(session)
+    assert type(not_found) == ErrorRequest and not_found.error_class == ErrorRequest.ORDER_NOT_FOUND
+
+
+def test_insufficient_funds():
+    sim = ExchangeSim(SimConfig({'currency_balance': '10'}))
+    session = FakeSession()
+    sim.on_message(session, {'e': 'auth', 'auth': {}})
+    sim.on_message(session, json.loads(serialize_request(NewReq(Side.BID, Decimal('1000'), Decimal('1')))))
+    err, = order_events(session)
+    assert err.error_class == ErrorRequest.INSUFICIENT_FUNDS
+
+
+def test_bulk_cancel():
+    sim = ExchangeSim(SimConfig({}))
+    session = FakeSession()
+    sim.on_message(session, {'e': 'auth', 'auth': {}})
+    om = OrderManager()
+    broker = Broker(om)
+    broker.request(0, Side.BID, Decimal('900'), Decimal('0.01'))
+    broker.request(0, Side.ASK, Decimal('1100'), Decimal('0.01'))
+
+    def exchange():
+        while len(om.request_queue) > 0:
+            sim.on_message(session, json.loads(serialize_request(om.request_queue.pop(0))))
+        for ev in order_events(session):
+            om.market_event(ev)
+
+    exchange()
+    assert len(om.by_order_id) == 2
+
+    broker.cancel_all()
+    assert len(om.request_queue) == 1
+    exchange()
+    assert om.is_flat()
+    assert om.cancel_all is None
+    assert om.time_to_flat.summary()['count'] == 1
+    assert len(sim.engine.orders) == 0 or all(o.owner == MARKET for o in sim.engine.orders.values())
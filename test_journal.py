@@ -0,0 +1,171 @@
+from decimal import Decimal
+
+from mm.engine import Engine
+from mm.journal import Journal
+from mm.marketmaker import Marketmaker
+from mm.orders import OrderManager, Ack, Cancelled, Exec, OrderStatus, Reconciler
+from mm.pnl import PNL
+from mm.orders import RiskManager
+from mm.test_replay import config
+from posmath.side import Side
+
+
+def journaled(filename):
+    om = OrderManager()
+    pnl = PNL('0')
+    journal = Journal(filename)
+    om.journal = journal
+    pnl.journal = journal
+    return om, pnl, journal
+
+
+def sent(om):
+    req = om.request_queue.pop()
+    om.request_sending(req)
+    om.request_sent(req)
+    return req
+
+
+def test_restart_restores_orders_and_position(tmpdir):
+    filename = str(tmpdir.join('orders.journal'))
+    om, pnl, journal = journaled(filename)
+    om.new_req(Side.BID, Decimal('99'), Decimal('2'))
+    om.market_event(Ack(sent(om).oid, '1', Decimal('2'), Decimal('2')))
+    om.new_req(Side.ASK, Decimal('101'), Decimal('1'))
+    om.market_event(Ack(sent(om).oid, '2', Decimal('1'), Decimal('1')))
+
+    tx = Exec(Decimal('0.5'), '1')
+    om.market_event(tx)
+    pnl.execution(tx)
+    # the replace and the last new never got an answer before the crash
+    om.replace_req('2', Side.ASK, Decimal('102'), Decimal('1'))
+    sent(om)
+    om.new_req(Side.BID, Decimal('98'), Decimal('1'))
+    sent(om)
+    journal.close()
+
+    restored_om, restored_pnl, restored = OrderManager(), PNL('0'), Journal(filename)
+    assert restored.restore(restored_om, restored_pnl) == 8
+    assert sorted(restored_om.by_order_id.keys()) == ['1', '2']
+    assert restored_om.by_order_id['1'].amount == Decimal('0.5')
+    assert restored_om.by_order_id['2'].price == Decimal('101')
+    assert all(order.status == OrderStatus.ACK for order in restored_om.by_order_id.values())
+    assert len(restored_om.by_oid) == 0
+    assert restored_pnl.position() == Decimal('1.5')
+    assert restored_pnl.balance() == pnl.balance()
+
+    # compacted down to a snapshot, which restores the same state again
+    assert restored.records == 1
+    restored.close()
+    again_om, again_pnl = OrderManager(), PNL('0')
+    Journal(filename).restore(again_om, again_pnl)
+    assert sorted(again_om.by_order_id.keys()) == ['1', '2']
+    assert again_pnl.position() == Decimal('1.5')
+
+
+def test_compacted_while_running(tmpdir):
+    filename = str(tmpdir.join('orders.journal'))
+    om, pnl, journal = journaled(filename)
+    journal.restore(om, pnl)
+    journal.max_size = 2048
+    for i in range(100):
+        om.new_req(Side.BID, Decimal('99'), Decimal('1'))
+        om.market_event(Ack(sent(om).oid, str(i), Decimal('1'), Decimal('1')))
+        om.cancel_req(str(i), Side.BID)
+        sent(om)
+        om.market_event(Cancelled(None, str(i)))
+        if i < 50:
+            # appending alone never compacts, that's left to the end of a tick
+            assert journal.compactions == 1
+        else:
+            journal.compact_if_due()
+    assert journal.offset <= journal.max_size + 512
+    om.new_req(Side.BID, Decimal('98'), Decimal('2'))
+    om.market_event(Ack(sent(om).oid, 'live', Decimal('2'), Decimal('2')))
+    tx = Exec(Decimal('1.5'), 'live')
+    om.market_event(tx)
+    pnl.execution(tx)
+    # the new is answered only after the journal started over from a snapshot
+    om.new_req(Side.ASK, Decimal('101'), Decimal('1'))
+    req = sent(om)
+    journal.compact(om, pnl)
+    om.market_event(Ack(req.oid, 'late', Decimal('1'), Decimal('1')))
+    assert journal.compactions > 2
+    journal.close()
+
+    restored_om, restored_pnl = OrderManager(), PNL('0')
+    Journal(filename).restore(restored_om, restored_pnl)
+    assert sorted(restored_om.by_order_id.keys()) == ['late', 'live']
+    assert restored_om.by_order_id['live'].amount == Decimal('1.5')
+    assert restored_pnl.position() == Decimal('0.5')
+
+
+def test_torn_record_ignored(tmpdir):
+    filename = str(tmpdir.join('orders.journal'))
+    journal = Journal(filename)
+    journal.append({'r': 'pnl', 'pos': '1', 'balance': '-100', 'closed_pnl': '0'})
+    offset = journal.offset
+    journal.append({'r': 'pnl', 'pos': '2', 'balance': '-200', 'closed_pnl': '0'})
+    # crash halfway through the second record
+    journal.map[offset + Journal.HEADER.size] ^= 0xff
+    journal.close()
+
+    journal = Journal(filename)
+    assert [record['pos'] for record in journal.read()] == ['1']
+    journal.append({'r': 'pnl', 'pos': '3', 'balance': '-300', 'closed_pnl': '0'})
+    assert [record['pos'] for record in journal.read()] == ['1', '3']
+    journal.close()
+
+
+def test_grows_past_mapping(tmpdir):
+    journal = Journal(str(tmpdir.join('orders.journal')))
+    record = {'r': 'cancelled', 'oid': 'x' * 1000, 'order_id': '1'}
+    count = 2 * Journal.GROW // 1000
+    for i in range(0, count):
+        journal.append(record)
+    assert len(journal.map) > Journal.GROW
+    assert sum(1 for record in journal.read()) == count
+    journal.close()
+
+
+def test_open_orders_reconciled():
+    om = OrderManager()
+    reconciler = Reconciler(om)
+    for order_id, price in [('1', Decimal('99')), ('2', Decimal('98'))]:
+        om.new_req(Side.BID, price, Decimal('1'))
+        om.market_event(Ack(om.request_queue.pop().oid, order_id, Decimal('1'), Decimal('1')))
+    om.new_req(Side.ASK, Decimal('103'), Decimal('1'))
+
+    # '2' went away, '3' was placed before the restart, '4' is the unanswered new
+    adopted, fills, gone = om.sync_open_orders([('1', Side.BID, Decimal('99'), Decimal('0.5')),
+                                         ('3', Side.ASK, Decimal('102'), Decimal('1')),
+                                         ('4', Side.ASK, Decimal('103'), Decimal('1'))])
+    assert [order.order_id for order in adopted] == ['3']
+    assert [order.order_id for order in gone] == ['2']
+    assert sorted(om.by_order_id.keys()) == ['1', '3']
+    assert [(tx.order_id, tx.remains) for tx in fills] == [('1', Decimal('0.5'))]
+    # the missed fill is left to the exec path
+    assert om.by_order_id['1'].amount == Decimal('1')
+
+    reconciler.adopt(adopted[0])
+    reconciler.reconcile(Side.ASK, [], Decimal('0.0005'))
+    assert om.request_queue[-1].order_id == '3'
+
+
+def test_missed_fills_reach_position():
+    engine = Engine(Marketmaker, config())
+    om = engine.order_manager
+    for order_id in ['1', '2']:
+        om.new_req(Side.BID, Decimal('99'), Decimal('1'))
+        om.market_event(Ack(om.request_queue.pop().oid, order_id, Decimal('1'), Decimal('1')))
+    engine.rm.set_normal()
+
+    engine.sync_open_orders([('1', Side.BID, Decimal('99'), Decimal('0.25')),
+                             ('2', Side.BID, Decimal('99'), Decimal('1'))])
+    assert engine.pnl.position() == Decimal('0.75')
+    assert engine.rm.status == RiskManager.NORMAL
+
+    # '2' is gone, filled or cancelled, the position is in doubt
+    engine.sync_open_orders([('1', Side.BID, Decimal('99'), Decimal('0.25'))])
+    assert engine.rm.status == RiskManager.CANCEL_ALL
+    assert engine.resync_balance
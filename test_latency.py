@@ -0,0 +1,86 @@
+import time
+from decimal import Decimal
+from random import Random
+
+from mm.latency import LatencyHistogram, TickToTrade
+from mm.orders import OrderManager, Ack, ErrorRequest, OrderStatus
+from posmath.side import Side
+
+
+def test_histogram_buckets():
+    rnd = Random(1)
+    for value in list(range(0, 5000)) + [rnd.randrange(1, 10 ** 12) for i in range(0, 10000)]:
+        bucket = LatencyHistogram.bucket(value)
+        assert LatencyHistogram.bucket_top(bucket) >= value
+        assert bucket == 0 or LatencyHistogram.bucket_top(bucket - 1) < value
+        assert LatencyHistogram.bucket_top(bucket) <= value * 1.125 + 1
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for i in range(1, 1001):
+        histogram.record(i * 1000)
+    summary = histogram.summary()
+    assert summary['count'] == 1000
+    assert 500 <= summary['p50'] <= 500 * 1.125
+    assert 990 <= summary['p99'] <= 1000
+    assert summary['max'] == 1000
+
+
+def test_tick_to_trade_stages():
+    latency = TickToTrade()
+    latency.start()
+    for stage in [TickToTrade.PARSED, TickToTrade.BOOK, TickToTrade.STRATEGY]:
+        latency.mark(stage)
+    origin = latency.origin()
+    latency.finish()
+    latency.outbound(origin, origin + 1000, origin + 2000, origin + 3000, origin + 5000)
+
+    latency.start()
+    latency.mark(TickToTrade.PARSED)
+    latency.mark(TickToTrade.BOOK)
+    latency.finish()
+
+    summary = latency.summary()
+    assert summary['parse']['count'] == 2
+    assert summary['book']['count'] == 2
+    assert summary['strategy']['count'] == 1
+    assert summary['send']['count'] == 1
+    assert summary['tick_to_trade']['count'] == 1
+    assert summary['tick_to_trade']['max'] == 5
+
+
+def test_order_round_trips():
+    om = OrderManager()
+    order = om.new_req(Side.BID, Decimal('100'), Decimal('1'))
+    req = om.request_queue.pop()
+    om.request_sent(req)
+    assert om.round_trips.summary()['in_flight'] == 1
+
+    om.market_event(Ack(req.oid, '1', Decimal('1'), Decimal('1')))
+    om.cancel_req('1', Side.BID)
+    cancel = om.request_queue.pop()
+    om.request_sent(cancel)
+    om.market_event(ErrorRequest(cancel.oid, 'Rate limit exceeded', ErrorRequest.RATE_LIMIT))
+
+    summary = om.round_trips.summary()
+    assert summary['in_flight'] == 0
+    assert summary['requests']['NewReq']['count'] == 1
+    assert summary['errors'][ErrorRequest.RATE_LIMIT]['count'] == 1
+    assert order.status == OrderStatus.ACK
+
+
+def test_tick_to_trade_from_frame_receipt():
+    latency = TickToTrade()
+    received = time.perf_counter_ns() - 3000000
+    latency.start(received=received)
+    latency.mark(TickToTrade.PARSED)
+    origin = latency.origin()
+    latency.finish()
+    sent = time.perf_counter_ns()
+    latency.outbound(origin, sent, sent, sent, sent)
+
+    summary = latency.summary()
+    # the 3ms the frame waited before the tick picked it up are in both
+    assert summary['wait']['max'] >= 3000
+    assert summary['tick_to_trade']['max'] >= 3000
@@ -0,0 +1,39 @@
+import time
+
+from mm.log_writer import LogWriter
+
+
+def test_lines_written_in_batches(tmpdir):
+    filename = str(tmpdir.join('orders.log'))
+    writer = LogWriter(filename, batch_size=2, flush_interval=60)
+    for i in range(0, 4):
+        writer.log('{"in":%s}', i)
+    writer.log('multi\nline')
+    writer.close()
+
+    with open(filename) as f:
+        assert f.read().splitlines() == ['{"in":0}', '{"in":1}', '{"in":2}', '{"in":3}', 'multi line']
+    assert writer.summary()['written'] == 5
+    assert writer.summary()['batches'] >= 3
+
+
+def test_flushed_on_time(tmpdir):
+    filename = str(tmpdir.join('orders.log'))
+    writer = LogWriter(filename, flush_interval=0.01)
+    writer.log('%s', 'quiet')
+    deadline = time.time() + 5
+    while writer.summary()['written'] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert writer.summary()['written'] == 1
+    writer.close()
+
+
+def test_full_buffer_drops(tmpdir):
+    writer = LogWriter(str(tmpdir.join('orders.log')), max_pending=3, batch_size=10, flush_interval=60)
+    for i in range(0, 5):
+        writer.log('%s', i)
+    assert writer.summary()['dropped'] == 2
+    writer.close()
+    assert writer.summary()['written'] == 3
+    writer.log('%s', 'after close')
+    assert writer.summary()['dropped'] == 3
@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+from mm.matching import MatchingEngine
+from posmath.side import Side
+
+
+def test_price_time_priority():
+    engine = MatchingEngine()
+    first, fills = engine.place(Side.ASK, Decimal('101'), Decimal('1'), 'market')
+    second, fills = engine.place(Side.ASK, Decimal('101'), Decimal('1'), 'client')
+    better, fills = engine.place(Side.ASK, Decimal('100'), Decimal('0.5'), 'market')
+    assert fills == []
+    assert engine.best_price(Side.ASK) == Decimal('100')
+
+    taker, fills = engine.place(Side.BID, Decimal('101'), Decimal('2'), 'market')
+    assert [(f.maker, f.price, f.amount) for f in fills] == [(better, Decimal('100'), Decimal('0.5')),
+                                                            (first, Decimal('101'), Decimal('1')),
+                                                            (second, Decimal('101'), Decimal('0.5'))]
+    assert taker.remains == 0
+    assert second.remains == Decimal('0.5')
+    assert engine.depth(Side.ASK, 10) == [[Decimal('101'), Decimal('0.5')]]
+    assert engine.best_price(Side.BID) is None
+
+
+def test_limit_rests_and_market_sweeps():
+    engine = MatchingEngine()
+    engine.place(Side.BID, Decimal('99'), Decimal('1'), 'market')
+    engine.place(Side.BID, Decimal('98'), Decimal('1'), 'market')
+    order, fills = engine.place(Side.ASK, Decimal('98.5'), Decimal('2'), 'client')
+    assert [f.price for f in fills] == [Decimal('99')]
+    assert order.remains == Decimal('1')
+    assert engine.best_price(Side.ASK) == Decimal('98.5')
+
+    sweep, fills = engine.place(Side.BID, None, Decimal('5'), 'market')
+    assert [f.price for f in fills] == [Decimal('98.5')]
+    assert sweep.remains == Decimal('4')
+    assert engine.best_price(Side.ASK) is None
+
+
+def test_cancel_and_changes():
+    engine = MatchingEngine()
+    order, fills = engine.place(Side.BID, Decimal('99'), Decimal('1'), 'client')
+    engine.place(Side.BID, Decimal('99'), Decimal('2'), 'market')
+    engine.pop_changes()
+
+    assert engine.cancel(order.order_id) is order
+    assert engine.cancel(order.order_id) is None
+    changes = engine.pop_changes()
+    assert changes.bid() == [[Decimal('99'), Decimal('2')]]
+    assert changes.ask() == []
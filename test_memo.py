@@ -0,0 +1,70 @@
+import json
+from decimal import Decimal
+
+from mm.client_serialization import serialize_book, serialize_pnl, pnl_memo
+from mm.engine import Engine
+from mm.marketmaker import Marketmaker
+from mm.memo import Memo
+from mm.orders import Exec
+from mm.pnl import PNL
+from mm.test_replay import config, md_update
+from posmath.side import Side
+
+
+def test_memo_recomputes_on_key_change():
+    calls = []
+    memo = Memo(lambda x: calls.append(x) or x * 2)
+    assert memo(1, 10) == 20
+    assert memo(1, 11) == 20
+    assert memo(2, 11) == 22
+    assert calls == [10, 11]
+    assert memo.summary() == {'hits': 1, 'misses': 2}
+
+
+def test_book_version():
+    engine = Engine(Marketmaker, config())
+    engine.on_md(json.loads(md_update(1, [[999, 1]], [[1001, 1]])))
+    first = serialize_book(engine.book)
+    version = engine.book.version
+    assert serialize_book(engine.book) is first
+
+    engine.on_md(json.loads(md_update(2, [[999, 2]], [])))
+    assert engine.book.version > version
+    assert json.loads(serialize_book(engine.book))['details'][Side.BID][0] == ['999', '2']
+
+
+def test_pnl_version():
+    pnl = PNL('0.1')
+    misses = pnl_memo.misses
+    first = serialize_pnl(pnl)
+    assert serialize_pnl(pnl) is first
+    assert pnl_memo.misses == misses + 1
+
+    tx = Exec(Decimal('0'), '1')
+    tx.side, tx.delta, tx.price = Side.BID, Decimal('1'), Decimal('100')
+    pnl.execution(tx)
+    assert json.loads(serialize_pnl(pnl))['details']['position'] == '1'
+
+    # the EMA window moves on without any mutation
+    pnl.ema.add(Decimal('100'), now=0)
+    version = pnl.state_version(now=0)
+    assert pnl.state_version(now=1000) != version
+
+
+def test_tick_skipped_when_nothing_changed():
+    engine = Engine(Marketmaker, config())
+    engine.rm.set_normal()
+    engine.on_md(json.loads(md_update(1, [[999 - i, 1] for i in range(0, 5)],
+                                      [[1001 + i, 1] for i in range(0, 5)])))
+    requests = len(engine.order_manager.request_queue)
+    assert requests > 0
+
+    # the first repeat settles versions bumped by the tick itself
+    engine.algo.on_tick()
+    skipped = engine.algo.skipped_ticks
+    engine.algo.on_tick()
+    assert engine.algo.skipped_ticks == skipped + 1
+    assert len(engine.order_manager.request_queue) == requests
+
+    engine.on_md(json.loads(md_update(2, [[999, 2]], [])))
+    assert engine.algo.skipped_ticks == skipped + 1
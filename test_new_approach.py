@@ -23,7 +23,7 @@ def test_stick_to_quote(position):
     book = gen_book()
 
     print(position)
-    position = bound_pos_to_lower_quote(book.quote(position.side()), position, Decimal('0.0001'))
+    position = bound_pos_to_lower_quote(book, position.side(), position, Decimal('0.0001'))
     broker = Broker(OrderManager())
     broker.request(0, position.side(), position.price(), position.abs_position())
     keys = broker.om.by_oid.keys()
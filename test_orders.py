@@ -0,0 +1,126 @@
+from decimal import Decimal
+
+from mm.orders import OrderManager, Broker, Reconciler, Ack, CancelledAll, ErrorRequest, NewReq, ReplaceReq, \
+    CancelReq, CancelAllReq, OrderStatus, OidAllocator
+from posmath.side import Side
+
+
+def ack_all(om):
+    order_id = 0
+    while len(om.request_queue) > 0:
+        req = om.request_queue.pop(0)
+        order_id += 1
+        om.market_event(Ack(req.oid, str(order_id), req.size, req.size))
+
+
+def test_single_order_cancelled_directly():
+    om = OrderManager()
+    broker = Broker(om)
+    broker.request(0, Side.BID, Decimal('100'), Decimal('1'))
+    ack_all(om)
+    broker.cancel_all()
+    assert [type(req) for req in om.request_queue] == [CancelReq]
+
+
+def test_bulk_cancel_fallback():
+    om = OrderManager()
+    broker = Broker(om)
+    broker.request(0, Side.BID, Decimal('100'), Decimal('1'))
+    broker.request(0, Side.ASK, Decimal('101'), Decimal('1'))
+    ack_all(om)
+
+    broker.cancel_all()
+    broker.cancel_all()
+    bulk, = om.request_queue
+    assert type(bulk) == CancelAllReq
+    om.request_queue.clear()
+
+    om.market_event(ErrorRequest(bulk.oid, 'Unknown event', ErrorRequest.UNEXPECTED_ERROR))
+    assert sorted(req.order_id for req in om.request_queue) == ['1', '2']
+    assert all(type(req) == CancelReq for req in om.request_queue)
+    assert om.by_order_id['1'].status == OrderStatus.ACK
+
+
+def test_cancel_all_keeps_orders_in_transition():
+    om = OrderManager()
+    broker = Broker(om)
+    reconciler = broker.reconciler
+    broker.reconcile(Side.BID, ladder(Decimal('100'), Decimal('-1'), 2), Decimal('0.5'))
+    ack_all(om)
+    broker.reconcile(Side.ASK, ladder(Decimal('101'), Decimal('1'), 2), Decimal('0.5'))
+    broker.request(0, Side.BID, Decimal('98'), Decimal('1'))
+    in_flight = list(om.request_queue)
+    om.request_queue.clear()
+
+    broker.cancel_all()
+    bulk, = om.request_queue
+    assert type(bulk) == CancelAllReq
+    assert len(reconciler.live(Side.BID)) == 0 and len(reconciler.live(Side.ASK)) == 2
+    assert broker.order(0, Side.BID) is not None
+    om.request_queue.clear()
+
+    # the bulk cancel reached the venue before these did, so it missed them
+    om.market_event(CancelledAll(bulk.oid, ['1', '2']))
+    om.market_event(Ack(in_flight[0].oid, '10', Decimal('1'), Decimal('1')))
+    om.market_event(ErrorRequest(in_flight[1].oid, 'Insufficient funds', ErrorRequest.INSUFICIENT_FUNDS))
+    om.market_event(Ack(in_flight[2].oid, '12', Decimal('1'), Decimal('1')))
+    assert len(reconciler.live(Side.ASK)) == 1
+
+    broker.cancel_all()
+    assert [type(req) for req in om.request_queue] == [CancelAllReq]
+    assert len(reconciler.live(Side.ASK)) == 0 and broker.order(0, Side.BID) is None
+
+
+def ladder(start, step, levels, size=Decimal('1')):
+    return [(start + i * step, size) for i in range(0, levels)]
+
+
+def test_reconcile_ladder():
+    om = OrderManager()
+    reconciler = Reconciler(om)
+    tolerance = Decimal('0.5')
+    reconciler.reconcile(Side.BID, ladder(Decimal('100'), Decimal('-1'), 3), tolerance, now=0)
+    assert [type(req) for req in om.request_queue] == [NewReq] * 3
+    ack_all(om)
+
+    reconciler.reconcile(Side.BID, ladder(Decimal('100.2'), Decimal('-1'), 3), tolerance, now=1)
+    assert len(om.request_queue) == 0
+
+    # the ladder moves one level down: only the order that fell out of tolerance moves
+    reconciler.reconcile(Side.BID, ladder(Decimal('99'), Decimal('-1'), 3), tolerance, now=2)
+    replace, = om.request_queue
+    assert type(replace) == ReplaceReq and replace.order_id == '1' and replace.price == Decimal('97')
+    om.request_queue.clear()
+
+    # the order being replaced holds its slot until the venue answers
+    reconciler.reconcile(Side.BID, ladder(Decimal('99'), Decimal('-1'), 3), tolerance, now=3)
+    assert len(om.request_queue) == 0
+
+    reconciler.reconcile(Side.BID, ladder(Decimal('99'), Decimal('-1'), 1), tolerance, now=4)
+    cancel, = om.request_queue
+    assert type(cancel) == CancelReq and cancel.order_id == '3'
+
+
+def test_reconcile_min_interval_and_budget():
+    om = OrderManager()
+    reconciler = Reconciler(om)
+    tolerance = Decimal('0.1')
+    reconciler.reconcile(Side.ASK, ladder(Decimal('100'), Decimal('1'), 2), tolerance, now=0)
+    ack_all(om)
+
+    reconciler.reconcile(Side.ASK, ladder(Decimal('105'), Decimal('1'), 2), tolerance, min_interval=10, now=5)
+    assert len(om.request_queue) == 0
+    reconciler.reconcile(Side.ASK, ladder(Decimal('105'), Decimal('1'), 2), tolerance, min_interval=10, budget=1,
+                         now=10)
+    replace, = om.request_queue
+    assert type(replace) == ReplaceReq and replace.price == Decimal('105')
+
+
+def test_oids_unique_per_session():
+    first = OidAllocator()
+    oids = [first.next() for i in range(0, 3)]
+    assert len(set(oids)) == 3
+    assert all(oid.startswith(first.prefix) for oid in oids)
+    # a later session never hands out an oid of an earlier one
+    assert OidAllocator().prefix != first.prefix
+    assert OidAllocator('s1_').next() == 's1_1'
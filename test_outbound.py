@@ -0,0 +1,179 @@
+import asyncio
+import json
+from decimal import Decimal
+
+from mm.app_config import RateLimitConfig
+from mm.latency import TickToTrade
+from mm.outbound import OutboundQueue, OutboundPipeline
+from mm.ratelimit import RateLimiter
+from mm.orders import OrderManager, RiskManager, Ack, NewReq, ReplaceReq, CancelReq, CancelAllReq, \
+    OrderStatus
+from posmath.side import Side
+
+
+def acked_order(om, order_id, side=Side.BID, price=Decimal('100')):
+    om.new_req(side, price, Decimal('1'))
+    req = om.request_queue.pop()
+    om.market_event(Ack(req.oid, order_id, Decimal('1'), Decimal('1')))
+    return om.by_order_id[order_id]
+
+
+def drain(queue):
+    reqs = []
+    while len(queue) > 0:
+        reqs.append(queue.pop().req)
+    return reqs
+
+
+def test_fifo_within_kind():
+    om = OrderManager()
+    queue = OutboundQueue(om)
+    om.new_req(Side.BID, Decimal('99'), Decimal('1'))
+    om.new_req(Side.ASK, Decimal('101'), Decimal('1'))
+    om.new_req(Side.BID, Decimal('98'), Decimal('1'))
+    reqs = list(om.request_queue)
+    for req in reqs:
+        queue.push(req)
+    assert drain(queue) == reqs
+
+
+class FakeRM:
+    def __init__(self, status):
+        self.status = status
+
+
+def test_priority():
+    om = OrderManager()
+    acked_order(om, '1')
+    acked_order(om, '2', Side.ASK, Decimal('101'))
+    om.new_req(Side.BID, Decimal('99'), Decimal('1'))
+    om.replace_req('2', Side.ASK, Decimal('102'), Decimal('1'))
+    om.cancel_req('1', Side.BID)
+
+    queue = OutboundQueue(om, FakeRM(RiskManager.NORMAL))
+    for req in om.request_queue:
+        queue.push(req)
+    assert [type(req) for req in drain(queue)] == [NewReq, ReplaceReq, CancelReq]
+
+    # cancels jump the line only while everything is being cancelled
+    queue = OutboundQueue(om, FakeRM(RiskManager.CANCEL_ALL))
+    for req in om.request_queue:
+        queue.push(req)
+    assert [type(req) for req in drain(queue)] == [CancelReq, ReplaceReq, NewReq]
+
+
+def test_cancel_all_drops_replaces():
+    om = OrderManager()
+    queue = OutboundQueue(om)
+    acked_order(om, '1')
+    acked_order(om, '2', Side.ASK, Decimal('101'))
+    om.replace_req('1', Side.BID, Decimal('99'), Decimal('1'))
+    om.replace_req('2', Side.ASK, Decimal('102'), Decimal('1'))
+    om.cancel_all_req()
+    for req in om.request_queue:
+        queue.push(req)
+
+    assert [type(req) for req in drain(queue)] == [CancelAllReq]
+    assert len(om.by_oid) == 0
+
+
+class FakeEngine:
+    def __init__(self):
+        self.order_manager = OrderManager()
+        self.latency = TickToTrade()
+        self.rate_limiter = RateLimiter(RateLimitConfig({'rate': 1000, 'burst': 1}))
+        self.rm = None
+
+
+def test_pipeline_sends_in_background():
+    engine = FakeEngine()
+    pipeline = OutboundPipeline(engine)
+    sent = []
+
+    async def send(sreq):
+        sent.append(json.loads(sreq)['e'])
+
+    async def scenario():
+        task = asyncio.ensure_future(pipeline.run(send))
+        engine.latency.start()
+        engine.order_manager.new_req(Side.BID, Decimal('99'), Decimal('1'))
+        engine.order_manager.new_req(Side.ASK, Decimal('101'), Decimal('1'))
+        pipeline.submit()
+        engine.latency.finish()
+        assert len(engine.order_manager.request_queue) == 0
+        assert engine.rate_limiter.backlog == 2
+        # the second request waits for the bucket to refill
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert sent == ['place-order', 'place-order']
+    assert pipeline.summary()['sent'] == 2
+    assert engine.order_manager.round_trips.summary()['in_flight'] == 2
+    assert engine.latency.summary()['tick_to_trade']['count'] == 2
+
+
+def test_send_failure_keeps_pipeline_alive(monkeypatch):
+    monkeypatch.setattr(OutboundPipeline, 'RETRY_DELAY', 0)
+    engine = FakeEngine()
+    engine.rate_limiter = RateLimiter(RateLimitConfig({'rate': 1000, 'burst': 10}))
+    pipeline = OutboundPipeline(engine)
+    om = engine.order_manager
+    order = acked_order(om, '1')
+    om.new_req(Side.ASK, Decimal('101'), Decimal('1'))
+    om.cancel_req('1', Side.BID)
+    new_order = om.by_oid[om.request_queue[0].oid]
+    sent = []
+
+    async def broken(sreq):
+        raise ConnectionError('connection lost')
+
+    async def send(sreq):
+        sent.append(json.loads(sreq)['e'])
+
+    async def scenario():
+        task = asyncio.ensure_future(pipeline.run(broken))
+        pipeline.submit()
+        await asyncio.sleep(0.01)
+        assert not task.done()
+        task.cancel()
+        # the next connection sends the cancel that didn't make it
+        task = asyncio.ensure_future(pipeline.run(send))
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert pipeline.failed >= 2
+    assert new_order.status == OrderStatus.COMPLETED
+    assert order.status == OrderStatus.ACK
+    assert sent == ['cancel-order']
+
+
+def test_cancel_first_when_tokens_run_short():
+    def run(burst):
+        engine = FakeEngine()
+        engine.rm = FakeRM(RiskManager.NORMAL)
+        engine.rate_limiter = RateLimiter(RateLimitConfig({'rate': 100, 'burst': burst}))
+        pipeline = OutboundPipeline(engine)
+        om = engine.order_manager
+        acked_order(om, '1')
+        sent = []
+
+        async def send(sreq):
+            sent.append(json.loads(sreq)['e'])
+
+        async def scenario():
+            task = asyncio.ensure_future(pipeline.run(send))
+            om.new_req(Side.ASK, Decimal('101'), Decimal('1'))
+            om.cancel_req('1', Side.BID)
+            pipeline.submit()
+            await asyncio.sleep(0.05)
+            task.cancel()
+
+        asyncio.run(scenario())
+        return sent
+
+    # one token for two requests, the cancel of the stale quote takes it
+    assert run(1) == ['cancel-order', 'place-order']
+    # with tokens to spare they leave in the order they came
+    assert run(10) == ['place-order', 'cancel-order']
@@ -0,0 +1,42 @@
+from mm.app_config import RateLimitConfig
+from mm.ratelimit import RateLimiter
+
+
+def limiter(**config):
+    limiter = RateLimiter(RateLimitConfig(config))
+    limiter.last_time = 0
+    return limiter
+
+
+def test_bucket():
+    rl = limiter(rate=10, burst=5)
+    for i in range(0, 5):
+        assert rl.take(now=0)
+    assert not rl.take(now=0)
+    assert abs(rl.delay(now=0) - 0.1) < 1e-9
+    assert rl.take(now=0.1)
+    assert abs(rl.available(now=100) - 5) < 1e-9
+
+
+def test_backoff_and_recovery():
+    rl = limiter(rate=10, burst=5, min_rate=2, backoff=0.5, recovery_time=10, recovery_step=0.1)
+    rl.throttled(now=0)
+    assert rl.rate == 5
+    assert rl.available(now=0) == 0
+    rl.throttled(now=1)
+    rl.throttled(now=2)
+    assert rl.rate == 2
+
+    rl.available(now=12)
+    assert rl.rate == 3
+    rl.available(now=22)
+    assert rl.rate == 4
+    for t in range(30, 200, 10):
+        rl.available(now=t)
+    assert rl.rate == 10
+
+
+def test_budget_counts_backlog():
+    rl = limiter(rate=10, burst=5)
+    rl.backlog = 3
+    assert abs(rl.budget(now=0) - 2) < 1e-9
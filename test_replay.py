@@ -0,0 +1,81 @@
+import json
+
+from mm.app_config import AppConfig
+from mm.cex_serialization import auth_request, create_signature
+from mm.engine import Engine
+from mm.marketmaker import Marketmaker
+from mm.recorder import Recorder, read_frames
+from mm.replay import Replay
+from posmath.side import Side
+
+
+def config():
+    return AppConfig({
+        "venue": {"url": "ws://localhost:8765", "key": "key", "secret": "secret", "taker_comission_percent": "0.16",
+                  "tick_size": "0.0001", "min_order_size": "0.01", "start_pos": "0", "start_balance": "0"},
+        "logging": {"dir": ".", "level": "INFO"},
+        "client": {"enabled": False, "port": 8999},
+        "asset": {"currency": "USD", "crypto": "BTC"},
+        "algo": {"config_class": "mm.new_approach.HedgeConfig", "max_pos": "0.1",
+                 "liq_behind": {"BID": "0.5", "ASK": "0.5"}, "order_size": {"BID": "0.02", "ASK": "0.02"},
+                 "ema_work_perc": "0.1", "hedge_perc": "0.01", "refresh_timeout": "0",
+                 "price_tolerance": "0.0005", "min_levels": "3"},
+        "accounts": {}
+    })
+
+
+def md_update(snap_id, bids, asks):
+    return json.dumps({'e': 'md_update', 'data': {'id': snap_id, 'pair': 'BTC:USD', 'bids': bids, 'asks': asks}})
+
+
+def test_record_and_replay(tmpdir):
+    filename = str(tmpdir.join('frames.rec'))
+    recorder = Recorder(filename)
+    recorder.inbound(md_update(1, [[999 - i, 1] for i in range(0, 5)], [[1001 + i, 1] for i in range(0, 5)]))
+    recorder.outbound(json.dumps({'e': 'place-order', 'oid': 'recorded-oid', 'data': {}}))
+    recorder.inbound(json.dumps({'e': 'place-order', 'oid': 'recorded-oid', 'ok': 'ok',
+                                 'data': {'id': 77, 'pending': '0.02', 'amount': '0.02'}}))
+    recorder.inbound(md_update(2, [[999, 2]], []))
+    recorder.close()
+
+    frames = list(read_frames(filename))
+    assert [direction for direction, timestamp, data in frames] == [Recorder.IN, Recorder.OUT, Recorder.IN, Recorder.IN]
+    assert frames[0][1] <= frames[-1][1]
+
+    engine = Engine(Marketmaker, config())
+    engine.rm.set_normal()
+    stats = Replay(engine).run(filename)
+
+    assert stats['md_updates'] == 2
+    assert stats['order_events'] == 1
+    assert stats['requests'] >= 1
+    assert '77' in engine.order_manager.by_order_id
+    assert engine.book.quote(Side.BID).size == 2
+
+
+def test_recorded_oids_paired_in_send_order(tmpdir):
+    filename = str(tmpdir.join('frames.rec'))
+    recorder = Recorder(filename)
+    recorder.outbound(auth_request('key', 'secret'))
+    recorder.inbound(md_update(1, [[999 - i, 1] for i in range(0, 5)], [[1001 + i, 1] for i in range(0, 5)]))
+    recorder.outbound(json.dumps({'e': 'open-orders', 'oid': 'recorded-open', 'data': {}}))
+    recorder.outbound(json.dumps({'e': 'place-order', 'oid': 'recorded-bid', 'data': {}}))
+    recorder.outbound(json.dumps({'e': 'place-order', 'oid': 'recorded-ask', 'data': {}}))
+    recorder.inbound(json.dumps({'e': 'place-order', 'oid': 'recorded-ask', 'ok': 'ok',
+                                 'data': {'id': 78, 'pending': '0.02', 'amount': '0.02'}}))
+    recorder.inbound(json.dumps({'e': 'place-order', 'oid': 'recorded-bid', 'ok': 'ok',
+                                 'data': {'id': 77, 'pending': '0.02', 'amount': '0.02'}}))
+    recorder.close()
+
+    # the key and signature never reach the file
+    with open(filename) as f:
+        recorded = f.read()
+    assert 'REDACTED' in recorded
+    assert '"key": "key"' not in recorded and create_signature('key', 'secret')[1] not in recorded
+
+    engine = Engine(Marketmaker, config())
+    engine.rm.set_normal()
+    stats = Replay(engine).run(filename)
+    assert stats['mismatched'] == 0
+    assert engine.order_manager.by_order_id['77'].side == Side.BID
+    assert engine.order_manager.by_order_id['78'].side == Side.ASK
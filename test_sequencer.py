@@ -0,0 +1,68 @@
+import json
+
+from mm.engine import Engine
+from mm.sequencer import Sequencer
+from mm.test_engine import CountingAlgo
+from mm.test_replay import config, md_update
+from posmath.side import Side
+
+
+def test_reorder_within_window():
+    sequencer = Sequencer()
+    assert sequencer.push(1, 'a') == (['a'], 0)
+    assert sequencer.push(3, 'c') == ([], 0)
+    assert sequencer.push(2, 'b') == (['b', 'c'], 0)
+    assert sequencer.push(2, 'b') == ([], 0)
+    summary = sequencer.summary()
+    assert summary['reordered'] == 1 and summary['stale'] == 1 and summary['gaps'] == 0
+
+
+def test_gap_buffers_until_snapshot():
+    sequencer = Sequencer()
+    sequencer.push(1, 'a')
+    for seq in range(3, 3 + Sequencer.REORDER_WINDOW):
+        assert sequencer.push(seq, seq) == ([], 0)
+    ready, gap = sequencer.push(10, 10)
+    assert ready == [] and gap == 2
+    assert sequencer.push(11, 11) == ([], 0)
+
+    assert sequencer.snapshot(4) == [5]
+    assert sequencer.push(6, 6) == ([6], 0)
+    sequencer.valid()
+    assert sequencer.summary()['time_to_valid']['count'] == 1
+
+
+def test_engine_resubscribes_on_gap():
+    engine = Engine(CountingAlgo, config())
+    snapshot = json.loads(md_update(1, [[999 - i, 1] for i in range(0, 5)], [[1001 + i, 1] for i in range(0, 5)]))
+    engine.on_snapshot(snapshot)
+    engine.update_book(json.loads(md_update(2, [[999, 2]], [])))
+    for snap_id in range(4, 5 + Sequencer.REORDER_WINDOW):
+        engine.update_book(json.loads(md_update(snap_id, [[999, snap_id]], [])))
+    assert engine.resubscribe
+    assert not engine.book.is_valid()
+
+    snapshot = json.loads(md_update(5, [[998, 1]], [[1002, 1]]))
+    engine.on_snapshot(snapshot)
+    assert engine.book.is_valid()
+    assert engine.book.quote(Side.BID).price == 999
+    assert engine.book.quote(Side.BID).size == 4 + Sequencer.REORDER_WINDOW
+    assert engine.sequencer.summary()['time_to_valid']['count'] == 1
+
+
+def test_snapshot_requested_again():
+    engine = Engine(CountingAlgo, config())
+    engine.sequencer.requested(100)
+    engine.check_snapshot(104)
+    assert not engine.resubscribe
+    engine.check_snapshot(100 + Sequencer.SNAPSHOT_TIMEOUT + 1)
+    assert engine.resubscribe
+    assert engine.sequencer.summary()['snapshot_timeouts'] == 1
+
+    engine.resubscribe = False
+    engine.sequencer.requested(200)
+    engine.snapshot_failed({'e': 'order-book-subscribe', 'ok': 'error', 'data': {'error': 'Rate limit exceeded'}})
+    assert engine.resubscribe
+    engine.on_snapshot(json.loads(md_update(1, [[999, 1]], [[1001, 1]])))
+    engine.check_snapshot(300)
+    assert engine.sequencer.summary()['snapshot_timeouts'] == 1
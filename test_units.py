@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+from mm import order_algos
+from mm.book import SortedBook, BipolarContainer
+from mm.new_approach import price_on_a_depth, bound_price_to_lower_quote, enter_ema
+from mm.units import FixedUnits, DECIMAL
+from posmath.side import Side
+
+
+class VC:
+    tick_size = Decimal('0.0001')
+
+
+def test_fixed_units_roundtrip():
+    units = FixedUnits('0.0001')
+    assert units.parse_price(1199.9999) == 11999999
+    assert units.parse_price('1200.0001') == 12000001
+    assert units.parse_size(0.1941047) == 19410470
+    assert units.to_price(11999999) == Decimal('1199.9999')
+    assert units.to_size(19410470) == Decimal('0.1941047')
+    assert units.from_price(Decimal('1199.99995')) == Decimal('11999999.5')
+    assert units.parse_price('98765432.1234') == 987654321234
+
+
+def test_fixed_units_round_off_tick():
+    units = FixedUnits('0.01')
+    assert units.parse_price('1200.001') == 120000
+    assert units.parse_price(1200.007) == 120001
+    assert units.parse_price('-0.015') == -2
+    assert units.parse_size('0.000000006') == 1
+    assert units.off_grid == 4
+    assert units.parse_price('1200.0100') == 120001
+    assert units.parse_size(1e-05) == 1000
+    assert units.off_grid == 4
+
+    quarter = FixedUnits('0.25')
+    assert quarter.parse_price('1200.75') == 4803
+    assert quarter.parse_price(1200.6) == 4802
+    assert quarter.off_grid == 1
+
+
+def fill_book(units):
+    book = SortedBook(units)
+    for price, size in [('1199.9999', '9.2702250'), ('1200.0000', '0.1941047'), ('1200.9400', '0.3393702'),
+                        ('1201.8405', '0.1700418'), ('1202.4201', '0.3193892')]:
+        book.increment_level(Side.ASK, units.parse_price(price), units.parse_size(size))
+    for price, size in [('1196.9317', '0.06'), ('1196.9316', '0.01'), ('1196.9301', '2.2102'),
+                        ('1196.7188', '5.1313376')]:
+        book.increment_level(Side.BID, units.parse_price(price), units.parse_size(size))
+    return book
+
+
+def test_fixed_pricing_matches_decimal():
+    fixed = FixedUnits('0.0001')
+    decimal_book = fill_book(DECIMAL)
+    fixed_book = fill_book(fixed)
+
+    for side in Side.sides:
+        for liq in ['0.3', '2', '10']:
+            assert price_on_a_depth(decimal_book, side, Decimal('0.06'), Decimal(liq), VC) \
+                == price_on_a_depth(fixed_book, side, Decimal('0.06'), Decimal(liq), VC)
+        for price in ['1196.8', '1196.9316', '1201', '1203']:
+            assert bound_price_to_lower_quote(decimal_book, side, Decimal(price), VC.tick_size) \
+                == bound_price_to_lower_quote(fixed_book, side, Decimal(price), VC.tick_size)
+        assert enter_ema(decimal_book, side, Decimal('1198'), Decimal('0.1'), VC) \
+            == enter_ema(fixed_book, side, Decimal('1198'), Decimal('0.1'), VC)
+
+
+class AC:
+    liq_behind = BipolarContainer(Decimal('2'), Decimal('2'))
+    ema_work_perc = Decimal('0.1')
+
+
+def test_fixed_order_algos_match_decimal():
+    fixed = FixedUnits('0.0001')
+    decimal_book = fill_book(DECIMAL)
+    fixed_book = fill_book(fixed)
+
+    for side in Side.sides:
+        assert order_algos.price_on_a_depth(decimal_book, side, Decimal('0.06'), AC, VC) \
+            == order_algos.price_on_a_depth(fixed_book, side, Decimal('0.06'), AC, VC)
+        for liq in ['0.3', '2', '10']:
+            assert order_algos.calc_price(decimal_book, side, Decimal(liq)) \
+                == order_algos.calc_price(fixed_book, side, Decimal(liq))
+            assert order_algos.calc_price_between_levels(decimal_book, side, Decimal(liq), Decimal('0.01')) \
+                == order_algos.calc_price_between_levels(fixed_book, side, Decimal(liq), Decimal('0.01'))
+        assert order_algos.enter_ema(decimal_book.quote(side), Decimal('1198'), AC, VC) \
+            == order_algos.enter_ema(fixed_book.quote(side), Decimal('1198'), AC, VC, fixed)
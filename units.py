@@ -0,0 +1,108 @@
+from decimal import Decimal
+
+
+class DecimalUnits:
+    fixed = False
+
+    def parse_price(self, value):
+        return Decimal(str(value))
+
+    def parse_size(self, value):
+        return Decimal(str(value))
+
+    def from_price(self, price):
+        return price
+
+    def from_size(self, size):
+        return size
+
+    def to_price(self, value):
+        return value
+
+    def to_size(self, value):
+        return value
+
+
+class FixedUnits:
+    SATOSHI = 100000000
+    SIZE_DIGITS = 8
+    # of a tick or a satoshi, what a float can be off by and still be on the grid
+    TOLERANCE = 0.001
+    fixed = True
+
+    def __init__(self, tick_size):
+        self.tick_size = Decimal(tick_size)
+        scale = 1 / self.tick_size
+        if scale != scale.to_integral_value():
+            raise RuntimeError('tick size ' + str(tick_size) + ' is not a fraction of 1')
+        self.price_scale = int(scale)
+        # wire prices are read in units of 10^-digits, a tick like 0.25 is `step` of those
+        self.price_digits = max(0, -self.tick_size.normalize().as_tuple().exponent)
+        self.price_step = int(self.tick_size.scaleb(self.price_digits))
+        self.off_grid = 0
+
+    def parse_price(self, value):
+        if type(value) is float:
+            # a JSON number; float error is far below a tick, Decimal(str()) cost more than the ints saved
+            scaled = value * self.price_scale
+            units = round(scaled)
+            if not -FixedUnits.TOLERANCE < scaled - units < FixedUnits.TOLERANCE:
+                self.rounded(value)
+            return units
+        units = self.scaled(str(value), self.price_digits, value)
+        if self.price_step == 1:
+            return units
+        ticks, rest = divmod(units, self.price_step)
+        if rest != 0:
+            self.rounded(value)
+            if 2 * rest >= self.price_step:
+                ticks += 1
+        return ticks
+
+    def parse_size(self, value):
+        if type(value) is float:
+            scaled = value * FixedUnits.SATOSHI
+            units = round(scaled)
+            if not -FixedUnits.TOLERANCE < scaled - units < FixedUnits.TOLERANCE:
+                self.rounded(value)
+            return units
+        return self.scaled(str(value), FixedUnits.SIZE_DIGITS, value)
+
+    def scaled(self, text, digits, value):
+        if 'e' in text or 'E' in text:
+            text = '{:f}'.format(Decimal(text))
+        whole, _, frac = text.partition('.')
+        if len(frac) <= digits:
+            return int(whole + frac + '0' * (digits - len(frac)))
+        units = int(whole + frac[:digits])
+        rest = frac[digits:]
+        if rest.strip('0') != '':
+            # off the grid, rounded half up, a bad frame must not stop market data
+            self.rounded(value)
+            if rest[0] >= '5':
+                units += -1 if whole.startswith('-') else 1
+        return units
+
+    def rounded(self, value):
+        if self.off_grid == 0:
+            print('rounding off-grid value ' + str(value))
+        self.off_grid += 1
+
+    def from_price(self, price):
+        return Decimal(price) / self.tick_size
+
+    def from_size(self, size):
+        return Decimal(size) * FixedUnits.SATOSHI
+
+    def to_price(self, value):
+        return Decimal(value) * self.tick_size
+
+    def to_size(self, value):
+        return Decimal(value) / FixedUnits.SATOSHI
+
+
+DECIMAL = DecimalUnits()
+
+
+def create_units(fixed_point, tick_size):
+    return FixedUnits(tick_size) if fixed_point else DECIMAL